@@ -0,0 +1,321 @@
+import hashlib
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import PeriodStats, ProfileAnalyticsRequest, ProfileAnalyticsResult, ProfileStats
+from .store import _load_power, get_profile_store
+from .timeaxis import nominal_step_minutes, parse_epoch_ns
+from .utils import _format_ns, _sorted_unique
+
+# Build profile indexes while uploading; when off they are built on the first analytics request.
+PROFILE_INDEX_ON_UPLOAD = os.getenv("PROFILE_INDEX_ON_UPLOAD", "1") != "0"
+
+# Calendar periods of the per-period statistics.
+ANALYTICS_PERIODS = ("day", "month")
+
+# Part of every index key; bump when the index layout changes so old bundles are rebuilt.
+_INDEX_VERSION = 1
+
+# Number of set bits of every byte value, for rank queries on packed bit vectors.
+_POPCOUNT = np.array([bin(v).count("1") for v in range(256)], dtype=np.int64)
+
+_NS_PER_HOUR = 3_600_000_000_000
+
+
+# Index of one power profile on its time axis, built once and stored as a bundle in the
+# profile store. All arrays cover the samples with a value, in time order:
+#   epoch_ns     timestamps
+#   energy_kwh   prefix sums of step energy (m + 1), so energy over [i, j) is one subtraction
+#   hours        prefix sums of step durations (m + 1); a step lasts until the next timestamp
+#   sorted_kw    values in ascending order (the duration curve read backwards)
+#   order        sample of each sorted value
+#   wm_*         wavelet matrix of the samples' ranks in sorted_kw: one packed bit vector per
+#                rank bit (wm_bits) with zero counts before every byte (wm_zeros) and in
+#                total (wm_total). The k-th smallest value of any range is found with one
+#                rank lookup per level, so minima, maxima, percentiles and duration curves
+#                of sub-ranges never read the samples themselves.
+class ProfileIndex:
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.epoch_ns = arrays["epoch_ns"]
+        self.energy_kwh = arrays["energy_kwh"]
+        self.hours = arrays["hours"]
+        self.sorted_kw = arrays["sorted_kw"]
+        self.order = arrays["order"]
+        self.wm_bits = arrays["wm_bits"]
+        self.wm_zeros = arrays["wm_zeros"]
+        self.wm_total = arrays["wm_total"]
+        self.missing = int(arrays["missing"][0])
+        self.size = self.epoch_ns.shape[0]
+
+    # Samples [i, j) with timestamps in [start_ns, end_ns).
+    def span(self, start_ns: Optional[int], end_ns: Optional[int]) -> Tuple[int, int]:
+        i = 0 if start_ns is None else int(np.searchsorted(self.epoch_ns, start_ns, side="left"))
+        j = self.size if end_ns is None else int(np.searchsorted(self.epoch_ns, end_ns, side="left"))
+        return i, max(i, j)
+
+    def energy(self, i: int, j: int) -> float:
+        return float(self.energy_kwh[j] - self.energy_kwh[i])
+
+    def duration(self, i: int, j: int) -> float:
+        return float(self.hours[j] - self.hours[i])
+
+    # Zero bits before each position of a level's bit vector.
+    def _zeros_before(self, level: int, pos: np.ndarray) -> np.ndarray:
+        byte, offset = pos >> 3, pos & 7
+        ones = _POPCOUNT[self.wm_bits[level][byte] & ((1 << offset) - 1)]
+        return self.wm_zeros[level][byte].astype(np.int64) + offset - ones
+
+    # Ranks of the k-th smallest values (0-based) of the ranges [i, j), element-wise. The
+    # whole profile reads them off directly; other ranges descend the wavelet matrix.
+    def select(self, i, j, k) -> np.ndarray:
+        i, j, k = np.broadcast_arrays(*(np.asarray(v, dtype=np.int64) for v in (i, j, k)))
+        if np.all(i == 0) and np.all(j == self.size):
+            return k.copy()
+        i, j, k = i.copy(), j.copy(), k.copy()
+        rank = np.zeros(k.shape, dtype=np.int64)
+        for level in range(self.wm_bits.shape[0]):
+            zi, zj = self._zeros_before(level, i), self._zeros_before(level, j)
+            zeros = zj - zi
+            left = k < zeros
+            rank = (rank << 1) | ~left
+            total = int(self.wm_total[level])
+            np.copyto(i, np.where(left, zi, total + i - zi))
+            np.copyto(j, np.where(left, zj, total + j - zj))
+            np.subtract(k, zeros, out=k, where=~left)
+        return rank
+
+    # Ranks of the smallest and the largest value of the non-empty range [i, j).
+    def rank_bounds(self, i: int, j: int) -> Tuple[int, int]:
+        lo, hi = self.select(i, j, [0, j - i - 1])
+        return int(lo), int(hi)
+
+
+# Wavelet matrix of a permutation of 0..m-1 (see ProfileIndex).
+def _wavelet_matrix(ranks: np.ndarray) -> Dict[str, np.ndarray]:
+    m = ranks.shape[0]
+    levels = max(1, int(m - 1).bit_length())
+    width = (m + 7) // 8 + 1
+    bits = np.zeros((levels, width), dtype=np.uint8)
+    zeros = np.zeros((levels, width), dtype=np.uint32 if m < 2 ** 32 else np.uint64)
+    total = np.zeros(levels, dtype=np.int64)
+    cur = ranks
+    for level in range(levels):
+        bit = (cur & (1 << (levels - 1 - level))) != 0
+        packed = np.packbits(bit, bitorder="little")
+        bits[level, : packed.shape[0]] = packed
+        np.cumsum(8 - _POPCOUNT[bits[level, :-1]], out=zeros[level, 1:])
+        total[level] = m - int(np.count_nonzero(bit))
+        cur = np.concatenate([cur[~bit], cur[bit]])
+    return {"wm_bits": bits, "wm_zeros": zeros, "wm_total": total}
+
+
+# Index arrays of a profile (see ProfileIndex). Timestamps are sorted and repeated ones
+# averaged first; samples without a value are left out but still end the step before them.
+def build_index(time: np.ndarray, power: np.ndarray) -> Dict[str, np.ndarray]:
+    ns, values, _ = _sorted_unique(np.asarray(time).astype("datetime64[ns]"), np.asarray(power, dtype=np.float64))
+    n = ns.shape[0]
+    dt_h = np.empty(n, dtype=np.float64)
+    if n:
+        np.divide(np.diff(ns), _NS_PER_HOUR, out=dt_h[:-1])
+        dt_h[-1] = nominal_step_minutes(ns) / 60.0
+    valid = ~np.isnan(values)
+    ns, values, dt_h = ns[valid], values[valid], dt_h[valid]
+    m = ns.shape[0]
+
+    energy = np.zeros(m + 1, dtype=np.float64)
+    np.cumsum(values * dt_h, out=energy[1:])
+    hours = np.zeros(m + 1, dtype=np.float64)
+    np.cumsum(dt_h, out=hours[1:])
+    order = np.argsort(values).astype(np.int32)
+    ranks = np.empty(m, dtype=np.int32)
+    ranks[order] = np.arange(m, dtype=np.int32)
+    return {
+        "epoch_ns": ns,
+        "energy_kwh": energy,
+        "hours": hours,
+        "sorted_kw": values[order],
+        "order": order,
+        **_wavelet_matrix(ranks),
+        "missing": np.array([n - m], dtype=np.int64),
+    }
+
+
+# Store key of the index of a profile (or of a series derived from several) on a time axis.
+def index_key(time_id: str, *power_ids: str) -> str:
+    return hashlib.sha256(":".join((str(_INDEX_VERSION), time_id) + power_ids).encode("ascii")).hexdigest()[:32]
+
+
+# A stored time axis as datetime64.
+def _load_time(time_id: str) -> np.ndarray:
+    ts = get_profile_store().get(time_id)
+    if ts.dtype.kind != "M":
+        raise ValueError(f"Profile '{time_id}' is not a time axis")
+    return ts
+
+
+# Index stored under key, built with build() and stored first when missing (evicted, or
+# for profiles stored before indexing at upload).
+def _cached_index(key: str, build) -> ProfileIndex:
+    store = get_profile_store()
+    arrays = store.get_bundle(key)
+    if arrays is None:
+        arrays = build()
+        store.put_bundle(key, arrays)
+    return ProfileIndex(arrays)
+
+
+# Index of a stored power profile on a stored time axis.
+def profile_index(time_id: str, power_id: str) -> ProfileIndex:
+    def build():
+        time, power = _load_time(time_id), _load_power(power_id)
+        if power.shape[0] != time.shape[0]:
+            raise ValueError(f"Profile '{power_id}' has {power.shape[0]} values, the time axis has {time.shape[0]}")
+        return build_index(time, power)
+
+    return _cached_index(index_key(time_id, power_id), build)
+
+
+# Index of demand minus the sum of generation profiles, built once per combination.
+def residual_index(time_id: str, demand_id: str, generation_ids: Sequence[str]) -> ProfileIndex:
+    def build():
+        time = _load_time(time_id)
+        residual = np.array(_load_power(demand_id), dtype=np.float64)
+        for power_id in generation_ids:
+            power = _load_power(power_id)
+            if power.shape[0] != residual.shape[0]:
+                raise ValueError(f"Profile '{power_id}' has {power.shape[0]} values, the demand has {residual.shape[0]}")
+            residual -= power
+        if residual.shape[0] != time.shape[0]:
+            raise ValueError(f"Profile '{demand_id}' has {residual.shape[0]} values, the time axis has {time.shape[0]}")
+        return build_index(time, residual)
+
+    return _cached_index(index_key(time_id, "residual", demand_id, *generation_ids), build)
+
+
+# Build and store the indexes of freshly uploaded profiles, so analytics never parse or
+# sort them again. profiles maps names to power arrays on `time`; profile_ids holds the
+# store IDs of 'time' and of every name.
+def index_profiles(time: np.ndarray, profiles: Dict[str, np.ndarray], profile_ids: Dict[str, str]) -> None:
+    if not PROFILE_INDEX_ON_UPLOAD:
+        return
+    store = get_profile_store()
+    for name, power in profiles.items():
+        key = index_key(profile_ids["time"], profile_ids[name])
+        if store.get_bundle(key) is None:
+            store.put_bundle(key, build_index(time, power))
+
+
+# Energy, peak and minimum of every calendar day or month touched by samples [i, j).
+def _period_stats(index: ProfileIndex, i: int, j: int, period: str) -> List[PeriodStats]:
+    unit = "datetime64[D]" if period == "day" else "datetime64[M]"
+    first = index.epoch_ns[i : i + 1].view("datetime64[ns]").astype(unit)[0]
+    last = index.epoch_ns[j - 1 : j].view("datetime64[ns]").astype(unit)[0]
+    bounds = np.arange(first, last + 2).astype("datetime64[ns]").view(np.int64)
+    edges = np.clip(np.searchsorted(index.epoch_ns, bounds, side="left"), i, j)
+    keep = np.flatnonzero(edges[:-1] < edges[1:])
+    a, b = edges[keep], edges[keep + 1]
+    lo = index.select(a, b, 0)
+    hi = index.select(a, b, b - a - 1)
+    energy = index.energy_kwh[b] - index.energy_kwh[a]
+    return [
+        PeriodStats(
+            start=_format_ns(int(bounds[p])),
+            energy_kwh=float(energy[q]),
+            peak_kw=float(index.sorted_kw[hi[q]]),
+            min_kw=float(index.sorted_kw[lo[q]]),
+        )
+        for q, p in enumerate(keep)
+    ]
+
+
+# Statistics of one indexed profile over [start_ns, end_ns).
+def profile_stats(
+    name: str,
+    index: ProfileIndex,
+    start_ns: Optional[int],
+    end_ns: Optional[int],
+    percentiles: List[float],
+    curve_points: int,
+    period: Optional[str] = None,
+    capacity_kw: Optional[float] = None,
+) -> ProfileStats:
+    i, j = index.span(start_ns, end_ns)
+    if i >= j:
+        raise ValueError(f"Profile '{name}' has no samples in the requested range")
+    m = j - i
+    energy = index.energy(i, j)
+    hours = index.duration(i, j)
+    lo, hi = index.rank_bounds(i, j)
+
+    pos = np.asarray(percentiles, dtype=np.float64) / 100.0 * (m - 1)
+    q = np.linspace(0.0, 1.0, curve_points) if curve_points > 1 else np.zeros(curve_points)
+    curve_k = np.rint((1.0 - q) * (m - 1)).astype(np.int64)
+    ks = np.concatenate([np.floor(pos), np.ceil(pos), curve_k]).astype(np.int64)
+    values = index.sorted_kw[index.select(i, j, ks)]
+    p = len(percentiles)
+    below, above = values[:p], values[p : 2 * p]
+    bands = below + (above - below) * (pos - np.floor(pos))
+
+    peak = float(index.sorted_kw[hi])
+    mean = energy / hours if hours > 0 else 0.0
+    return ProfileStats(
+        samples=m,
+        missing=index.missing,
+        start=_format_ns(int(index.epoch_ns[i])),
+        end=_format_ns(int(index.epoch_ns[j - 1])),
+        energy_kwh=energy,
+        mean_kw=mean,
+        peak_kw=peak,
+        peak_time=_format_ns(int(index.epoch_ns[index.order[hi]])),
+        min_kw=float(index.sorted_kw[lo]),
+        min_time=_format_ns(int(index.epoch_ns[index.order[lo]])),
+        load_factor=mean / peak if peak > 0 else None,
+        capacity_factor=energy / (capacity_kw * hours) if capacity_kw and hours > 0 else None,
+        percentiles={f"p{pct:g}": float(v) for pct, v in zip(percentiles, bands)},
+        duration_curve=values[2 * p :].tolist(),
+        periods=_period_stats(index, i, j, period) if period else None,
+    )
+
+
+# Analytics of stored profiles over a time range, answered from their indexes: energy from
+# prefix sums, peaks, minima, percentiles and duration curves from the order statistics.
+def profile_analytics(req: ProfileAnalyticsRequest) -> ProfileAnalyticsResult:
+    if req.period is not None and req.period not in ANALYTICS_PERIODS:
+        raise ValueError(f"Unknown period '{req.period}', expected one of {list(ANALYTICS_PERIODS)}")
+    if any(not 0.0 <= p <= 100.0 for p in req.percentiles):
+        raise ValueError("Percentiles must be between 0 and 100")
+    names = set(req.profiles) | ({"residual"} if req.residual else set())
+    unknown = sorted(set(req.capacity_kw) - names)
+    if unknown:
+        raise ValueError(f"capacity_kw names unknown profiles {unknown}")
+    start_ns = int(parse_epoch_ns([req.start])[0]) if req.start else None
+    end_ns = int(parse_epoch_ns([req.end])[0]) if req.end else None
+
+    indexes = {name: profile_index(req.time, power_id) for name, power_id in req.profiles.items()}
+    if req.residual:
+        if "residual" in req.profiles:
+            raise ValueError("A profile named 'residual' clashes with the residual load")
+        missing = sorted({req.residual.demand, *req.residual.generation} - set(req.profiles))
+        if missing:
+            raise ValueError(f"residual names unknown profiles {missing}")
+        indexes["residual"] = residual_index(
+            req.time, req.profiles[req.residual.demand], [req.profiles[name] for name in req.residual.generation]
+        )
+
+    return ProfileAnalyticsResult(
+        profiles={
+            name: profile_stats(
+                name,
+                index,
+                start_ns,
+                end_ns,
+                req.percentiles,
+                req.duration_curve_points,
+                req.period,
+                req.capacity_kw.get(name),
+            )
+            for name, index in indexes.items()
+        }
+    )
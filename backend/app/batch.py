@@ -0,0 +1,157 @@
+import asyncio
+import copy
+import itertools
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from .engine import Dispatch, Profiles, StepHours, build_profiles, build_result, summarize
+from .models import (
+    BatchSimulationRequest,
+    BatchSimulationResult,
+    BatchVariantResult,
+    SimulationConfig,
+    SimulationSummary,
+)
+from .optimal import check_dispatch_mode, run_dispatch
+from .reduction import _run_reduced_chunk, check_reducible, reduce_horizon
+from .simulator import request_time_axis
+from .store import resolve_profile_refs
+from .workers import SIM_INLINE_MAX_POINTS, max_workers, run_in_pool
+
+# Upper bound on the number of variants accepted in one batch request.
+MAX_BATCH_VARIANTS = int(os.getenv("MAX_BATCH_VARIANTS", "1000"))
+
+
+# Set a dotted path (e.g. 'battery.capacity_kwh') inside a nested config dict.
+def _set_path(data: Dict[str, Any], path: str, value: Any) -> None:
+    keys = path.split(".")
+    node = data
+    for key in keys[:-1]:
+        if node.get(key) is None:
+            node[key] = {}
+        node = node[key]
+    node[keys[-1]] = value
+
+
+# Expand the explicit variants and the cartesian sweep into a list of configurations.
+def expand_variants(req: BatchSimulationRequest) -> List[SimulationConfig]:
+    configs: List[SimulationConfig] = list(req.variants or [])
+    if req.sweep:
+        paths = list(req.sweep.keys())
+        n_combos = 1
+        for values in req.sweep.values():
+            n_combos *= len(values)
+        if len(configs) + n_combos > MAX_BATCH_VARIANTS:
+            raise ValueError(f"Batch expands to more than {MAX_BATCH_VARIANTS} variants")
+        base = req.config.model_dump()
+        for combo in itertools.product(*(req.sweep[p] for p in paths)):
+            data = copy.deepcopy(base)
+            for path, value in zip(paths, combo):
+                _set_path(data, path, value)
+            try:
+                configs.append(SimulationConfig.model_validate(data))
+            except Exception as e:
+                raise ValueError(f"Invalid sweep combination {dict(zip(paths, combo))}: {e}")
+    if not configs:
+        configs.append(req.config)
+    if len(configs) > MAX_BATCH_VARIANTS:
+        raise ValueError(f"Batch expands to more than {MAX_BATCH_VARIANTS} variants")
+    return configs
+
+
+# Simulate a chunk of variants on shared profiles. Runs inside a worker process.
+# default_dt_h applies to variants without their own step_minutes.
+def _run_chunk(
+    profiles: Profiles, default_dt_h: StepHours, configs: List[SimulationConfig], with_series: List[bool]
+) -> List[Tuple[SimulationSummary, Optional[Dispatch]]]:
+    out = []
+    for config, keep in zip(configs, with_series):
+        dt_h = config.step_minutes / 60.0 if config.step_minutes else default_dt_h
+        disp = run_dispatch(profiles, dt_h, config)
+        summary = summarize(profiles, disp, dt_h, config)
+        out.append((summary, disp if keep else None))
+    return out
+
+
+# Split items into at most n contiguous chunks of near-equal size.
+def _chunks(items: List[Any], n: int) -> List[List[Any]]:
+    size, rem = divmod(len(items), n)
+    out, start = [], 0
+    for i in range(n):
+        end = start + size + (1 if i < rem else 0)
+        if end > start:
+            out.append(items[start:end])
+        start = end
+    return out
+
+
+# Run every variant of a batch request, spreading the work across the process pool.
+# Profiles are validated and converted to arrays once; each worker receives them once per chunk.
+# Small batches (at most SIM_INLINE_MAX_POINTS timesteps over all variants) run inline.
+# The time axis follows the base config's time_mode. With req.reduction, the days are
+# clustered once and every variant is simulated on the same representative days.
+async def run_batch(req: BatchSimulationRequest) -> BatchSimulationResult:
+    req = resolve_profile_refs(req)
+    n = len(req.time)
+    if len(req.demand_kw) != n:
+        raise ValueError("Length of demand_kw must match length of time")
+    req, axis = request_time_axis(req, req.config.model_copy(update={"step_minutes": None}))
+
+    configs = expand_variants(req)
+    for config in configs:
+        check_dispatch_mode(config)
+    if req.reduction is not None:
+        if req.include_series:
+            raise ValueError("include_series is not available with reduction")
+        if not axis.regular:
+            raise ValueError("Representative-day reduction needs a regular time axis; set config.time_mode to 'uniform' or 'regularize'")
+        for config in configs:
+            check_reducible(config, axis.step_minutes)
+    for idx in req.include_series:
+        if not 0 <= idx < len(configs):
+            raise ValueError(f"include_series index {idx} out of range for {len(configs)} variants")
+    wanted = set(req.include_series)
+    with_series = [i in wanted for i in range(len(configs))]
+
+    gen = req.generation
+    profiles = build_profiles(
+        req.demand_kw,
+        pv=gen.pv if gen else None,
+        wind=gen.wind if gen else None,
+        other=gen.other if gen else None,
+    )
+
+    n_chunks = min(max_workers(), len(configs))
+    if req.reduction is not None:
+        return await _run_reduced_batch(req, profiles, axis.step_minutes, configs, n_chunks)
+    if n * len(configs) <= SIM_INLINE_MAX_POINTS:
+        outputs = _run_chunk(profiles, axis.dt_h, configs, with_series)
+    else:
+        tasks = [
+            run_in_pool(_run_chunk, profiles, axis.dt_h, cfg_chunk, flag_chunk)
+            for cfg_chunk, flag_chunk in zip(_chunks(configs, n_chunks), _chunks(with_series, n_chunks))
+        ]
+        outputs = [item for chunk in await asyncio.gather(*tasks) for item in chunk]
+
+    variants = []
+    for idx, (config, (summary, disp)) in enumerate(zip(configs, outputs)):
+        result = build_result(req.time, profiles, disp, summary) if disp is not None else None
+        variants.append(BatchVariantResult(index=idx, config=config, summary=summary, result=result))
+    return BatchSimulationResult(variants=variants)
+
+
+# Run the variants of a batch on the representative days of its horizon.
+async def _run_reduced_batch(
+    req: BatchSimulationRequest, profiles: Profiles, step_minutes: int, configs: List[SimulationConfig], n_chunks: int
+) -> BatchSimulationResult:
+    horizon = reduce_horizon(req.time, profiles, step_minutes, req.reduction)
+    if horizon.simulated_steps * len(configs) <= SIM_INLINE_MAX_POINTS:
+        outputs = _run_reduced_chunk(horizon, configs)
+    else:
+        tasks = [run_in_pool(_run_reduced_chunk, horizon, cfg_chunk) for cfg_chunk in _chunks(configs, n_chunks)]
+        outputs = [item for chunk in await asyncio.gather(*tasks) for item in chunk]
+    variants = [
+        BatchVariantResult(index=idx, config=config, summary=summary, reduction_error=error)
+        for idx, (config, (summary, error)) in enumerate(zip(configs, outputs))
+    ]
+    return BatchSimulationResult(variants=variants)
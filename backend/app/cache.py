@@ -0,0 +1,208 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Dict, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from .models import SimulationRequest
+
+# Result cache settings, configurable through the environment.
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")  # 'memory', 'disk' or 'off'
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600"))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "microgrid-results.sqlite"))
+
+
+# A serialized response body ready to be sent again.
+class CachedResponse(NamedTuple):
+    media_type: str
+    body: bytes
+
+
+# Hash a power series given inline or as a stored profile ID.
+def _update_series(h, name: str, values: Optional[Union[Sequence[float], str]]) -> None:
+    h.update(name.encode("utf-8") + b"\0")
+    if values is None:
+        h.update(b"none")
+    elif isinstance(values, str):
+        h.update(b"id:" + values.encode("utf-8"))
+    else:
+        h.update(b"arr:" + np.asarray(values, dtype=np.float64).tobytes())
+
+
+# Canonical hash of a simulation request plus the negotiated response format.
+# Arrays are hashed as float64 bytes so equal values always give the same key
+# regardless of how the numbers were written in JSON.
+def request_key(req: SimulationRequest, fmt: str) -> str:
+    h = hashlib.sha256(fmt.encode("utf-8") + b"\0")
+    if isinstance(req.time, str):
+        h.update(b"time-id:" + req.time.encode("utf-8"))
+    else:
+        h.update(b"time:" + "\x1f".join(req.time).encode("utf-8"))
+    _update_series(h, "demand_kw", req.demand_kw)
+    gen = req.generation
+    _update_series(h, "pv", gen.pv if gen else None)
+    _update_series(h, "wind", gen.wind if gen else None)
+    for name in sorted((gen.other or {}) if gen else {}):
+        _update_series(h, f"other:{name}", gen.other[name])
+    h.update(req.config.model_dump_json().encode("utf-8"))
+    h.update(req.output.model_dump_json().encode("utf-8") if req.output else b"no-output")
+    return h.hexdigest()
+
+
+# In-process LRU cache with a byte budget and a time-to-live.
+class MemoryResultCache:
+    backend = "memory"
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds > 0 and time.monotonic() - entry[0] > self.ttl_seconds:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: CachedResponse) -> None:
+        size = len(value.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic(), value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value.body)
+
+    def stats(self) -> Dict[str, Union[str, int]]:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+# SQLite-backed cache: survives restarts and is shared by every uvicorn worker on the host.
+# Hit/miss counters are per process; entries and bytes describe the shared file.
+class DiskResultCache:
+    backend = "disk"
+
+    def __init__(
+        self,
+        path: str = RESULT_CACHE_PATH,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, media_type TEXT NOT NULL, body BLOB NOT NULL,"
+                " size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT media_type, body, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds > 0 and now - row[2] > self.ttl_seconds:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return CachedResponse(row[0], bytes(row[1]))
+
+    def set(self, key: str, value: CachedResponse) -> None:
+        size = len(value.body)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, media_type, body, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value.media_type, sqlite3.Binary(value.body), size, now, now),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for old_key, old_size in conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+                if total <= self.max_bytes:
+                    break
+                if old_key == key:
+                    continue
+                conn.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                total -= old_size
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Union[str, int]]:
+        with closing(self._connect()) as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+
+_cache: Optional[Union[MemoryResultCache, DiskResultCache]] = None
+
+
+# Return the configured result cache, or None when RESULT_CACHE_BACKEND is 'off'.
+def get_result_cache() -> Optional[Union[MemoryResultCache, DiskResultCache]]:
+    global _cache
+    if _cache is None:
+        if RESULT_CACHE_BACKEND == "off":
+            return None
+        if RESULT_CACHE_BACKEND == "disk":
+            _cache = DiskResultCache()
+        elif RESULT_CACHE_BACKEND == "memory":
+            _cache = MemoryResultCache()
+        else:
+            raise ValueError(f"Unknown RESULT_CACHE_BACKEND '{RESULT_CACHE_BACKEND}'")
+    return _cache
@@ -0,0 +1,185 @@
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .engine import DISPATCH_SERIES, Dispatch, Profiles, StepHours
+from .models import OutputOptions
+from .utils import _parse_timestamps, format_timestamps
+
+# Calendar buckets understood by OutputOptions.aggregate, as datetime64 units.
+CALENDAR_BUCKETS = {"hour": "h", "day": "D", "month": "M"}
+
+# Profile fields, all in kW.
+_PROFILE_FIELDS = ("demand", "pv", "wind", "other", "renew", "net")
+
+# Power series reported with per-bucket energy, keyed by their result names.
+_ENERGY_SERIES = {
+    "demand_kw": ("profiles", "demand"),
+    "pv_kw": ("profiles", "pv"),
+    "wind_kw": ("profiles", "wind"),
+    "renewables_kw": ("profiles", "renew"),
+    **{name: ("disp", name) for name in DISPATCH_SERIES if name != "batt_soc_pct"},
+}
+
+
+# Series reduced to fewer points, plus the extra per-point values of each mode.
+@dataclass
+class ReducedSeries:
+    time: List[str]
+    profiles: Profiles
+    disp: Dispatch
+    source_index: np.ndarray
+    soc_min: Optional[np.ndarray] = None
+    soc_max: Optional[np.ndarray] = None
+    energy_kwh: Optional[Dict[str, np.ndarray]] = None
+
+
+# True when the output options ask for aggregated or downsampled series.
+def wants_reduction(options: Optional[OutputOptions]) -> bool:
+    return options is not None and (
+        options.aggregate is not None or options.aggregate_minutes is not None or options.max_points is not None
+    )
+
+
+# Apply the same per-point selection or reduction to every series.
+def _map_series(profiles: Profiles, disp: Dispatch, fn) -> Tuple[Profiles, Dispatch]:
+    new_profiles = replace(profiles, **{f: fn(getattr(profiles, f)) for f in _PROFILE_FIELDS})
+    new_disp = replace(disp, **{f: fn(getattr(disp, f)) for f in DISPATCH_SERIES})
+    return new_profiles, new_disp
+
+
+# Split timesteps into buckets of consecutive steps sharing a time bucket.
+# Returns (first index of each bucket, bucket start times).
+def _buckets(time: List[str], options: OutputOptions) -> Tuple[np.ndarray, np.ndarray]:
+    ts = _parse_timestamps(pd.Series(time, dtype="object"))
+    if options.aggregate is not None:
+        floored = ts.astype(f"datetime64[{CALENDAR_BUCKETS[options.aggregate]}]")
+        keys = floored.view(np.int64)
+    else:
+        step_ns = options.aggregate_minutes * 60_000_000_000
+        keys = ts.view(np.int64) // step_ns
+        floored = (keys * step_ns).view("datetime64[ns]")
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    return starts, floored[starts]
+
+
+# Aggregate series into time buckets. Power series become the bucket mean (kW) and their
+# bucket energy (kWh) is reported separately, so energy is preserved exactly; SOC is
+# reported as the bucket mean together with its minimum and maximum. With per-step
+# durations (dt_h an array) energies and means are weighted by them.
+def aggregate_series(time: List[str], profiles: Profiles, disp: Dispatch, dt_h: StepHours, options: OutputOptions) -> ReducedSeries:
+    if not time:
+        return ReducedSeries(time=time, profiles=profiles, disp=disp, source_index=np.arange(0), energy_kwh={})
+    starts, bucket_time = _buckets(time, options)
+
+    energy_kwh = {}
+    for name, (owner, field) in _ENERGY_SERIES.items():
+        values = getattr(profiles if owner == "profiles" else disp, field)
+        if np.ndim(dt_h):
+            energy_kwh[name] = np.add.reduceat(values * dt_h, starts)
+        else:
+            energy_kwh[name] = np.add.reduceat(values, starts) * dt_h
+
+    if np.ndim(dt_h):
+        hours = np.add.reduceat(dt_h, starts)
+        new_profiles, new_disp = _map_series(profiles, disp, lambda values: np.add.reduceat(values * dt_h, starts) / hours)
+    else:
+        counts = np.diff(np.append(starts, len(time)))
+        new_profiles, new_disp = _map_series(profiles, disp, lambda values: np.add.reduceat(values, starts) / counts)
+    return ReducedSeries(
+        time=format_timestamps(bucket_time),
+        profiles=new_profiles,
+        disp=new_disp,
+        source_index=starts,
+        soc_min=np.minimum.reduceat(disp.batt_soc_pct, starts),
+        soc_max=np.maximum.reduceat(disp.batt_soc_pct, starts),
+        energy_kwh=energy_kwh,
+    )
+
+
+# Largest-Triangle-Three-Buckets point selection shared by several series.
+# The interior is split into max_points - 2 buckets and each bucket keeps the point whose
+# triangle with the neighbouring buckets' averages has the largest area, summed over the
+# series (each scaled to its own range). Using the previous bucket's average instead of
+# its selected point lets every bucket be evaluated at once.
+def lttb_indices(series: List[np.ndarray], max_points: int) -> np.ndarray:
+    n = series[0].shape[0] if series else 0
+    if n <= max_points:
+        return np.arange(n)
+
+    buckets = max_points - 2
+    edges = 1 + (np.arange(buckets + 1, dtype=np.int64) * (n - 2)) // buckets
+    lengths = np.diff(edges)
+    width = int(lengths.max())
+    idx = edges[:-1, None] + np.arange(width)
+    valid = idx < edges[1:, None]
+    idx = np.minimum(idx, n - 1)
+
+    x = np.arange(n, dtype=np.float64)
+    x_mean = np.add.reduceat(x[:-1], edges[:-1]) / lengths
+    area = np.zeros(idx.shape)
+    for values in series:
+        y = np.asarray(values, dtype=np.float64)
+        span = float(y.max() - y.min())
+        if span == 0.0:
+            continue
+        y = (y - y.min()) / span
+        y_mean = np.add.reduceat(y[:-1], edges[:-1]) / lengths
+        # Anchors: previous bucket average (first point for bucket 0) and next bucket average
+        # (last point for the final bucket).
+        ax = np.concatenate(([0.0], x_mean[:-1]))[:, None]
+        ay = np.concatenate(([y[0]], y_mean[:-1]))[:, None]
+        cx = np.concatenate((x_mean[1:], [x[-1]]))[:, None]
+        cy = np.concatenate((y_mean[1:], [y[-1]]))[:, None]
+        area += np.abs((ax - cx) * (y[idx] - ay) - (ax - x[idx]) * (cy - ay))
+
+    area[~valid] = -1.0
+    picked = idx[np.arange(buckets), np.argmax(area, axis=1)]
+    return np.concatenate(([0], picked, [n - 1]))
+
+
+# Keep only the given points of already reduced series.
+def _select(reduced: ReducedSeries, keep: np.ndarray) -> ReducedSeries:
+    new_profiles, new_disp = _map_series(reduced.profiles, reduced.disp, lambda values: np.asarray(values)[keep])
+    return ReducedSeries(
+        time=[reduced.time[i] for i in keep.tolist()],
+        profiles=new_profiles,
+        disp=new_disp,
+        source_index=reduced.source_index[keep],
+        soc_min=reduced.soc_min[keep] if reduced.soc_min is not None else None,
+        soc_max=reduced.soc_max[keep] if reduced.soc_max is not None else None,
+        energy_kwh={name: values[keep] for name, values in reduced.energy_kwh.items()} if reduced.energy_kwh is not None else None,
+    )
+
+
+# Reduce series as requested by the output options: aggregate into buckets, then
+# downsample to max_points with LTTB if there are still too many points.
+def reduce_series(time: List[str], profiles: Profiles, disp: Dispatch, dt_h: StepHours, options: OutputOptions) -> ReducedSeries:
+    if options.aggregate is not None and options.aggregate_minutes is not None:
+        raise ValueError("Use either aggregate or aggregate_minutes, not both")
+    if options.aggregate is not None and options.aggregate not in CALENDAR_BUCKETS:
+        raise ValueError(f"Unknown aggregate '{options.aggregate}', expected one of {list(CALENDAR_BUCKETS)}")
+    if options.time_format == "start_step":
+        raise ValueError("time_format 'start_step' cannot be combined with aggregation or downsampling")
+
+    if options.aggregate is not None or options.aggregate_minutes is not None:
+        reduced = aggregate_series(time, profiles, disp, dt_h, options)
+    else:
+        reduced = ReducedSeries(time=time, profiles=profiles, disp=disp, source_index=np.arange(len(time)))
+    if options.max_points is None or len(reduced.time) <= options.max_points:
+        return reduced
+    series = [reduced.profiles.demand, reduced.profiles.pv, reduced.profiles.wind]
+    series += [getattr(reduced.disp, f) for f in DISPATCH_SERIES]
+    return _select(reduced, lttb_indices(series, options.max_points))
+
+
+# Extra SimulationResult fields describing reduced series (see encode_json).
+def reduced_fields(reduced: ReducedSeries) -> Dict[str, object]:
+    return {
+        "source_index": reduced.source_index,
+        "batt_soc_min_pct": reduced.soc_min,
+        "batt_soc_max_pct": reduced.soc_max,
+        "energy_kwh": reduced.energy_kwh,
+    }
@@ -0,0 +1,346 @@
+import json
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .engine import Dispatch, Profiles, build_result
+from .models import (
+    GenerationProfiles,
+    OutputOptions,
+    SimulationConfig,
+    SimulationRequest,
+    SimulationResult,
+    SimulationSummary,
+    TimeGap,
+)
+from .utils import format_timestamps
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency, only needed for Arrow IPC responses
+    pa = None
+
+try:
+    import orjson
+except ImportError:  # optional dependency, JSON falls back to the standard library / Pydantic
+    orjson = None
+
+# Media types understood by the /simulate content negotiation.
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_MEDIA_TYPE = "application/x-microgrid-columnar"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Media types understood by the /simulate/stream content negotiation.
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+COLUMNAR_STREAM_MEDIA_TYPE = "application/x-microgrid-columnar-stream"
+
+# Packed columnar layout:
+#   4 bytes   magic b"MGC1"
+#   4 bytes   header length (uint32, little-endian)
+#   N bytes   UTF-8 JSON header, space padded so the data section starts on an 8-byte boundary
+#   ...       column buffers in header order, little-endian, each padded to 8 bytes
+# Header offsets are relative to the start of the data section.
+COLUMNAR_MAGIC = b"MGC1"
+
+# Series echoed from the request, which clients may ask to omit.
+INPUT_SERIES = ("demand_kw", "pv_kw", "wind_kw")
+
+# All series of a SimulationResult, in response order.
+SERIES = INPUT_SERIES + (
+    "renewables_kw",
+    "batt_charge_kw",
+    "batt_discharge_kw",
+    "batt_soc_pct",
+    "generator_kw",
+    "grid_import_kw",
+    "grid_export_kw",
+    "unmet_kw",
+    "curtailed_kw",
+)
+
+_DTYPES = {"float64": "<f8", "float32": "<f4"}
+
+# Prefix of extra generation columns in a columnar request, e.g. 'other:hydro'.
+OTHER_COLUMN_PREFIX = "other:"
+_TIME_FORMATS = ("strings", "start_step")
+
+
+# Pick the response format from an Accept header: 'json', 'columnar' or 'arrow'.
+# The first supported media type wins (Arrow only when pyarrow is installed);
+# anything else falls back to JSON.
+def negotiate_format(accept: Optional[str]) -> str:
+    for part in (accept or "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type == COLUMNAR_MEDIA_TYPE:
+            return "columnar"
+        if media_type == ARROW_MEDIA_TYPE and pa is not None:
+            return "arrow"
+        if media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            return "json"
+    return "json"
+
+
+# Pick the streaming format from an Accept header: 'ndjson' (default) or 'columnar'.
+def negotiate_stream_format(accept: Optional[str]) -> str:
+    for part in (accept or "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type == COLUMNAR_STREAM_MEDIA_TYPE:
+            return "columnar"
+        if media_type == NDJSON_MEDIA_TYPE:
+            return "ndjson"
+    return "ndjson"
+
+
+# Collect the series to encode as arrays of the requested dtype.
+def _columns(profiles: Profiles, disp: Dispatch, options: OutputOptions) -> List[Tuple[str, np.ndarray]]:
+    if options.dtype not in _DTYPES:
+        raise ValueError(f"Unsupported dtype '{options.dtype}', expected one of {list(_DTYPES)}")
+    if options.time_format not in _TIME_FORMATS:
+        raise ValueError(f"Unsupported time_format '{options.time_format}', expected one of {list(_TIME_FORMATS)}")
+    source = {
+        "demand_kw": profiles.demand,
+        "pv_kw": profiles.pv,
+        "wind_kw": profiles.wind,
+        "renewables_kw": profiles.renew,
+    }
+    dtype = np.dtype(_DTYPES[options.dtype])
+    out = []
+    for name in SERIES:
+        if name in INPUT_SERIES and not options.include_inputs:
+            continue
+        values = source[name] if name in source else getattr(disp, name)
+        out.append((name, np.ascontiguousarray(values, dtype=dtype)))
+    return out
+
+
+# Describe the time axis either as per-row strings or as start + step.
+def _time_axis(time: List[str], step_minutes: int, options: OutputOptions) -> Dict:
+    if options.time_format == "start_step":
+        return {"start": time[0] if time else None, "step_minutes": step_minutes}
+    return {"values": time}
+
+
+# Pack a JSON header and column buffers into one columnar message.
+def _pack_columnar(header: Dict[str, Any], columns: List[Tuple[str, np.ndarray]]) -> bytes:
+    layout = []
+    offset = 0
+    for name, values in columns:
+        layout.append({"name": name, "offset": offset, "nbytes": values.nbytes})
+        offset += values.nbytes + (-values.nbytes % 8)
+
+    header_bytes = json.dumps({**header, "columns": layout}, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * (-(len(COLUMNAR_MAGIC) + 4 + len(header_bytes)) % 8)
+
+    parts = [COLUMNAR_MAGIC, struct.pack("<I", len(header_bytes)), header_bytes]
+    for _, values in columns:
+        parts.append(values.tobytes())
+        parts.append(b"\0" * (-values.nbytes % 8))
+    return b"".join(parts)
+
+
+# Encode a simulation as the packed columnar binary format.
+def encode_columnar(
+    time: List[str],
+    step_minutes: int,
+    profiles: Profiles,
+    disp: Dispatch,
+    summary: SimulationSummary,
+    options: Optional[OutputOptions] = None,
+) -> bytes:
+    options = options or OutputOptions()
+    columns = _columns(profiles, disp, options)
+    header = {
+        "version": 1,
+        "length": len(time),
+        "dtype": _DTYPES[options.dtype],
+        "time": _time_axis(time, step_minutes, options),
+        "summary": summary.model_dump(),
+    }
+    return _pack_columnar(header, columns)
+
+
+# Streamed responses are a sequence of records, one per chunk and a final summary:
+#   NDJSON:   one JSON object per line, {"type": "chunk", ...} or {"type": "summary", ...}
+#   columnar: each frame is a uint32 little-endian byte length followed by a columnar
+#             message whose header carries the same "type", "start" and "checkpoint" keys.
+def encode_stream_chunk(
+    fmt: str,
+    start: int,
+    time: List[str],
+    step_minutes: int,
+    profiles: Profiles,
+    disp: Dispatch,
+    checkpoint: Dict[str, Any],
+    options: Optional[OutputOptions] = None,
+) -> bytes:
+    options = options or OutputOptions()
+    columns = _columns(profiles, disp, options)
+    if fmt == "ndjson":
+        record = {
+            "type": "chunk",
+            "start": start,
+            "length": len(time),
+            "time": _time_axis(time, step_minutes, options),
+            "series": {name: values.tolist() for name, values in columns},
+            "checkpoint": checkpoint,
+        }
+        return json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+    header = {
+        "version": 1,
+        "type": "chunk",
+        "start": start,
+        "length": len(time),
+        "dtype": _DTYPES[options.dtype],
+        "time": _time_axis(time, step_minutes, options),
+        "checkpoint": checkpoint,
+    }
+    message = _pack_columnar(header, columns)
+    return struct.pack("<I", len(message)) + message
+
+
+# Final record of a streamed simulation.
+def encode_stream_summary(fmt: str, summary: SimulationSummary) -> bytes:
+    if fmt == "ndjson":
+        return json.dumps({"type": "summary", "summary": summary.model_dump()}, separators=(",", ":")).encode("utf-8") + b"\n"
+    message = _pack_columnar({"version": 1, "type": "summary", "length": 0, "summary": summary.model_dump()}, [])
+    return struct.pack("<I", len(message)) + message
+
+
+# Encode a simulation as an Arrow IPC stream. The summary and time axis travel in the schema metadata.
+def encode_arrow(
+    time: List[str],
+    step_minutes: int,
+    profiles: Profiles,
+    disp: Dispatch,
+    summary: SimulationSummary,
+    options: Optional[OutputOptions] = None,
+) -> bytes:
+    if pa is None:
+        raise RuntimeError("Arrow responses require the 'pyarrow' package")
+    options = options or OutputOptions()
+    columns = _columns(profiles, disp, options)
+
+    names = [name for name, _ in columns]
+    arrays = [pa.array(values) for _, values in columns]
+    if options.time_format == "strings":
+        names.insert(0, "time")
+        arrays.insert(0, pa.array(time, type=pa.string()))
+    metadata = {
+        "summary": json.dumps(summary.model_dump()),
+        "time": json.dumps(_time_axis(time, step_minutes, options) if options.time_format == "start_step" else {"column": "time"}),
+    }
+    batch = pa.RecordBatch.from_arrays(arrays, names=names).replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+# Parse a JSON body (orjson when installed).
+def parse_json(body: bytes) -> Any:
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+# Decode a columnar simulation request. The header carries the time axis as
+# {"start": ..., "step_minutes": ...} plus the usual 'config' and 'output' objects; the
+# columns are demand_kw, optional pv_kw and wind_kw, and 'other:<name>' series. Buffers are
+# read in place and checked in bulk (length and finite values) instead of per element.
+def decode_columnar_request(body: bytes) -> SimulationRequest:
+    if len(body) < 8 or body[:4] != COLUMNAR_MAGIC:
+        raise ValueError("Request body is not a columnar message")
+    (header_len,) = struct.unpack_from("<I", body, 4)
+    try:
+        header = json.loads(body[8:8 + header_len])
+    except ValueError as e:
+        raise ValueError(f"Invalid columnar header: {e}")
+    if not isinstance(header, dict):
+        raise ValueError("Columnar header must be a JSON object")
+    data = memoryview(body)[8 + header_len:]
+
+    n = header.get("length")
+    if not isinstance(n, int) or n < 0:
+        raise ValueError("Columnar header needs a non-negative integer 'length'")
+    dtype = header.get("dtype", _DTYPES["float64"])
+    if dtype not in _DTYPES.values():
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {list(_DTYPES.values())}")
+    itemsize = np.dtype(dtype).itemsize
+
+    if not isinstance(header.get("columns", []), list):
+        raise ValueError("Columnar header 'columns' must be a list")
+    columns: Dict[str, np.ndarray] = {}
+    for column in header.get("columns", []):
+        if not isinstance(column, dict) or not isinstance(column.get("name"), str):
+            raise ValueError("Each column must be an object with a 'name'")
+        name, offset, nbytes = column.get("name"), column.get("offset"), column.get("nbytes")
+        if not isinstance(offset, int) or offset < 0 or nbytes != n * itemsize or offset + nbytes > len(data):
+            raise ValueError(f"Column '{name}' must hold {n} values of {dtype} inside the body")
+        values = np.frombuffer(data, dtype=dtype, count=n, offset=offset)
+        if not np.isfinite(values).all():
+            raise ValueError(f"Column '{name}' contains non-finite values")
+        columns[name] = values.astype(np.float64, copy=False)
+    if "demand_kw" not in columns:
+        raise ValueError("Columnar request needs a 'demand_kw' column")
+    unknown = [name for name in columns if name not in ("demand_kw", "pv_kw", "wind_kw") and not name.startswith(OTHER_COLUMN_PREFIX)]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}")
+
+    axis = header.get("time") or {}
+    if not isinstance(axis, dict) or "start" not in axis or not isinstance(axis.get("step_minutes"), int) or axis["step_minutes"] <= 0:
+        raise ValueError("Columnar header needs 'time': {'start': ..., 'step_minutes': ...}")
+    try:
+        start = np.datetime64(str(axis["start"]).replace(" ", "T").rstrip("Z"), "s")
+    except ValueError:
+        raise ValueError(f"Invalid time start '{axis['start']}'")
+    time = format_timestamps(start + np.arange(n, dtype=np.int64) * np.timedelta64(axis["step_minutes"], "m"))
+
+    config = SimulationConfig.model_validate(header.get("config") or {})
+    if config.step_minutes is None:
+        config = config.model_copy(update={"step_minutes": axis["step_minutes"]})
+    other = {name[len(OTHER_COLUMN_PREFIX):]: values for name, values in columns.items() if name.startswith(OTHER_COLUMN_PREFIX)}
+    generation = GenerationProfiles.model_construct(pv=columns.get("pv_kw"), wind=columns.get("wind_kw"), other=other or None)
+    return SimulationRequest.model_construct(
+        time=time,
+        demand_kw=columns["demand_kw"],
+        generation=generation,
+        config=config,
+        output=OutputOptions.model_validate(header["output"]) if header.get("output") else None,
+    )
+
+
+# Encode a simulation result as JSON straight from the engine arrays. With orjson the
+# arrays are serialized natively; otherwise this goes through the SimulationResult model.
+# `extra` holds the optional SimulationResult fields (e.g. of reduced series).
+def encode_json(
+    time: List[str],
+    profiles: Profiles,
+    disp: Dispatch,
+    summary: SimulationSummary,
+    extra: Optional[Dict[str, Any]] = None,
+) -> bytes:
+    extra = extra or {}
+    if orjson is None:
+        result = build_result(time, profiles, disp, summary)
+        for name, values in extra.items():
+            if name == "gaps":
+                result.gaps = [TimeGap(**gap) for gap in values] if values is not None else None
+                continue
+            if isinstance(values, dict):
+                values = {key: np.asarray(v).tolist() for key, v in values.items()}
+            setattr(result, name, np.asarray(values).tolist() if values is not None else None)
+        return result.model_dump_json().encode("utf-8")
+    source = {
+        "demand_kw": profiles.demand,
+        "pv_kw": profiles.pv,
+        "wind_kw": profiles.wind,
+        "renewables_kw": profiles.renew,
+    }
+    content: Dict[str, Any] = {"time": time}
+    for name in SERIES:
+        values = source[name] if name in source else getattr(disp, name)
+        content[name] = np.ascontiguousarray(values, dtype=np.float64)
+    content["summary"] = summary.model_dump()
+    for name in SimulationResult.model_fields:
+        if name not in content:
+            content[name] = extra.get(name)
+    return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
@@ -0,0 +1,498 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .models import (
+    BatteryConfig,
+    GeneratorConfig,
+    GridConfig,
+    SimulationConfig,
+    SimulationRequest,
+    SimulationResult,
+    SimulationSummary,
+)
+
+# Unmet power above this threshold counts as a loss-of-load step.
+LOLP_THRESHOLD_KW = 1e-6
+
+# Timestep in hours: one float for a regular time axis, or the duration of every step.
+StepHours = Union[float, np.ndarray]
+
+
+# Input profiles as float64 arrays aligned to the demand length.
+@dataclass
+class Profiles:
+    demand: np.ndarray
+    pv: np.ndarray
+    wind: np.ndarray
+    other: np.ndarray
+    renew: np.ndarray
+    net: np.ndarray  # positive = surplus
+
+
+# Per-timestep dispatch decided by the engine (kW, SOC in %).
+@dataclass
+class Dispatch:
+    batt_charge_kw: np.ndarray
+    batt_discharge_kw: np.ndarray
+    batt_soc_pct: np.ndarray
+    generator_kw: np.ndarray
+    grid_import_kw: np.ndarray
+    grid_export_kw: np.ndarray
+    unmet_kw: np.ndarray
+    curtailed_kw: np.ndarray
+    battery_kwh_end: Optional[float] = None  # stored energy after the last step
+
+
+# Names of the per-timestep series held by a Dispatch.
+DISPATCH_SERIES = (
+    "batt_charge_kw",
+    "batt_discharge_kw",
+    "batt_soc_pct",
+    "generator_kw",
+    "grid_import_kw",
+    "grid_export_kw",
+    "unmet_kw",
+    "curtailed_kw",
+)
+
+
+# Running sums (kW summed over steps) that the summary is computed from.
+# Lets a simulation advance chunk by chunk and be checkpointed between chunks.
+# Sums weighted by per-step durations hold kWh and hours instead (see summarize).
+@dataclass
+class Totals:
+    steps: float = 0
+    lolp_steps: float = 0
+    demand: float = 0.0
+    pv: float = 0.0
+    wind: float = 0.0
+    renew: float = 0.0
+    batt_charge: float = 0.0
+    batt_discharge: float = 0.0
+    generator: float = 0.0
+    grid_import: float = 0.0
+    grid_export: float = 0.0
+    unmet: float = 0.0
+    curtailed: float = 0.0
+
+    def add(self, profiles: "Profiles", disp: Dispatch, weights: Optional[np.ndarray] = None) -> None:
+        if weights is not None:
+            self._add_weighted(profiles, disp, weights)
+            return
+        self.steps += int(profiles.demand.shape[0])
+        self.lolp_steps += int(np.count_nonzero(disp.unmet_kw > LOLP_THRESHOLD_KW))
+        self.demand += float(profiles.demand.sum())
+        self.pv += float(profiles.pv.sum())
+        self.wind += float(profiles.wind.sum())
+        self.renew += float(profiles.renew.sum())
+        self.batt_charge += float(disp.batt_charge_kw.sum())
+        self.batt_discharge += float(disp.batt_discharge_kw.sum())
+        self.generator += float(disp.generator_kw.sum())
+        self.grid_import += float(disp.grid_import_kw.sum())
+        self.grid_export += float(disp.grid_export_kw.sum())
+        self.unmet += float(disp.unmet_kw.sum())
+        self.curtailed += float(disp.curtailed_kw.sum())
+
+    def _add_weighted(self, profiles: "Profiles", disp: Dispatch, weights: np.ndarray) -> None:
+        self.steps += float(weights.sum())
+        self.lolp_steps += float(weights[disp.unmet_kw > LOLP_THRESHOLD_KW].sum())
+        self.demand += float(profiles.demand @ weights)
+        self.pv += float(profiles.pv @ weights)
+        self.wind += float(profiles.wind @ weights)
+        self.renew += float(profiles.renew @ weights)
+        self.batt_charge += float(disp.batt_charge_kw @ weights)
+        self.batt_discharge += float(disp.batt_discharge_kw @ weights)
+        self.generator += float(disp.generator_kw @ weights)
+        self.grid_import += float(disp.grid_import_kw @ weights)
+        self.grid_export += float(disp.grid_export_kw @ weights)
+        self.unmet += float(disp.unmet_kw @ weights)
+        self.curtailed += float(disp.curtailed_kw @ weights)
+
+
+# State carried between chunks of a long simulation.
+@dataclass
+class SimulationState:
+    next_index: int = 0
+    battery_kwh: Optional[float] = None
+    totals: Totals = field(default_factory=Totals)
+
+
+# Convert an optional profile into a float64 array of length n (zero padded or truncated).
+def _as_profile(values: Optional[Sequence[float]], n: int) -> np.ndarray:
+    out = np.zeros(n, dtype=np.float64)
+    if values is None or len(values) == 0:
+        return out
+    arr = np.asarray(values, dtype=np.float64)
+    m = min(n, arr.shape[0])
+    out[:m] = arr[:m]
+    return out
+
+
+# Build aligned profile arrays from raw demand and generation series.
+def build_profiles(
+    demand_kw: Sequence[float],
+    pv: Optional[Sequence[float]] = None,
+    wind: Optional[Sequence[float]] = None,
+    other: Optional[Dict[str, Sequence[float]]] = None,
+) -> Profiles:
+    demand = np.asarray(demand_kw, dtype=np.float64)
+    n = demand.shape[0]
+    pv_arr = _as_profile(pv, n)
+    wind_arr = _as_profile(wind, n)
+    other_arr = np.zeros(n, dtype=np.float64)
+    for arr in (other or {}).values():
+        other_arr += _as_profile(arr, n)
+    renew = pv_arr + wind_arr + other_arr
+    return Profiles(
+        demand=demand,
+        pv=pv_arr,
+        wind=wind_arr,
+        other=other_arr,
+        renew=renew,
+        net=renew - demand,
+    )
+
+
+# Build aligned profile arrays from a simulation request.
+def profiles_from_request(req: SimulationRequest) -> Profiles:
+    gen = req.generation
+    return build_profiles(
+        req.demand_kw,
+        pv=gen.pv if gen else None,
+        wind=gen.wind if gen else None,
+        other=gen.other if gen else None,
+    )
+
+
+# Sequential state-of-charge recursion. Returns (charge_kw, discharge_kw, soc_kwh) per step.
+# Only the sign of net matters for whether the battery charges or discharges, so
+# this is the one part of the simulation that cannot be expressed as array operations.
+# kwh overrides the initial stored energy (used when continuing from a previous chunk).
+# dt_h may hold one duration per step for an irregular time axis.
+def battery_kernel(
+    net: np.ndarray, dt_h: StepHours, batt: BatteryConfig, kwh: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if np.ndim(dt_h):
+        return _battery_kernel_steps(net, dt_h, batt, kwh)
+    n = net.shape[0]
+    if kwh is None:
+        kwh = batt.capacity_kwh * (batt.soc_init_pct / 100.0)
+    min_kwh = batt.capacity_kwh * (batt.soc_min_pct / 100.0)
+    max_kwh = batt.capacity_kwh * (batt.soc_max_pct / 100.0)
+    eff_ch = batt.charge_efficiency
+    eff_dis = batt.discharge_efficiency if batt.discharge_efficiency > 0 else 1.0
+    p_ch_max = batt.charge_power_kw
+    p_dis_max = batt.discharge_power_kw
+    eff_dis_lim = batt.discharge_efficiency
+    ch_den = eff_ch * dt_h
+
+    # Plain Python floats and lists with inlined min() keep the per-step cost to a few bytecodes.
+    net_l = net.tolist()
+    ch_l = [0.0] * n
+    dis_l = [0.0] * n
+    soc_l = [0.0] * n
+    can_charge = ch_den > 0
+    can_discharge = dt_h > 0
+    for i, x in enumerate(net_l):
+        if x > 0.0:
+            room = max_kwh - kwh
+            if can_charge and room > 0.0:
+                p = x if x < p_ch_max else p_ch_max
+                p_lim = room / ch_den
+                if p_lim < p:
+                    p = p_lim
+                if p > 0.0:
+                    ch_l[i] = p
+                    kwh += p * dt_h * eff_ch
+            if kwh > max_kwh:
+                kwh = max_kwh
+        elif x < 0.0:
+            avail = kwh - min_kwh
+            if can_discharge and avail > 0.0:
+                p = -x if -x < p_dis_max else p_dis_max
+                p_lim = (avail * eff_dis_lim) / dt_h
+                if p_lim < p:
+                    p = p_lim
+                if p > 0.0:
+                    dis_l[i] = p
+                    kwh -= p * dt_h / eff_dis
+            if kwh < min_kwh:
+                kwh = min_kwh
+        soc_l[i] = kwh
+
+    return (
+        np.array(ch_l, dtype=np.float64),
+        np.array(dis_l, dtype=np.float64),
+        np.array(soc_l, dtype=np.float64),
+    )
+
+
+# battery_kernel with a duration per step. Kept separate so the regular axis keeps its
+# loop-invariant limits; the branches are the same with dt taken from the step.
+def _battery_kernel_steps(
+    net: np.ndarray, dt_h: np.ndarray, batt: BatteryConfig, kwh: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    n = net.shape[0]
+    if kwh is None:
+        kwh = batt.capacity_kwh * (batt.soc_init_pct / 100.0)
+    min_kwh = batt.capacity_kwh * (batt.soc_min_pct / 100.0)
+    max_kwh = batt.capacity_kwh * (batt.soc_max_pct / 100.0)
+    eff_ch = batt.charge_efficiency
+    eff_dis = batt.discharge_efficiency if batt.discharge_efficiency > 0 else 1.0
+    p_ch_max = batt.charge_power_kw
+    p_dis_max = batt.discharge_power_kw
+    eff_dis_lim = batt.discharge_efficiency
+
+    ch_l = [0.0] * n
+    dis_l = [0.0] * n
+    soc_l = [0.0] * n
+    for i, (x, dt) in enumerate(zip(net.tolist(), dt_h.tolist())):
+        if x > 0.0:
+            room = max_kwh - kwh
+            if eff_ch > 0.0 and room > 0.0:
+                p = x if x < p_ch_max else p_ch_max
+                p_lim = room / (eff_ch * dt)
+                if p_lim < p:
+                    p = p_lim
+                if p > 0.0:
+                    ch_l[i] = p
+                    kwh += p * dt * eff_ch
+            if kwh > max_kwh:
+                kwh = max_kwh
+        elif x < 0.0:
+            avail = kwh - min_kwh
+            if avail > 0.0:
+                p = -x if -x < p_dis_max else p_dis_max
+                p_lim = (avail * eff_dis_lim) / dt
+                if p_lim < p:
+                    p = p_lim
+                if p > 0.0:
+                    dis_l[i] = p
+                    kwh -= p * dt / eff_dis
+            if kwh < min_kwh:
+                kwh = min_kwh
+        soc_l[i] = kwh
+
+    return (
+        np.array(ch_l, dtype=np.float64),
+        np.array(dis_l, dtype=np.float64),
+        np.array(soc_l, dtype=np.float64),
+    )
+
+
+# battery_kernel for many scenarios at once: net is n x scenarios and every step advances
+# the state of charge of all scenarios with a few array operations. Per scenario the
+# result is identical to battery_kernel. kwh overrides the initial stored energy.
+def battery_kernel_scenarios(
+    net: np.ndarray, dt_h: float, batt: BatteryConfig, kwh: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if kwh is None:
+        kwh = batt.capacity_kwh * (batt.soc_init_pct / 100.0)
+    min_kwh = batt.capacity_kwh * (batt.soc_min_pct / 100.0)
+    max_kwh = batt.capacity_kwh * (batt.soc_max_pct / 100.0)
+    eff_ch = batt.charge_efficiency
+    eff_dis = batt.discharge_efficiency if batt.discharge_efficiency > 0 else 1.0
+    ch_den = eff_ch * dt_h
+
+    surplus = np.minimum(np.maximum(net, 0.0), batt.charge_power_kw)
+    deficit = np.minimum(np.maximum(-net, 0.0), batt.discharge_power_kw)
+    charging = net > 0.0
+    discharging = net < 0.0
+    kwh = np.full(net.shape[1], kwh, dtype=np.float64)
+    ch = np.zeros_like(net)
+    dis = np.zeros_like(net)
+    soc = np.zeros_like(net)
+    # In-place ufuncs on preallocated rows: each step costs a fixed number of array calls.
+    tmp = np.empty_like(kwh)
+    for i in range(net.shape[0]):
+        c, d = ch[i], dis[i]
+        np.subtract(max_kwh, kwh, out=tmp)
+        np.maximum(tmp, 0.0, out=tmp)
+        tmp /= ch_den
+        np.minimum(surplus[i], tmp, out=c)
+        np.subtract(kwh, min_kwh, out=tmp)
+        np.maximum(tmp, 0.0, out=tmp)
+        tmp *= batt.discharge_efficiency
+        tmp /= dt_h
+        np.minimum(deficit[i], tmp, out=d)
+        np.multiply(c, dt_h, out=tmp)
+        tmp *= eff_ch
+        kwh += tmp
+        np.multiply(d, dt_h, out=tmp)
+        tmp /= eff_dis
+        kwh -= tmp
+        np.minimum(kwh, max_kwh, out=kwh, where=charging[i])
+        np.maximum(kwh, min_kwh, out=kwh, where=discharging[i])
+        soc[i] = kwh
+    return ch, dis, soc
+
+
+# Vectorized grid import for a need array (kW).
+def _grid_import(need: np.ndarray, grid: Optional[GridConfig]) -> np.ndarray:
+    if not grid or not grid.allow_import:
+        return np.zeros_like(need)
+    p_imp = need if grid.import_limit_kw is None else np.minimum(need, grid.import_limit_kw)
+    return np.where(need > 0.0, p_imp, 0.0)
+
+
+# Split excess power into (export_kw, curtailed_kw) given grid export settings.
+def _export_or_curtail(excess: np.ndarray, grid: Optional[GridConfig]) -> Tuple[np.ndarray, np.ndarray]:
+    if not grid or not grid.allow_export:
+        return np.zeros_like(excess), excess
+    p_exp = excess if grid.export_limit_kw is None else np.minimum(excess, grid.export_limit_kw)
+    return p_exp, excess - p_exp
+
+
+# Vectorized generator dispatch for a need array. Returns (p_gen, p_export, p_curtail).
+def _generator(need: np.ndarray, gen_cfg: Optional[GeneratorConfig], grid: Optional[GridConfig]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if not gen_cfg or not gen_cfg.enabled or gen_cfg.max_power_kw <= 0:
+        zeros = np.zeros_like(need)
+        return zeros, zeros, zeros
+    min_load = gen_cfg.min_loading_pct * gen_cfg.max_power_kw
+    p_gen = np.minimum(need, gen_cfg.max_power_kw)
+    p_gen = np.where((p_gen > 0.0) & (p_gen < min_load), min_load, p_gen)
+    p_gen = np.where(need > 0.0, p_gen, 0.0)
+    excess = np.maximum(p_gen - need, 0.0)
+    p_exp, p_cur = _export_or_curtail(excess, grid)
+    return p_gen, p_exp, p_cur
+
+
+# Decide the dispatch for every timestep. Only the battery needs a sequential pass;
+# generator, grid and curtailment are resolved with array operations afterwards.
+# battery_kwh continues from a previous chunk instead of the configured initial SOC.
+# Profiles may also be n x scenarios arrays (see battery_kernel_scenarios); battery_kwh_end
+# is then left unset.
+def dispatch(profiles: Profiles, dt_h: StepHours, config: SimulationConfig, battery_kwh: Optional[float] = None) -> Dispatch:
+    n = profiles.net.shape[0]
+    grid = config.grid
+    gen_cfg = config.generator
+    batt_cfg = config.battery
+
+    battery_kwh_end = None
+    if batt_cfg:
+        if profiles.net.ndim == 1:
+            batt_charge_kw, batt_discharge_kw, soc_kwh = battery_kernel(profiles.net, dt_h, batt_cfg, battery_kwh)
+            battery_kwh_end = float(soc_kwh[-1]) if n else battery_kwh
+        else:
+            batt_charge_kw, batt_discharge_kw, soc_kwh = battery_kernel_scenarios(profiles.net, dt_h, batt_cfg, battery_kwh)
+        if batt_cfg.capacity_kwh > 0:
+            batt_soc_pct = np.clip(100.0 * (soc_kwh / batt_cfg.capacity_kwh), 0.0, 100.0)
+        else:
+            batt_soc_pct = np.zeros_like(profiles.net)
+    else:
+        batt_charge_kw = np.zeros_like(profiles.net)
+        batt_discharge_kw = np.zeros_like(profiles.net)
+        batt_soc_pct = np.zeros_like(profiles.net)
+
+    # Surplus after charging goes to export, then curtailment
+    surplus = np.maximum(profiles.net, 0.0) - batt_charge_kw
+    surplus_exp, surplus_cur = _export_or_curtail(surplus, grid)
+
+    # Deficit after discharging goes to grid/generator in priority order
+    deficit = np.maximum(-profiles.net, 0.0) - batt_discharge_kw
+    if grid and grid.priority == "before_gen":
+        grid_import_kw = _grid_import(deficit, grid)
+        deficit = deficit - grid_import_kw
+        generator_kw, gen_exp, gen_cur = _generator(deficit, gen_cfg, grid)
+        deficit = deficit - np.minimum(deficit, generator_kw)
+    else:
+        generator_kw, gen_exp, gen_cur = _generator(deficit, gen_cfg, grid)
+        deficit = deficit - np.minimum(deficit, generator_kw)
+        grid_import_kw = _grid_import(deficit, grid)
+        deficit = deficit - grid_import_kw
+
+    return Dispatch(
+        batt_charge_kw=batt_charge_kw,
+        batt_discharge_kw=batt_discharge_kw,
+        batt_soc_pct=batt_soc_pct,
+        generator_kw=generator_kw,
+        grid_import_kw=grid_import_kw,
+        grid_export_kw=surplus_exp + gen_exp,
+        unmet_kw=np.maximum(deficit, 0.0),
+        curtailed_kw=surplus_cur + gen_cur,
+        battery_kwh_end=battery_kwh_end,
+    )
+
+
+# Turn running totals into energy, cost and emission metrics.
+def summary_from_totals(totals: Totals, dt_h: float, config: SimulationConfig) -> SimulationSummary:
+    grid = config.grid
+    gen_cfg = config.generator
+    batt_cfg = config.battery
+
+    charge_eff = batt_cfg.charge_efficiency if batt_cfg else 0.0
+    total_grid_imp_kwh = totals.grid_import * dt_h
+    total_grid_exp_kwh = totals.grid_export * dt_h
+    total_gen_kwh = totals.generator * dt_h
+
+    cost_import = total_grid_imp_kwh * (grid.import_tariff_per_kwh if grid else 0.0)
+    revenue_export = total_grid_exp_kwh * (grid.export_tariff_per_kwh if grid else 0.0)
+    cost_generator = total_gen_kwh * (gen_cfg.variable_cost_per_kwh if gen_cfg else 0.0)
+    total_co2_kg = total_gen_kwh * (gen_cfg.co2_kg_per_kwh if gen_cfg else 0.0)
+    lolp_pct = 100.0 * (totals.lolp_steps / totals.steps) if totals.steps > 0 else 0.0
+
+    return SimulationSummary(
+        total_demand_kwh=totals.demand * dt_h,
+        total_pv_kwh=totals.pv * dt_h,
+        total_wind_kwh=totals.wind * dt_h,
+        total_renewables_kwh=totals.renew * dt_h,
+        total_battery_charge_kwh=totals.batt_charge * dt_h * charge_eff,
+        total_battery_discharge_kwh=totals.batt_discharge * dt_h,
+        total_generator_kwh=total_gen_kwh,
+        total_grid_import_kwh=total_grid_imp_kwh,
+        total_grid_export_kwh=total_grid_exp_kwh,
+        total_unmet_kwh=totals.unmet * dt_h,
+        total_curtailed_kwh=totals.curtailed * dt_h,
+        lolp_pct=lolp_pct,
+        cost_import=cost_import,
+        revenue_export=revenue_export,
+        cost_generator=cost_generator,
+        total_cost=cost_import - revenue_export + cost_generator,
+        total_co2_kg=total_co2_kg,
+    )
+
+
+# Compute energy, cost and emission totals from a dispatch. With per-step durations the
+# sums are weighted by them directly (kWh, and LOLP as a share of time).
+def summarize(profiles: Profiles, disp: Dispatch, dt_h: StepHours, config: SimulationConfig) -> SimulationSummary:
+    totals = Totals()
+    if np.ndim(dt_h):
+        totals.add(profiles, disp, dt_h)
+        return summary_from_totals(totals, 1.0, config)
+    totals.add(profiles, disp)
+    return summary_from_totals(totals, dt_h, config)
+
+
+# Simulate the next chunk of steps, updating the state in place. Per-step durations
+# must be those of this chunk.
+def advance(state: SimulationState, profiles: Profiles, dt_h: StepHours, config: SimulationConfig) -> Dispatch:
+    disp = dispatch(profiles, dt_h, config, state.battery_kwh)
+    state.battery_kwh = disp.battery_kwh_end
+    state.totals.add(profiles, disp, dt_h if np.ndim(dt_h) else None)
+    state.next_index += int(profiles.demand.shape[0])
+    return disp
+
+
+# Assemble a SimulationResult from engine arrays.
+def build_result(time: List[str], profiles: Profiles, disp: Dispatch, summary: SimulationSummary) -> SimulationResult:
+    return SimulationResult(
+        time=time,
+        demand_kw=profiles.demand.tolist(),
+        pv_kw=profiles.pv.tolist(),
+        wind_kw=profiles.wind.tolist(),
+        renewables_kw=profiles.renew.tolist(),
+        batt_charge_kw=disp.batt_charge_kw.tolist(),
+        batt_discharge_kw=disp.batt_discharge_kw.tolist(),
+        batt_soc_pct=disp.batt_soc_pct.tolist(),
+        generator_kw=disp.generator_kw.tolist(),
+        grid_import_kw=disp.grid_import_kw.tolist(),
+        grid_export_kw=disp.grid_export_kw.tolist(),
+        unmet_kw=disp.unmet_kw.tolist(),
+        curtailed_kw=disp.curtailed_kw.tolist(),
+        summary=summary,
+    )
+
@@ -0,0 +1,203 @@
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import numpy as np
+
+from .cache import CachedResponse, get_result_cache
+from .models import JobStatus, SimulationRequest
+from .render import encode_simulation
+from .simulator import simulate_arrays_chunked
+from .store import resolve_profile_refs
+from .workers import PoolBusy, run_in_pool
+
+# Job settings, configurable through the environment.
+JOB_MAX_ACTIVE = int(os.getenv("JOB_MAX_ACTIVE", "100"))  # queued + running jobs per API process
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))  # how long finished jobs and results are kept
+JOB_STATE_DIR = os.getenv("JOB_STATE_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+
+# A job reports progress about this many times; chunks are never smaller than _MIN_CHUNK steps.
+_PROGRESS_UPDATES = 100
+_MIN_CHUNK = 10_000
+
+# How long a job waits before retrying when the process pool is full.
+_POOL_RETRY_SECONDS = 0.25
+
+# Slots of the shared job state file (float64 each).
+_PROGRESS, _CANCEL, _STARTED = 0, 1, 2
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# Raised when JOB_MAX_ACTIVE jobs are already queued or running.
+class JobQueueFull(Exception):
+    pass
+
+
+# Progress, cancel flag and start time shared between the API process and the pool
+# worker through a small memory-mapped file (no manager process needed).
+def _open_state(path: str) -> np.memmap:
+    return np.memmap(path, dtype=np.float64, mode="r+", shape=(3,))
+
+
+# Pool entry point of a job: simulate in chunks, publishing progress and stopping
+# between chunks once the job is cancelled.
+def _simulation_job(req: SimulationRequest, fmt: str, state_path: str) -> CachedResponse:
+    state = _open_state(state_path)
+    state[_STARTED] = time.time()
+    if state[_CANCEL]:
+        raise JobCancelled()
+
+    def progress(done: int, total: int) -> None:
+        state[_PROGRESS] = done / total if total else 1.0
+        if state[_CANCEL]:
+            raise JobCancelled()
+
+    req = resolve_profile_refs(req)
+    chunk_size = max(_MIN_CHUNK, -(-len(req.time) // _PROGRESS_UPDATES))
+    time_values, profiles, disp, summary, axis = simulate_arrays_chunked(req, chunk_size, progress)
+    return encode_simulation(req, fmt, time_values, profiles, disp, summary, axis)
+
+
+def _utc(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+# A simulation submitted through the job API.
+class Job:
+    def __init__(self, fmt: str, cache_key: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.fmt = fmt
+        self.cache_key = cache_key
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.result: Optional[CachedResponse] = None
+        self.task: Optional[asyncio.Task] = None
+        self.final_progress = 0.0
+        self.final_started = 0.0
+        fd, self.state_path = tempfile.mkstemp(dir=JOB_STATE_DIR, prefix="microgrid-job-", suffix=".state")
+        with os.fdopen(fd, "wb") as f:
+            f.write(bytes(3 * 8))
+        self.state: Optional[np.memmap] = _open_state(self.state_path)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        if not self.active:
+            return
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self.release_state()
+
+    def release_state(self) -> None:
+        if self.state is None:
+            return
+        self.final_progress = float(self.state[_PROGRESS])
+        self.final_started = float(self.state[_STARTED])
+        self.state = None
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
+
+    def snapshot(self) -> JobStatus:
+        if self.state is not None:
+            progress, started = float(self.state[_PROGRESS]), float(self.state[_STARTED])
+            if self.status == "queued" and started > 0:
+                self.status = "running"
+        else:
+            progress, started = self.final_progress, self.final_started
+        if self.status == "succeeded":
+            progress = 1.0
+        return JobStatus(
+            job_id=self.id,
+            status=self.status,
+            progress=min(max(progress, 0.0), 1.0),
+            created_at=_utc(self.created_at),
+            started_at=_utc(started) if started > 0 else None,
+            finished_at=_utc(self.finished_at) if self.finished_at else None,
+            error=self.error,
+            result_media_type=self.result.media_type if self.result else None,
+        )
+
+
+# In-process registry of jobs. Jobs share the simulation process pool with /simulate;
+# a job whose turn comes while the pool is full waits instead of being rejected.
+class JobManager:
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+
+    def submit(self, req: SimulationRequest, fmt: str, cache_key: Optional[str] = None) -> Job:
+        self._expire()
+        if sum(1 for job in self.jobs.values() if job.active) >= JOB_MAX_ACTIVE:
+            raise JobQueueFull(f"{JOB_MAX_ACTIVE} jobs are already queued or running, retry later")
+        job = Job(fmt, cache_key)
+        self.jobs[job.id] = job
+        job.task = asyncio.get_running_loop().create_task(self._run(job, req))
+        return job
+
+    async def _run(self, job: Job, req: SimulationRequest) -> None:
+        try:
+            while True:
+                try:
+                    result = await run_in_pool(_simulation_job, req, job.fmt, job.state_path)
+                    break
+                except PoolBusy:
+                    await asyncio.sleep(_POOL_RETRY_SECONDS)
+            cache = get_result_cache()
+            if cache and job.cache_key:
+                cache.set(job.cache_key, result)
+            if job.active:
+                job.result = result
+                job.finish("succeeded")
+        except (JobCancelled, asyncio.CancelledError):
+            job.finish("cancelled")
+        except Exception as e:
+            job.finish("failed", str(e))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        return self.jobs.get(job_id)
+
+    # Cancel a job: queued jobs never start, running jobs stop after their current chunk.
+    # The task of a running job is left to finish, so its pool slot stays taken until the
+    # worker has actually stopped.
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return job
+        started = False
+        if job.state is not None:
+            job.state[_CANCEL] = 1.0
+            started = job.state[_STARTED] > 0
+        job.finish("cancelled")
+        if job.task is not None and not started:
+            job.task.cancel()
+        return job
+
+    def _expire(self) -> None:
+        now = time.time()
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and now - j.finished_at > JOB_TTL_SECONDS]:
+            del self.jobs[job_id]
+
+
+_manager: Optional[JobManager] = None
+
+
+# Return the process-wide job manager, created on first use.
+def get_job_manager() -> JobManager:
+    global _manager
+    if _manager is None:
+        _manager = JobManager()
+    return _manager
@@ -0,0 +1,313 @@
+import bisect
+import contextvars
+import functools
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Opt-in sampling profiler: when enabled, a request sent with 'X-Profile: 1' is sampled
+# every PROFILING_INTERVAL_SECONDS and its collapsed stacks are written to PROFILING_DIR.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+PROFILING_INTERVAL_SECONDS = float(os.getenv("PROFILING_INTERVAL_SECONDS", "0.005"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "microgrid-request-profiles"))
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(float(4 ** k * 256) for k in range(12))  # 256 B .. 1 GiB
+LENGTH_BUCKETS = tuple(float(10 ** k) for k in range(1, 8))  # 10 .. 10M points
+
+
+# Prometheus histogram with labels, kept in process memory.
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # labels -> bucket counts + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Sequence[str], value: float) -> None:
+        key = tuple(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._series.get(key)
+            if counts is None:
+                counts = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(counts)) for key, counts in self._series.items())
+        for key, counts in series:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key))
+            prefix = labels + "," if labels else ""
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{_format_value(bound)}"}} {_format_value(cumulative)}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {_format_value(counts[-1])}')
+            lines.append(f"{self.name}_sum{{{labels}}} {_format_value(counts[-2])}")
+            lines.append(f"{self.name}_count{{{labels}}} {_format_value(counts[-1])}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REQUEST_SECONDS = Histogram(
+    "microgrid_request_duration_seconds", "Total time spent handling a request", ("route", "method", "status"), LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram("microgrid_stage_duration_seconds", "Time spent in each stage of a request", ("route", "stage"), LATENCY_BUCKETS)
+PAYLOAD_BYTES = Histogram("microgrid_payload_bytes", "Request and response body sizes", ("route", "direction"), BYTES_BUCKETS)
+SERIES_LENGTH = Histogram("microgrid_series_length", "Number of timesteps in the series a request handled", ("route",), LENGTH_BUCKETS)
+
+HISTOGRAMS = (REQUEST_SECONDS, STAGE_SECONDS, PAYLOAD_BYTES, SERIES_LENGTH)
+
+
+# Render every histogram in the Prometheus text exposition format.
+def render_metrics() -> str:
+    lines: List[str] = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+# Timings and sizes collected while one request is handled.
+# Stage durations with the same name are summed (e.g. per-chunk work of a streamed response).
+class RequestMetrics:
+    def __init__(self, route: str):
+        self.route = route
+        self.stages: Dict[str, float] = {}
+        self.series_length: Optional[int] = None
+        self.marks: Dict[str, float] = {"start": time.perf_counter()}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    # Value for a Server-Timing response header.
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.stages.items())
+
+
+_current: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar("request_metrics", default=None)
+
+
+# Metrics of the request being handled, if any. Capture this before handing work
+# to a generator or thread that may run outside the request's context.
+def current_request_metrics() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+# Time a named stage of the current request (no-op outside a request).
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.stage(name):
+        yield
+
+
+# Record how many timesteps the current request handled.
+def observe_series_length(n: int) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.series_length = n
+
+
+# Run fn(*args) with its own stage recorder, e.g. inside a pool worker, and return
+# (result, stage timings). 'pool_wait' is the time between submitted_at (time.time()
+# in the caller) and the start of the call. Merge the stages with add_stages().
+def run_with_stages(fn, submitted_at: float, *args):
+    metrics = RequestMetrics("worker")
+    metrics.add("pool_wait", max(0.0, time.time() - submitted_at))
+    token = _current.set(metrics)
+    try:
+        return fn(*args), metrics.stages
+    finally:
+        _current.reset(token)
+
+
+# Add stage timings recorded elsewhere (see run_with_stages) to the current request.
+def add_stages(stages: Dict[str, float]) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        for name, seconds in stages.items():
+            metrics.add(name, seconds)
+
+
+# Decorator for route endpoints: records the 'validate' stage (end of the request body
+# to the start of the endpoint) and marks where response serialization begins.
+def instrumented(endpoint):
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        metrics = _current.get()
+        if metrics is None:
+            return await endpoint(*args, **kwargs)
+        start = time.perf_counter()
+        metrics.add("validate", start - metrics.marks.get("body", metrics.marks["start"]))
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            metrics.marks["handler_end"] = time.perf_counter()
+
+    return wrapper
+
+
+# Samples the stacks of every thread at a fixed interval and counts collapsed stacks
+# ('thread;module:function;...'), the input format of common flame graph tools.
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILING_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    # Write the collapsed stacks to PROFILING_DIR and return the file path.
+    def write(self, route: str) -> str:
+        os.makedirs(PROFILING_DIR, exist_ok=True)
+        slug = route.strip("/").replace("/", "_") or "root"
+        path = os.path.join(PROFILING_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{slug}-{uuid.uuid4().hex[:8]}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+_profiling_lock = threading.Lock()
+
+
+# Route label of a request: the template of the matched route (e.g. '/api/v1/jobs/{job_id}'),
+# so path parameters do not create new series; 'unmatched' when no route matched.
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or "unmatched"
+
+
+# ASGI middleware recording request latency, payload sizes, series length and per-stage
+# timings for every request, and adding a Server-Timing header to each response.
+# Stages seen by every request:
+#   receive   - reading the request body (including multipart spooling for uploads)
+#   validate  - from the end of the body to the endpoint (JSON decoding, Pydantic validation)
+#   serialize - from the endpoint's return to the response start (response_model encoding)
+#   send      - writing the response body (covers the work of streamed responses)
+# Endpoints decorated with @instrumented add their own stages in between.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = RequestMetrics("unmatched")
+        token = _current.set(metrics)
+        marks = metrics.marks
+        sizes = {"request": 0, "response": 0}
+        status = {"code": 500}
+
+        profiler = None
+        headers = dict(scope.get("headers") or [])
+        if PROFILING_ENABLED and headers.get(b"x-profile") == b"1" and _profiling_lock.acquire(blocking=False):
+            profiler = SamplingProfiler()
+            profiler.start()
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    marks.setdefault("body", time.perf_counter())
+            return message
+
+        async def send_wrapper(message):
+            nonlocal profiler
+            if message["type"] == "http.response.start":
+                now = time.perf_counter()
+                marks["response"] = now
+                metrics.route = _route_label(scope)
+                if "handler_end" in marks:
+                    metrics.add("serialize", now - marks["handler_end"])
+                status["code"] = message["status"]
+                extra = [(b"server-timing", metrics.server_timing().encode("latin-1"))]
+                if profiler is not None:
+                    profiler.stop()
+                    extra.append((b"x-profile-file", profiler.write(metrics.route).encode("utf-8")))
+                    profiler = None
+                    _profiling_lock.release()
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            if profiler is not None:
+                profiler.stop()
+                _profiling_lock.release()
+            _current.reset(token)
+            route = _route_label(scope)
+            if "body" in marks:
+                metrics.add("receive", marks["body"] - marks["start"])
+            if "response" in marks:
+                metrics.add("send", end - marks["response"])
+            for name, seconds in metrics.stages.items():
+                STAGE_SECONDS.observe((route, name), seconds)
+            REQUEST_SECONDS.observe((route, scope["method"], str(status["code"])), end - marks["start"])
+            PAYLOAD_BYTES.observe((route, "request"), sizes["request"])
+            PAYLOAD_BYTES.observe((route, "response"), sizes["response"])
+            if metrics.series_length is not None:
+                SERIES_LENGTH.observe((route,), metrics.series_length)
@@ -1,24 +1,58 @@
+from datetime import datetime
+
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict, Union
 
 
 class PowerProfileData(BaseModel):
     """Basic time-power profile used by the CSV upload endpoint."""
     time: List[str]
     power: List[float]
+    profile_ids: Optional[Dict[str, str]] = Field(None, description="Stored profile IDs for 'time' and 'power'")
+
+
+class TimeGap(BaseModel):
+    """A stretch of a profile with no samples."""
+    start: str
+    end: str
+    missing_steps: int
+
+
+class ProfileAlignment(BaseModel):
+    """How a single uploaded profile mapped onto the common time index."""
+    start: str
+    end: str
+    samples: int
+    native_step_minutes: float
+    duplicates: int = Field(..., description="Repeated timestamps in the file (values were averaged)")
+    gap_count: int
+    gaps: List[TimeGap] = Field(..., description="Largest gaps in the file, at most 100")
+    missing_points: int = Field(..., description="Points of the common index without any source sample (filled)")
+
+
+class AlignmentReport(BaseModel):
+    """Alignment summary for a multiple-file upload."""
+    step_minutes: int
+    method: str
+    overlap_start: Optional[str] = Field(None, description="Start of the range covered by every profile")
+    overlap_end: Optional[str] = Field(None, description="End of the range covered by every profile")
+    profiles: Dict[str, ProfileAlignment]
 
 
 class MultipleProfilesData(BaseModel):
     """Multiple power profiles from multiple CSV files."""
     time: List[str]
     profiles: Dict[str, List[float]] = Field(..., description="Dictionary mapping profile name to power data")
+    alignment: Optional[AlignmentReport] = None
+    profile_ids: Optional[Dict[str, str]] = Field(None, description="Stored profile IDs for 'time' and each profile name")
 
 
 class GenerationProfiles(BaseModel):
-    """Optional generation profiles as direct power (kW) time series aligned with demand."""
-    pv: Optional[List[float]] = None
-    wind: Optional[List[float]] = None
-    other: Optional[Dict[str, List[float]]] = None
+    """Optional generation profiles as direct power (kW) time series aligned with demand.
+    Each series may also be given as a stored profile ID returned by the upload endpoints."""
+    pv: Optional[Union[List[float], str]] = None
+    wind: Optional[Union[List[float], str]] = None
+    other: Optional[Dict[str, Union[List[float], str]]] = None
 
 # Configuration for battery system in the microgrid.
 class BatteryConfig(BaseModel):
@@ -50,19 +84,54 @@ class GridConfig(BaseModel):
     export_limit_kw: Optional[float] = Field(None, ge=0.0)
     priority: str = Field("after_gen", description="Order to use grid import relative to generator: 'before_gen' or 'after_gen'")
 
+# Settings of the rolling-horizon optimal dispatch (SimulationConfig.dispatch_mode 'optimal').
+class OptimalDispatchConfig(BaseModel):
+    horizon_hours: float = Field(48.0, gt=0, description="Look-ahead of each optimization window")
+    commit_hours: float = Field(24.0, gt=0, description="Leading part of each window that is kept before the window moves on")
+    unmet_penalty_per_kwh: float = Field(1000.0, ge=0.0, description="Cost of unserved energy (value of lost load)")
+    time_limit_seconds: Optional[float] = Field(None, gt=0, description="Solver time limit per window")
+
 # Simulation configuration including all components.
 class SimulationConfig(BaseModel):
     battery: Optional[BatteryConfig] = None
     generator: Optional[GeneratorConfig] = None
     grid: Optional[GridConfig] = GridConfig()
     step_minutes: Optional[int] = Field(None, gt=0, description="Timestep in minutes; if None it will be inferred from time array")
+    time_mode: str = Field("auto", description="Irregular time axes: 'auto' (each step lasts until the next timestamp), 'uniform' (every step lasts the nominal step) or 'regularize' (interpolate onto the nominal step first)")
+    engine: str = Field("numpy", description="Simulation engine: 'numpy' (vectorized) or 'loop' (reference per-timestep loop)")
+    dispatch_mode: str = Field("greedy", description="'greedy' (battery first, then generator/grid by priority) or 'optimal' (rolling-horizon linear program, requires scipy)")
+    optimal: Optional[OptimalDispatchConfig] = Field(None, description="Settings of the optimal dispatch; defaults when omitted")
+
+# Output options for columnar (binary) simulation responses.
+class OutputOptions(BaseModel):
+    include_inputs: bool = Field(True, description="Include the echoed demand_kw, pv_kw and wind_kw series")
+    time_format: str = Field("strings", description="'strings' (one timestamp per row) or 'start_step' (first timestamp plus step_minutes)")
+    dtype: str = Field("float64", description="Element type of the packed series: 'float64' or 'float32'")
+    aggregate: Optional[str] = Field(None, description="Aggregate series into calendar buckets: 'hour', 'day' or 'month'")
+    aggregate_minutes: Optional[int] = Field(None, gt=0, description="Aggregate series into fixed buckets of this many minutes")
+    max_points: Optional[int] = Field(None, ge=3, description="Downsample series to at most this many points with LTTB")
 
 # Request model for simulation endpoint.
+# time and demand_kw may be stored profile IDs instead of inline arrays.
 class SimulationRequest(BaseModel):
-    time: List[str]
-    demand_kw: List[float]
+    time: Union[List[str], str]
+    demand_kw: Union[List[float], str]
     generation: Optional[GenerationProfiles] = None
     config: SimulationConfig
+    output: Optional[OutputOptions] = Field(None, description="Response options: binary layout (see Accept header negotiation), aggregation and downsampling")
+
+# Engine state after a streamed chunk; pass it back as resume_from to continue a run.
+class SimulationCheckpoint(BaseModel):
+    request_key: str = Field(..., description="Hash of the request this checkpoint belongs to")
+    next_index: int = Field(..., ge=0, description="First timestep not yet simulated")
+    battery_kwh: Optional[float] = Field(None, description="Energy stored in the battery at next_index")
+    lolp_steps: int = Field(0, ge=0)
+    totals: Dict[str, float] = Field(default_factory=dict, description="Running kW sums over the simulated steps")
+
+# Request model for the streaming simulation endpoint.
+class SimulationStreamRequest(SimulationRequest):
+    chunk_size: int = Field(10_000, gt=0, le=1_000_000, description="Timesteps per streamed chunk")
+    resume_from: Optional[SimulationCheckpoint] = None
 
 # Result model for simulation endpoint.
 class SimulationSummary(BaseModel):
@@ -99,4 +168,319 @@ class SimulationResult(BaseModel):
     grid_export_kw: List[float]
     unmet_kw: List[float]
     curtailed_kw: List[float]
-    summary: SimulationSummary
\ No newline at end of file
+    summary: SimulationSummary
+    source_index: Optional[List[int]] = Field(None, description="Timestep each aggregated or downsampled point starts at")
+    batt_soc_min_pct: Optional[List[float]] = Field(None, description="Lowest SOC within each aggregation bucket")
+    batt_soc_max_pct: Optional[List[float]] = Field(None, description="Highest SOC within each aggregation bucket")
+    energy_kwh: Optional[Dict[str, List[float]]] = Field(None, description="Energy per aggregation bucket for each power series")
+    gap_count: Optional[int] = Field(None, description="Gaps in an irregular time axis (steps longer than 1.5x the nominal step)")
+    gaps: Optional[List[TimeGap]] = Field(None, description="Largest gaps in an irregular time axis, at most 100")
+
+# Representative-day reduction of a simulation horizon. Days are consecutive 24 h blocks
+# from the first timestamp; they are clustered by their demand and generation shapes and
+# only one real day per cluster is simulated.
+class ReductionConfig(BaseModel):
+    representative_days: int = Field(12, gt=0, description="Number of clusters k")
+    include_extreme_day: bool = Field(True, description="Keep the day with the highest net load as a representative of its own")
+    battery_state: str = Field("cyclic", description="'cyclic': each representative day is simulated twice and measured on the second pass; 'chained': representative days run back to back in calendar order, carrying the state of charge")
+    validation_every_days: Optional[int] = Field(60, gt=0, description="Simulate one validation window every this many days at full resolution; None disables the error estimate")
+    validation_days: int = Field(1, gt=0, description="Days per validation window, after one warm-up day")
+    seed: int = Field(0, ge=0, description="Seed of the k-means initialization")
+
+# A representative day and the number of days it stands for.
+class RepresentativeDay(BaseModel):
+    start: str
+    weight: float = Field(..., description="Days represented (a trailing partial day counts as a fraction)")
+
+# Reduced versus full-resolution results on the validation days.
+class ReductionError(BaseModel):
+    days: int = Field(..., description="Validation days compared")
+    actual: SimulationSummary = Field(..., description="Full-resolution simulation of the validation days")
+    estimated: SimulationSummary = Field(..., description="The same days as estimated from their representative days")
+    relative_error: Dict[str, Optional[float]] = Field(..., description="|estimated - actual| / |actual| per metric; None where the actual value is zero and the estimate is not")
+    max_relative_error: Optional[float] = None
+
+# Request model for batch simulation endpoint: one set of profiles, many configurations.
+class BatchSimulationRequest(BaseModel):
+    time: Union[List[str], str]
+    demand_kw: Union[List[float], str]
+    generation: Optional[GenerationProfiles] = None
+    config: SimulationConfig = Field(default_factory=SimulationConfig, description="Base configuration that sweep values are applied to")
+    variants: Optional[List[SimulationConfig]] = Field(None, description="Explicit list of configurations to simulate")
+    sweep: Optional[Dict[str, List[Any]]] = Field(
+        None,
+        description="Cartesian grid over dotted config paths applied to 'config', e.g. {'battery.capacity_kwh': [100, 200]}",
+    )
+    include_series: List[int] = Field(default_factory=list, description="Indices of variants that should return full time series")
+    reduction: Optional[ReductionConfig] = Field(None, description="Screen every variant on representative days instead of the full horizon")
+
+# Result of a single variant in a batch simulation.
+class BatchVariantResult(BaseModel):
+    index: int
+    config: SimulationConfig
+    summary: SimulationSummary
+    result: Optional[SimulationResult] = None
+    reduction_error: Optional[ReductionError] = Field(None, description="Error estimate of a reduced variant on the validation days")
+
+# Result model for batch simulation endpoint.
+class BatchSimulationResult(BaseModel):
+    variants: List[BatchVariantResult]
+
+# Request model for battery sizing optimizer: searches capacity x power for minimum cost.
+class BatterySizingRequest(BaseModel):
+    time: Union[List[str], str]
+    demand_kw: Union[List[float], str]
+    generation: Optional[GenerationProfiles] = None
+    config: SimulationConfig = Field(
+        default_factory=SimulationConfig,
+        description="Base configuration; non-sizing battery parameters are taken from config.battery when present",
+    )
+    capacities_kwh: List[float] = Field(..., min_length=1, description="Candidate battery capacities")
+    powers_kw: List[float] = Field(..., min_length=1, description="Candidate charge/discharge power ratings")
+    max_lolp_pct: Optional[float] = Field(None, ge=0.0, le=100.0)
+    max_unmet_kwh: Optional[float] = Field(None, ge=0.0)
+    capacity_cost_per_kwh: float = Field(0.0, ge=0.0, description="Battery cost per kWh of capacity over the simulated horizon")
+    power_cost_per_kw: float = Field(0.0, ge=0.0, description="Battery cost per kW of power rating over the simulated horizon")
+    max_evaluations: int = Field(300, gt=0, le=5000, description="Upper bound on the number of simulations run by the search")
+
+# A single evaluated point of the battery sizing search.
+class SizingCandidate(BaseModel):
+    capacity_kwh: float
+    power_kw: float
+    total_cost: float
+    objective: float
+    lolp_pct: float
+    total_unmet_kwh: float
+    feasible: bool
+
+# Result model for battery sizing optimizer.
+class BatterySizingResult(BaseModel):
+    best: Optional[SizingCandidate] = None
+    best_battery: Optional[BatteryConfig] = None
+    best_summary: Optional[SimulationSummary] = None
+    frontier: List[SizingCandidate] = Field(..., description="Smallest feasible capacity found for each power rating")
+    explored: List[SizingCandidate] = Field(..., description="Every candidate that was simulated")
+    evaluations: int
+    grid_size: int
+    exhaustive: bool = Field(..., description="False when max_evaluations stopped the search before every power row was searched or pruned")
+
+# How Monte Carlo scenarios are derived from the input profiles. Steps are applied in
+# order: block bootstrap of whole days, per-scenario scaling, per-step noise.
+class ScenarioPerturbation(BaseModel):
+    bootstrap_block_days: Optional[int] = Field(None, gt=0, description="Resample the profiles in blocks of this many whole days")
+    demand_scale_pct: float = Field(0.0, ge=0.0, description="Std. dev. of a per-scenario demand scaling factor, in %")
+    renewables_scale_pct: float = Field(0.0, ge=0.0, description="Std. dev. of per-scenario PV, wind and other generation scaling factors, in %")
+    demand_noise_pct: float = Field(0.0, ge=0.0, description="Std. dev. of independent per-step demand noise, in % of the value")
+    renewables_noise_pct: float = Field(0.0, ge=0.0, description="Std. dev. of independent per-step generation noise, in % of the value")
+
+# Request model for Monte Carlo reliability studies over perturbed profiles.
+class MonteCarloRequest(BaseModel):
+    time: Union[List[str], str]
+    demand_kw: Union[List[float], str]
+    generation: Optional[GenerationProfiles] = None
+    config: SimulationConfig = Field(default_factory=SimulationConfig)
+    scenarios: int = Field(100, gt=0, description="Number of scenarios K")
+    seed: int = Field(0, ge=0, description="Scenarios are reproducible for a given seed")
+    perturbation: ScenarioPerturbation = Field(default_factory=ScenarioPerturbation)
+    percentiles: List[float] = Field([5.0, 50.0, 95.0], min_length=1, description="Percentiles reported for every metric")
+    include_samples: bool = Field(False, description="Also return the summary of every scenario")
+
+# Distribution of one summary metric over the Monte Carlo scenarios.
+class MetricDistribution(BaseModel):
+    mean: float
+    std: float
+    min: float
+    max: float
+    percentiles: Dict[str, float] = Field(..., description="Values by percentile, keyed like 'p5'")
+
+# Result model for Monte Carlo endpoint.
+class MonteCarloResult(BaseModel):
+    scenarios: int
+    seed: int
+    baseline: SimulationSummary = Field(..., description="Summary of the unperturbed profiles")
+    metrics: Dict[str, MetricDistribution] = Field(..., description="Distribution of every SimulationSummary field")
+    samples: Optional[List[SimulationSummary]] = None
+
+# Prices and emission factors for re-pricing a dispatch. Each may be a single value or a
+# per-timestep series (inline or a stored profile ID); omitted values keep the ones the
+# dispatch was simulated with.
+class TariffSet(BaseModel):
+    name: Optional[str] = None
+    import_tariff_per_kwh: Optional[Union[float, List[float], str]] = None
+    export_tariff_per_kwh: Optional[Union[float, List[float], str]] = None
+    variable_cost_per_kwh: Optional[Union[float, List[float], str]] = Field(None, description="Generator cost")
+    co2_kg_per_kwh: Optional[Union[float, List[float], str]] = Field(None, description="Generator emission factor")
+
+# Request model for re-pricing: a simulation (run once, then cached) or the dispatch_id
+# returned by a previous call, plus the tariff sets to evaluate.
+class RepriceRequest(BaseModel):
+    simulation: Optional[SimulationRequest] = None
+    dispatch_id: Optional[str] = None
+    tariffs: List[TariffSet] = Field(..., min_length=1)
+
+# Cost and emission totals of one tariff set.
+class RepricedSummary(BaseModel):
+    name: Optional[str] = None
+    cost_import: float
+    revenue_export: float
+    cost_generator: float
+    total_cost: float
+    total_co2_kg: float
+
+# Result model for re-pricing endpoint.
+class RepriceResult(BaseModel):
+    dispatch_id: Optional[str] = Field(None, description="Send instead of the simulation to re-price the same dispatch again (needs the result cache)")
+    steps: int
+    results: List[RepricedSummary]
+
+# Status of a background simulation job.
+class JobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="'queued', 'running', 'succeeded', 'failed' or 'cancelled'")
+    progress: float = Field(..., ge=0.0, le=1.0, description="Fraction of timesteps simulated")
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    result_media_type: Optional[str] = Field(None, description="Media type of the result once the job has succeeded")
+
+
+# Electrical bus of a network simulation. Buses joined by closed switches form one
+# island in which power is shared freely.
+class NetworkBus(BaseModel):
+    id: str
+
+# Switch between two buses; open switches separate them.
+class NetworkSwitch(BaseModel):
+    id: str
+    bus_a: str
+    bus_b: str
+    closed: bool = True
+
+# Load connected to a bus. demand_kw may be a stored profile ID.
+class NetworkLoad(BaseModel):
+    id: str
+    bus: str
+    demand_kw: Union[List[float], str]
+
+# Non-dispatchable generation (PV, wind, ...) connected to a bus. power_kw may be a stored profile ID.
+class NetworkSource(BaseModel):
+    id: str
+    bus: str
+    kind: str = Field("other", description="'pv', 'wind' or 'other'; selects the summary total it counts towards")
+    power_kw: Union[List[float], str]
+
+# Battery connected to a bus.
+class NetworkBattery(BatteryConfig):
+    id: str
+    bus: str
+
+# Dispatchable generator connected to a bus.
+class NetworkGenerator(GeneratorConfig):
+    id: str
+    bus: str
+
+# Grid connection point at a bus.
+class NetworkGrid(GridConfig):
+    id: str
+    bus: str
+
+# Request model for network simulation: any number of components on buses joined by switches.
+class NetworkSimulationRequest(BaseModel):
+    time: Union[List[str], str]
+    buses: List[NetworkBus] = Field(..., min_length=1)
+    switches: List[NetworkSwitch] = Field(default_factory=list)
+    loads: List[NetworkLoad] = Field(default_factory=list)
+    sources: List[NetworkSource] = Field(default_factory=list)
+    batteries: List[NetworkBattery] = Field(default_factory=list)
+    generators: List[NetworkGenerator] = Field(default_factory=list)
+    grids: List[NetworkGrid] = Field(default_factory=list)
+    step_minutes: Optional[int] = Field(None, gt=0, description="Timestep in minutes; if None it will be inferred from time array")
+    include_series: bool = Field(True, description="Return per-component time series, not only energy totals")
+
+# Result of one network component: energy totals and, optionally, its series.
+class NetworkComponentResult(BaseModel):
+    id: str
+    bus: str
+    island: int
+    energy_kwh: Dict[str, float]
+    series: Optional[Dict[str, List[float]]] = None
+
+# Result of one island: its buses, summary and, optionally, its balance series.
+class NetworkIslandResult(BaseModel):
+    index: int
+    buses: List[str]
+    summary: SimulationSummary
+    series: Optional[Dict[str, List[float]]] = None
+
+# Result model for network simulation endpoint.
+class NetworkSimulationResult(BaseModel):
+    time: List[str]
+    summary: SimulationSummary
+    islands: List[NetworkIslandResult]
+    batteries: List[NetworkComponentResult]
+    generators: List[NetworkComponentResult]
+    grids: List[NetworkComponentResult]
+
+# Residual load of a profile analytics request: demand minus the sum of generation profiles.
+class ResidualLoad(BaseModel):
+    demand: str = Field(..., description="Name of the demand profile in the request's profiles")
+    generation: List[str] = Field(..., min_length=1, description="Names of the generation profiles subtracted from it")
+
+# Request model for profile analytics over stored profiles (IDs returned by the upload endpoints).
+class ProfileAnalyticsRequest(BaseModel):
+    time: str = Field(..., description="Stored time axis ID")
+    profiles: Dict[str, str] = Field(..., min_length=1, description="Profile name to stored power profile ID")
+    start: Optional[str] = Field(None, description="Start of the analysed range (inclusive); default the first sample")
+    end: Optional[str] = Field(None, description="End of the analysed range (exclusive); default after the last sample")
+    percentiles: List[float] = Field([50.0, 90.0, 95.0, 99.0], description="Percentiles of the power values")
+    duration_curve_points: int = Field(101, ge=0, le=2000, description="Points of the duration curve, evenly spaced from 0% to 100% of the samples")
+    period: Optional[str] = Field(None, description="'day' or 'month' for per-period energy, peak and minimum")
+    capacity_kw: Dict[str, float] = Field(default_factory=dict, description="Rated capacity by profile name, for capacity factors")
+    residual: Optional[ResidualLoad] = Field(None, description="Also analyse demand minus generation, reported as 'residual'")
+
+# Energy, peak and minimum of one calendar period of a profile.
+class PeriodStats(BaseModel):
+    start: str
+    energy_kwh: float
+    peak_kw: float
+    min_kw: float
+
+# Analytics of one profile over the requested range.
+class ProfileStats(BaseModel):
+    samples: int
+    missing: int = Field(..., description="Samples without a value (NaN) in the whole profile, left out of every statistic")
+    start: str
+    end: str
+    energy_kwh: float
+    mean_kw: float = Field(..., description="Time-weighted mean power")
+    peak_kw: float
+    peak_time: str
+    min_kw: float
+    min_time: str
+    load_factor: Optional[float] = Field(None, description="Mean power over peak power")
+    capacity_factor: Optional[float] = Field(None, description="Energy over rated capacity x hours (needs capacity_kw)")
+    percentiles: Dict[str, float] = Field(..., description="Values by percentile, keyed like 'p95'")
+    duration_curve: List[float] = Field(..., description="Power sorted from highest to lowest, sampled at duration_curve_points")
+    periods: Optional[List[PeriodStats]] = None
+
+# Result model for profile analytics endpoint.
+class ProfileAnalyticsResult(BaseModel):
+    profiles: Dict[str, ProfileStats]
+
+# Request model for a representative-day (reduced horizon) simulation.
+class ReducedSimulationRequest(BaseModel):
+    time: Union[List[str], str]
+    demand_kw: Union[List[float], str]
+    generation: Optional[GenerationProfiles] = None
+    config: SimulationConfig = Field(default_factory=SimulationConfig)
+    reduction: ReductionConfig = Field(default_factory=ReductionConfig)
+
+# Result model for reduced simulation endpoint.
+class ReducedSimulationResult(BaseModel):
+    summary: SimulationSummary = Field(..., description="Full-horizon summary scaled from the representative days")
+    representative_days: List[RepresentativeDay]
+    day_clusters: List[int] = Field(..., description="Index into representative_days of every day of the horizon")
+    error: Optional[ReductionError] = None
+    simulated_steps: int = Field(..., description="Timesteps simulated, representative days and validation windows together")
+    full_steps: int
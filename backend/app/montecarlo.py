@@ -0,0 +1,178 @@
+import asyncio
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from .batch import _chunks
+from .engine import LOLP_THRESHOLD_KW, Profiles, Totals, build_profiles, dispatch, summarize, summary_from_totals
+from .models import (
+    MetricDistribution,
+    MonteCarloRequest,
+    MonteCarloResult,
+    ScenarioPerturbation,
+    SimulationConfig,
+    SimulationSummary,
+)
+from .simulator import _infer_step_minutes
+from .store import resolve_profile_refs
+from .workers import SIM_INLINE_MAX_POINTS, max_workers, run_in_pool
+
+# Upper bound on the number of scenarios accepted in one request.
+MAX_MONTE_CARLO_SCENARIOS = int(os.getenv("MAX_MONTE_CARLO_SCENARIOS", "10000"))
+
+# Timesteps x scenarios simulated together; bounds the size of each n x K array a worker holds.
+MONTE_CARLO_BATCH_CELLS = int(os.getenv("MONTE_CARLO_BATCH_CELLS", "2000000"))
+
+_SERIES = ("demand", "pv", "wind", "other")
+
+
+# Random generator of one scenario. Depends only on the seed and the scenario index,
+# so results do not change with the batch size or the number of workers.
+def _scenario_rng(seed: int, k: int) -> np.random.Generator:
+    return np.random.default_rng([seed, k])
+
+
+# Step indices of a block bootstrap: random runs of block_days whole days, joined until n steps.
+def _bootstrap_index(rng: np.random.Generator, n: int, steps_per_day: int, block_days: int) -> np.ndarray:
+    block = block_days * steps_per_day
+    days = n // steps_per_day
+    starts = rng.integers(0, days - block_days + 1, size=-(-n // block)) * steps_per_day
+    return (starts[:, None] + np.arange(block)).ravel()[:n]
+
+
+# Perturbed profiles of scenarios [start, stop) as n x scenarios arrays.
+def scenario_profiles(
+    base: Profiles, pert: ScenarioPerturbation, seed: int, start: int, stop: int, steps_per_day: int
+) -> Profiles:
+    n = base.demand.shape[0]
+    series = {name: np.empty((n, stop - start)) for name in _SERIES}
+    for j, k in enumerate(range(start, stop)):
+        rng = _scenario_rng(seed, k)
+        index = _bootstrap_index(rng, n, steps_per_day, pert.bootstrap_block_days) if pert.bootstrap_block_days else None
+        for name in _SERIES:
+            values = getattr(base, name)
+            if index is not None:
+                values = values[index]
+            scale_pct = pert.demand_scale_pct if name == "demand" else pert.renewables_scale_pct
+            noise_pct = pert.demand_noise_pct if name == "demand" else pert.renewables_noise_pct
+            if scale_pct > 0:
+                values = values * max(0.0, 1.0 + rng.normal(0.0, scale_pct / 100.0))
+            if noise_pct > 0:
+                values = values * np.maximum(1.0 + rng.normal(0.0, noise_pct / 100.0, n), 0.0)
+            series[name][:, j] = values
+    renew = series["pv"] + series["wind"] + series["other"]
+    return Profiles(**series, renew=renew, net=renew - series["demand"])
+
+
+# Summaries of scenarios [start, stop), simulated batch_size scenarios at a time along a
+# scenario axis (the battery recursion advances every scenario of a batch per step).
+# Runs inside a worker process.
+def _run_scenarios(
+    base: Profiles,
+    pert: ScenarioPerturbation,
+    config: SimulationConfig,
+    dt_h: float,
+    steps_per_day: int,
+    seed: int,
+    start: int,
+    stop: int,
+    batch_size: int,
+) -> List[SimulationSummary]:
+    out = []
+    for lo in range(start, stop, batch_size):
+        hi = min(lo + batch_size, stop)
+        profiles = scenario_profiles(base, pert, seed, lo, hi, steps_per_day)
+        disp = dispatch(profiles, dt_h, config)
+        sums = {
+            "demand": profiles.demand.sum(axis=0),
+            "pv": profiles.pv.sum(axis=0),
+            "wind": profiles.wind.sum(axis=0),
+            "renew": profiles.renew.sum(axis=0),
+            "batt_charge": disp.batt_charge_kw.sum(axis=0),
+            "batt_discharge": disp.batt_discharge_kw.sum(axis=0),
+            "generator": disp.generator_kw.sum(axis=0),
+            "grid_import": disp.grid_import_kw.sum(axis=0),
+            "grid_export": disp.grid_export_kw.sum(axis=0),
+            "unmet": disp.unmet_kw.sum(axis=0),
+            "curtailed": disp.curtailed_kw.sum(axis=0),
+        }
+        lolp_steps = np.count_nonzero(disp.unmet_kw > LOLP_THRESHOLD_KW, axis=0)
+        steps = profiles.demand.shape[0]
+        for j in range(hi - lo):
+            totals = Totals(steps=steps, lolp_steps=int(lolp_steps[j]), **{name: float(v[j]) for name, v in sums.items()})
+            out.append(summary_from_totals(totals, dt_h, config))
+    return out
+
+
+# Summary of the unperturbed profiles. Runs inside a worker process for long inputs.
+def _baseline(base: Profiles, config: SimulationConfig, dt_h: float) -> SimulationSummary:
+    return summarize(base, dispatch(base, dt_h, config), dt_h, config)
+
+
+# Mean, spread and percentiles of every summary metric over the scenarios.
+def metric_distributions(summaries: List[SimulationSummary], percentiles: List[float]) -> Dict[str, MetricDistribution]:
+    names = list(SimulationSummary.model_fields)
+    values = np.array([[getattr(s, name) for name in names] for s in summaries], dtype=np.float64)
+    bands = np.percentile(values, percentiles, axis=0)
+    out = {}
+    for i, name in enumerate(names):
+        column = values[:, i]
+        out[name] = MetricDistribution(
+            mean=float(column.mean()),
+            std=float(column.std()),
+            min=float(column.min()),
+            max=float(column.max()),
+            percentiles={f"p{p:g}": float(bands[j, i]) for j, p in enumerate(percentiles)},
+        )
+    return out
+
+
+# Run a Monte Carlo study: K perturbed scenarios of the input profiles, spread across the
+# process pool and simulated in memory-bounded batches on the vectorized engine. Studies of
+# at most SIM_INLINE_MAX_POINTS timesteps (baseline included) run inline.
+async def run_montecarlo(req: MonteCarloRequest) -> MonteCarloResult:
+    req = resolve_profile_refs(req)
+    n = len(req.time)
+    if len(req.demand_kw) != n:
+        raise ValueError("Length of demand_kw must match length of time")
+    if req.scenarios > MAX_MONTE_CARLO_SCENARIOS:
+        raise ValueError(f"At most {MAX_MONTE_CARLO_SCENARIOS} scenarios are allowed")
+    if any(not 0.0 <= p <= 100.0 for p in req.percentiles):
+        raise ValueError("Percentiles must be between 0 and 100")
+    if req.config.dispatch_mode != "greedy":
+        raise ValueError("Monte Carlo studies use the greedy dispatch; set config.dispatch_mode to 'greedy'")
+
+    step_min = req.config.step_minutes or _infer_step_minutes(req.time)
+    dt_h = step_min / 60.0
+    steps_per_day = max(1, round(24 * 60 / step_min))
+    block_days = req.perturbation.bootstrap_block_days
+    if block_days and n < block_days * steps_per_day:
+        raise ValueError(f"Block bootstrap needs at least {block_days} day(s) of data")
+
+    gen = req.generation
+    base = build_profiles(
+        req.demand_kw,
+        pv=gen.pv if gen else None,
+        wind=gen.wind if gen else None,
+        other=gen.other if gen else None,
+    )
+    batch_size = max(1, MONTE_CARLO_BATCH_CELLS // max(n, 1))
+    args = (base, req.perturbation, req.config, dt_h, steps_per_day, req.seed)
+    if n * (req.scenarios + 1) <= SIM_INLINE_MAX_POINTS:
+        baseline = _baseline(base, req.config, dt_h)
+        summaries = _run_scenarios(*args, 0, req.scenarios, batch_size)
+    else:
+        n_chunks = min(max_workers(), req.scenarios)
+        ranges = [(chunk[0], chunk[-1] + 1) for chunk in _chunks(list(range(req.scenarios)), n_chunks)]
+        tasks = [run_in_pool(_run_scenarios, *args, start, stop, batch_size) for start, stop in ranges]
+        baseline, *chunks = await asyncio.gather(run_in_pool(_baseline, base, req.config, dt_h), *tasks)
+        summaries = [s for chunk in chunks for s in chunk]
+
+    return MonteCarloResult(
+        scenarios=req.scenarios,
+        seed=req.seed,
+        baseline=baseline,
+        metrics=metric_distributions(summaries, req.percentiles),
+        samples=summaries if req.include_samples else None,
+    )
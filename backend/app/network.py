@@ -0,0 +1,421 @@
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .engine import LOLP_THRESHOLD_KW, _as_profile
+from .models import (
+    NetworkBattery,
+    NetworkComponentResult,
+    NetworkGrid,
+    NetworkIslandResult,
+    NetworkSimulationRequest,
+    NetworkSimulationResult,
+    SimulationSummary,
+)
+from .simulator import _infer_step_minutes
+from .store import _load_power, get_profile_store
+from .utils import format_timestamps
+
+# Source kinds and the summary total each one counts towards.
+SOURCE_KINDS = ("pv", "wind", "other")
+
+
+# Buses grouped into islands: connected components of the bus graph over closed switches.
+@dataclass
+class Topology:
+    islands: List[List[str]]
+    bus_island: Dict[str, int]
+
+    def island_of(self, components: Sequence) -> np.ndarray:
+        return np.array([self.bus_island[c.bus] for c in components], dtype=np.intp)
+
+
+# Per-island power balance (n x islands, kW) after every component has been dispatched.
+@dataclass
+class IslandDispatch:
+    demand: np.ndarray
+    sources: Dict[str, np.ndarray]  # by kind
+    batt_charge: np.ndarray
+    batt_discharge: np.ndarray
+    generator: np.ndarray
+    grid_import: np.ndarray
+    grid_export: np.ndarray
+    unmet: np.ndarray
+    curtailed: np.ndarray
+
+
+# Per-component dispatch (n x components, kW; SOC in kWh).
+@dataclass
+class NetworkDispatch:
+    batt_charge: np.ndarray
+    batt_discharge: np.ndarray
+    batt_soc_kwh: np.ndarray
+    generator: np.ndarray
+    grid_import: np.ndarray
+    grid_export: np.ndarray
+    islands: IslandDispatch
+
+
+# Validate component IDs and bus references and group buses into islands.
+def build_topology(req: NetworkSimulationRequest) -> Topology:
+    buses = [b.id for b in req.buses]
+    if len(set(buses)) != len(buses):
+        raise ValueError("Bus IDs must be unique")
+    groups = {
+        "switch": req.switches,
+        "load": req.loads,
+        "source": req.sources,
+        "battery": req.batteries,
+        "generator": req.generators,
+        "grid": req.grids,
+    }
+    for kind, components in groups.items():
+        ids = [c.id for c in components]
+        if len(set(ids)) != len(ids):
+            raise ValueError(f"{kind.capitalize()} IDs must be unique")
+    known = set(buses)
+    for kind, components in groups.items():
+        for c in components:
+            refs = (c.bus_a, c.bus_b) if kind == "switch" else (c.bus,)
+            for bus in refs:
+                if bus not in known:
+                    raise ValueError(f"{kind.capitalize()} '{c.id}' references unknown bus '{bus}'")
+    for source in req.sources:
+        if source.kind not in SOURCE_KINDS:
+            raise ValueError(f"Unknown source kind '{source.kind}', expected one of {list(SOURCE_KINDS)}")
+
+    parent = {bus: bus for bus in buses}
+
+    def root(bus: str) -> str:
+        while parent[bus] != bus:
+            parent[bus] = parent[parent[bus]]
+            bus = parent[bus]
+        return bus
+
+    for switch in req.switches:
+        if switch.closed:
+            parent[root(switch.bus_a)] = root(switch.bus_b)
+    index: Dict[str, int] = {}
+    islands: List[List[str]] = []
+    bus_island = {}
+    for bus in buses:
+        r = root(bus)
+        if r not in index:
+            index[r] = len(islands)
+            islands.append([])
+        islands[index[r]].append(bus)
+        bus_island[bus] = index[r]
+    return Topology(islands=islands, bus_island=bus_island)
+
+
+# Sum per-component columns (n x components) into per-island columns (n x islands).
+def _island_sums(values: np.ndarray, island: np.ndarray, n_islands: int) -> np.ndarray:
+    out = np.zeros((values.shape[0], n_islands), dtype=np.float64)
+    for k in range(n_islands):
+        members = np.flatnonzero(island == k)
+        if members.size:
+            out[:, k] = values[:, members].sum(axis=1)
+    return out
+
+
+# Sequential state-of-charge recursion for all batteries at once; each step is a handful
+# of array operations over the batteries, so its cost grows with the number of batteries
+# rather than with Python-level iteration over them. net is the per-island surplus
+# (n x islands); an island's surplus or deficit is split between its batteries in
+# proportion to the power each can absorb or deliver in that step. For a single battery
+# this reproduces engine.battery_kernel exactly.
+# Returns (charge_kw, discharge_kw, soc_kwh), each n x batteries.
+def network_battery_kernel(
+    net: np.ndarray, dt_h: float, batteries: Sequence[NetworkBattery], island: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    n, n_islands = net.shape
+    shape = (n, len(batteries))
+    if not batteries:
+        return np.zeros(shape), np.zeros(shape), np.zeros(shape)
+
+    def param(name: str) -> np.ndarray:
+        return np.array([getattr(b, name) for b in batteries], dtype=np.float64)
+
+    capacity = param("capacity_kwh")
+    kwh = capacity * (param("soc_init_pct") / 100.0)
+    min_kwh = capacity * (param("soc_min_pct") / 100.0)
+    max_kwh = capacity * (param("soc_max_pct") / 100.0)
+    eff_ch = param("charge_efficiency")
+    eff_dis = param("discharge_efficiency")
+    p_ch_max = param("charge_power_kw")
+    p_dis_max = param("discharge_power_kw")
+    ch_den = eff_ch * dt_h
+
+    # The island's surplus and deficit seen by each battery, and whether it charges or discharges.
+    surplus = np.maximum(net, 0.0)[:, island]
+    deficit = np.maximum(-net, 0.0)[:, island]
+    charging = surplus > 0.0
+    discharging = deficit > 0.0
+
+    ch = np.zeros(shape)
+    dis = np.zeros(shape)
+    soc = np.zeros(shape)
+    tiny = np.finfo(np.float64).tiny
+    for i in range(n):
+        c_lim = np.minimum(p_ch_max, np.maximum(max_kwh - kwh, 0.0) / ch_den)
+        d_lim = np.minimum(p_dis_max, (np.maximum(kwh - min_kwh, 0.0) * eff_dis) / dt_h)
+        c_tot = np.bincount(island, c_lim, n_islands)[island]
+        d_tot = np.bincount(island, d_lim, n_islands)[island]
+        x_ch = surplus[i]
+        x_dis = deficit[i]
+        c = np.where(x_ch >= c_tot, c_lim, x_ch * (c_lim / np.maximum(c_tot, tiny)))
+        d = np.where(x_dis >= d_tot, d_lim, x_dis * (d_lim / np.maximum(d_tot, tiny)))
+        kwh = kwh + c * dt_h * eff_ch - d * dt_h / eff_dis
+        kwh = np.where(charging[i], np.minimum(kwh, max_kwh), np.where(discharging[i], np.maximum(kwh, min_kwh), kwh))
+        ch[i] = c
+        dis[i] = d
+        soc[i] = kwh
+    return ch, dis, soc
+
+
+# Export excess power through grid connections (highest export tariff first) and return
+# what is left to curtail. Adds the exported power to grid_export in place.
+def _export(excess: np.ndarray, grids: List[Tuple[int, NetworkGrid]], grid_export: np.ndarray) -> np.ndarray:
+    for j, grid in grids:
+        p = excess if grid.export_limit_kw is None else np.minimum(excess, grid.export_limit_kw)
+        grid_export[:, j] += p
+        excess = excess - p
+    return excess
+
+
+# Decide the dispatch of every component. Only the batteries need a sequential pass;
+# within each island generators and grid connections are then resolved with array
+# operations over time, following the single-bus engine's rules: deficit is served by
+# 'before_gen' grids, then generators (cheapest first), then 'after_gen' grids; surplus
+# and generator excess above the load are exported (best tariff first) or curtailed.
+def network_dispatch(
+    req: NetworkSimulationRequest,
+    topology: Topology,
+    loads: np.ndarray,
+    sources: np.ndarray,
+    dt_h: float,
+) -> NetworkDispatch:
+    n = loads.shape[0]
+    n_islands = len(topology.islands)
+    demand = _island_sums(loads, topology.island_of(req.loads), n_islands)
+    source_island = topology.island_of(req.sources)
+    by_kind = {}
+    for kind in SOURCE_KINDS:
+        columns = np.array([s.kind == kind for s in req.sources], dtype=bool)
+        by_kind[kind] = _island_sums(sources[:, columns], source_island[columns], n_islands)
+    net = by_kind["pv"] + by_kind["wind"] + by_kind["other"] - demand
+
+    batt_island = topology.island_of(req.batteries)
+    ch, dis, soc = network_battery_kernel(net, dt_h, req.batteries, batt_island)
+    batt_charge = _island_sums(ch, batt_island, n_islands)
+    batt_discharge = _island_sums(dis, batt_island, n_islands)
+
+    gen_island = topology.island_of(req.generators)
+    grid_island = topology.island_of(req.grids)
+    generator = np.zeros((n, len(req.generators)))
+    grid_import = np.zeros((n, len(req.grids)))
+    grid_export = np.zeros((n, len(req.grids)))
+    unmet = np.zeros((n, n_islands))
+    curtailed = np.zeros((n, n_islands))
+
+    for k in range(n_islands):
+        grids = [(j, g) for j, g in enumerate(req.grids) if grid_island[j] == k]
+        exporters = sorted(((j, g) for j, g in grids if g.allow_export), key=lambda jg: -jg[1].export_tariff_per_kwh)
+        importers = sorted(((j, g) for j, g in grids if g.allow_import), key=lambda jg: jg[1].import_tariff_per_kwh)
+        gens = sorted(
+            ((j, g) for j, g in enumerate(req.generators) if gen_island[j] == k and g.enabled and g.max_power_kw > 0),
+            key=lambda jg: jg[1].variable_cost_per_kwh,
+        )
+
+        surplus = np.maximum(net[:, k], 0.0) - batt_charge[:, k]
+        curtail = _export(surplus, exporters, grid_export)
+
+        need = np.maximum(-net[:, k], 0.0) - batt_discharge[:, k]
+        order = [("grid", jg) for jg in importers if jg[1].priority == "before_gen"]
+        order += [("gen", jg) for jg in gens]
+        order += [("grid", jg) for jg in importers if jg[1].priority != "before_gen"]
+        for kind, (j, unit) in order:
+            if kind == "grid":
+                p = need if unit.import_limit_kw is None else np.minimum(need, unit.import_limit_kw)
+                p = np.where(need > 0.0, p, 0.0)
+                grid_import[:, j] = p
+                need = need - p
+            else:
+                min_load = unit.min_loading_pct * unit.max_power_kw
+                p = np.minimum(need, unit.max_power_kw)
+                p = np.where((p > 0.0) & (p < min_load), min_load, p)
+                p = np.where(need > 0.0, p, 0.0)
+                generator[:, j] = p
+                curtail = curtail + _export(np.maximum(p - need, 0.0), exporters, grid_export)
+                need = need - np.minimum(need, p)
+        unmet[:, k] = np.maximum(need, 0.0)
+        curtailed[:, k] = curtail
+
+    return NetworkDispatch(
+        batt_charge=ch,
+        batt_discharge=dis,
+        batt_soc_kwh=soc,
+        generator=generator,
+        grid_import=grid_import,
+        grid_export=grid_export,
+        islands=IslandDispatch(
+            demand=demand,
+            sources=by_kind,
+            batt_charge=batt_charge,
+            batt_discharge=batt_discharge,
+            generator=_island_sums(generator, gen_island, n_islands),
+            grid_import=_island_sums(grid_import, grid_island, n_islands),
+            grid_export=_island_sums(grid_export, grid_island, n_islands),
+            unmet=unmet,
+            curtailed=curtailed,
+        ),
+    )
+
+
+# Energy, cost and emission totals over a set of islands (all of them for the network summary).
+def _summary(req: NetworkSimulationRequest, topology: Topology, disp: NetworkDispatch, dt_h: float, islands: List[int]) -> SimulationSummary:
+    isl = disp.islands
+
+    def total(values: np.ndarray) -> float:
+        return float(values[:, islands].sum()) * dt_h
+
+    def members(components: Sequence) -> np.ndarray:
+        return np.isin(topology.island_of(components), islands)
+
+    batt = members(req.batteries)
+    gens = members(req.generators)
+    grids = members(req.grids)
+    charge_eff = np.array([b.charge_efficiency for b in req.batteries], dtype=np.float64)
+    gen_kwh = disp.generator.sum(axis=0) * dt_h
+    imp_kwh = disp.grid_import.sum(axis=0) * dt_h
+    exp_kwh = disp.grid_export.sum(axis=0) * dt_h
+
+    def weighted(kwh: np.ndarray, components: Sequence, attr: str, mask: np.ndarray) -> float:
+        rates = np.array([getattr(c, attr) for c in components], dtype=np.float64)
+        return float((kwh * rates)[mask].sum())
+
+    cost_import = weighted(imp_kwh, req.grids, "import_tariff_per_kwh", grids)
+    revenue_export = weighted(exp_kwh, req.grids, "export_tariff_per_kwh", grids)
+    cost_generator = weighted(gen_kwh, req.generators, "variable_cost_per_kwh", gens)
+    n = isl.unmet.shape[0]
+    lolp_steps = int(np.count_nonzero((isl.unmet[:, islands] > LOLP_THRESHOLD_KW).any(axis=1))) if n else 0
+    pv, wind, other = (total(isl.sources[kind]) for kind in SOURCE_KINDS)
+
+    return SimulationSummary(
+        total_demand_kwh=total(isl.demand),
+        total_pv_kwh=pv,
+        total_wind_kwh=wind,
+        total_renewables_kwh=pv + wind + other,
+        total_battery_charge_kwh=float((disp.batt_charge.sum(axis=0) * dt_h * charge_eff)[batt].sum()),
+        total_battery_discharge_kwh=float(disp.batt_discharge[:, batt].sum()) * dt_h,
+        total_generator_kwh=float(gen_kwh[gens].sum()),
+        total_grid_import_kwh=float(imp_kwh[grids].sum()),
+        total_grid_export_kwh=float(exp_kwh[grids].sum()),
+        total_unmet_kwh=total(isl.unmet),
+        total_curtailed_kwh=total(isl.curtailed),
+        lolp_pct=100.0 * lolp_steps / n if n else 0.0,
+        cost_import=cost_import,
+        revenue_export=revenue_export,
+        cost_generator=cost_generator,
+        total_cost=cost_import - revenue_export + cost_generator,
+        total_co2_kg=weighted(gen_kwh, req.generators, "co2_kg_per_kwh", gens),
+    )
+
+
+# Load the time axis and the load/source profiles of a network request.
+# Loads must cover every step; sources are zero padded or truncated like generation profiles.
+def _network_profiles(req: NetworkSimulationRequest) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    time = req.time
+    if isinstance(time, str):
+        ts = get_profile_store().get(time)
+        if ts.dtype.kind != "M":
+            raise ValueError(f"Profile '{time}' is not a time axis")
+        time = format_timestamps(ts)
+    n = len(time)
+    loads = np.zeros((n, len(req.loads)))
+    for j, load in enumerate(req.loads):
+        values = np.asarray(_load_power(load.demand_kw), dtype=np.float64)
+        if values.shape[0] != n:
+            raise ValueError(f"Length of demand_kw of load '{load.id}' must match length of time")
+        loads[:, j] = values
+    sources = np.zeros((n, len(req.sources)))
+    for j, source in enumerate(req.sources):
+        sources[:, j] = _as_profile(_load_power(source.power_kw), n)
+    return time, loads, sources
+
+
+def _series(values: np.ndarray) -> List[float]:
+    return values.tolist()
+
+
+# Simulate a multi-bus network and assemble per-island and per-component results.
+def simulate_network(req: NetworkSimulationRequest) -> NetworkSimulationResult:
+    topology = build_topology(req)
+    time, loads, sources = _network_profiles(req)
+    step_min = req.step_minutes or _infer_step_minutes(time)
+    dt_h = step_min / 60.0
+    disp = network_dispatch(req, topology, loads, sources, dt_h)
+    isl = disp.islands
+    series = req.include_series
+
+    islands = []
+    for k, buses in enumerate(topology.islands):
+        islands.append(
+            NetworkIslandResult(
+                index=k,
+                buses=buses,
+                summary=_summary(req, topology, disp, dt_h, [k]),
+                series={
+                    "demand_kw": _series(isl.demand[:, k]),
+                    "renewables_kw": _series(sum(isl.sources[kind][:, k] for kind in SOURCE_KINDS)),
+                    "batt_charge_kw": _series(isl.batt_charge[:, k]),
+                    "batt_discharge_kw": _series(isl.batt_discharge[:, k]),
+                    "generator_kw": _series(isl.generator[:, k]),
+                    "grid_import_kw": _series(isl.grid_import[:, k]),
+                    "grid_export_kw": _series(isl.grid_export[:, k]),
+                    "unmet_kw": _series(isl.unmet[:, k]),
+                    "curtailed_kw": _series(isl.curtailed[:, k]),
+                }
+                if series
+                else None,
+            )
+        )
+
+    def component(c, energy: Dict[str, np.ndarray], values: Dict[str, np.ndarray]) -> NetworkComponentResult:
+        return NetworkComponentResult(
+            id=c.id,
+            bus=c.bus,
+            island=topology.bus_island[c.bus],
+            energy_kwh={name: float(v.sum()) * dt_h for name, v in energy.items()},
+            series={name: _series(v) for name, v in values.items()} if series else None,
+        )
+
+    batteries = []
+    for j, b in enumerate(req.batteries):
+        soc_pct = np.clip(100.0 * (disp.batt_soc_kwh[:, j] / b.capacity_kwh), 0.0, 100.0)
+        ch, dis = disp.batt_charge[:, j], disp.batt_discharge[:, j]
+        batteries.append(
+            component(b, {"charge": ch, "discharge": dis}, {"charge_kw": ch, "discharge_kw": dis, "soc_pct": soc_pct})
+        )
+    generators = [
+        component(g, {"generation": disp.generator[:, j]}, {"power_kw": disp.generator[:, j]})
+        for j, g in enumerate(req.generators)
+    ]
+    grids = [
+        component(
+            g,
+            {"import": disp.grid_import[:, j], "export": disp.grid_export[:, j]},
+            {"import_kw": disp.grid_import[:, j], "export_kw": disp.grid_export[:, j]},
+        )
+        for j, g in enumerate(req.grids)
+    ]
+
+    return NetworkSimulationResult(
+        time=time,
+        summary=_summary(req, topology, disp, dt_h, list(range(len(topology.islands)))),
+        islands=islands,
+        batteries=batteries,
+        generators=generators,
+        grids=grids,
+    )
@@ -0,0 +1,251 @@
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from .engine import Dispatch, Profiles, StepHours, dispatch
+from .models import OptimalDispatchConfig, SimulationConfig
+
+try:
+    from scipy import sparse
+    from scipy.optimize import Bounds, LinearConstraint, milp
+except ImportError:  # optional dependency, only needed for dispatch_mode 'optimal'
+    sparse = None
+
+# Dispatch strategies selectable with SimulationConfig.dispatch_mode.
+DISPATCH_MODES = ("greedy", "optimal")
+
+# Variable blocks of one optimization window, one value per step each.
+# gen_on (generator on/off) is only present when the generator has a minimum loading.
+_CHARGE, _DISCHARGE, _GENERATOR, _IMPORT, _EXPORT, _UNMET, _CURTAILED, _SOC, _GEN_ON = range(9)
+
+# Tie-breaking costs per kWh: no simultaneous charge and discharge, export before
+# curtailment, and the configured grid priority between equally priced sources.
+_CYCLE_COST = 1e-6
+_CURTAIL_COST = 1e-6
+_PRIORITY_COST = 1e-6
+
+# Generator output within this of zero or of the minimum loading counts as respecting it.
+_LOADING_TOLERANCE_KW = 1e-6
+
+
+# Validate the dispatch mode of a config. The optimal mode needs scipy (HiGHS).
+def check_dispatch_mode(config: SimulationConfig) -> None:
+    if config.dispatch_mode not in DISPATCH_MODES:
+        raise ValueError(f"Unknown dispatch_mode '{config.dispatch_mode}', expected one of {list(DISPATCH_MODES)}")
+    if config.dispatch_mode != "optimal":
+        return
+    if sparse is None:
+        raise ValueError("dispatch_mode 'optimal' requires scipy (pip install scipy)")
+    options = config.optimal or OptimalDispatchConfig()
+    if options.commit_hours > options.horizon_hours:
+        raise ValueError("optimal.commit_hours cannot be longer than optimal.horizon_hours")
+
+
+# Decide the dispatch with the strategy selected in the config.
+def run_dispatch(profiles: Profiles, dt_h: StepHours, config: SimulationConfig, battery_kwh: Optional[float] = None) -> Dispatch:
+    if config.dispatch_mode == "optimal":
+        return optimal_dispatch(profiles, dt_h, config, battery_kwh)
+    return dispatch(profiles, dt_h, config, battery_kwh)
+
+
+# Linear program of one window, reused for every window with the same length and steps.
+# Rows: power balance (h), state-of-charge recursion (h) and, with a minimum generator
+# loading, the on/off limits g <= max * on and g >= min * on (2h).
+class _WindowProblem:
+    def __init__(self, h: int, dt: np.ndarray, config: SimulationConfig):
+        batt = config.battery
+        gen = config.generator
+        self.h = h
+        self.commit = bool(gen and gen.enabled and gen.max_power_kw > 0 and gen.min_loading_pct > 0)
+        blocks = _GEN_ON + 1 if self.commit else _GEN_ON
+        eff_ch = batt.charge_efficiency if batt else 1.0
+        eff_dis = batt.discharge_efficiency if batt else 1.0
+
+        eye = sparse.identity(h, format="csr")
+        balance = [None] * blocks
+        for block, sign in ((_CHARGE, -1), (_DISCHARGE, 1), (_GENERATOR, 1), (_IMPORT, 1), (_EXPORT, -1), (_UNMET, 1), (_CURTAILED, -1)):
+            balance[block] = sign * eye
+        soc = [None] * blocks
+        soc[_CHARGE] = sparse.diags(-eff_ch * dt)
+        soc[_DISCHARGE] = sparse.diags(dt / eff_dis)
+        soc[_SOC] = eye - sparse.eye(h, k=-1)
+        rows = [balance, soc]
+        if self.commit:
+            rows.append([eye if b == _GENERATOR else -gen.max_power_kw * eye if b == _GEN_ON else None for b in range(blocks)])
+            min_kw = gen.min_loading_pct * gen.max_power_kw
+            rows.append([eye if b == _GENERATOR else -min_kw * eye if b == _GEN_ON else None for b in range(blocks)])
+        self.matrix = sparse.bmat(rows, format="csr")
+        self.n_vars = blocks * h
+        self.integrality = np.zeros(self.n_vars)
+        if self.commit:
+            self.integrality[_GEN_ON * h :] = 1
+
+    def block(self, values: np.ndarray, index: int) -> np.ndarray:
+        return values[index * self.h : (index + 1) * self.h]
+
+
+# Rolling-horizon optimal dispatch: each window of optimal.horizon_hours is solved as a
+# sparse linear program (a MILP when the generator has a minimum loading) minimising
+# import, generator and unserved-energy costs minus export revenue; the first
+# optimal.commit_hours are kept and the next window starts from the committed state of
+# charge. Problem matrices are built once per window shape and reused.
+# progress(done, total) is called after each committed window.
+def optimal_dispatch(
+    profiles: Profiles,
+    dt_h: StepHours,
+    config: SimulationConfig,
+    battery_kwh: Optional[float] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dispatch:
+    check_dispatch_mode(config)
+    if profiles.net.ndim != 1:
+        raise ValueError("dispatch_mode 'optimal' does not support scenario batches")
+    options = config.optimal or OptimalDispatchConfig()
+    n = profiles.net.shape[0]
+    dt = np.broadcast_to(np.asarray(dt_h, dtype=np.float64), (n,))
+    step_h = float(np.median(dt)) if n else 1.0
+    horizon = max(1, int(round(options.horizon_hours / step_h)))
+    commit = max(1, min(horizon, int(round(options.commit_hours / step_h))))
+
+    batt = config.battery
+    if batt:
+        kwh = batt.capacity_kwh * (batt.soc_init_pct / 100.0) if battery_kwh is None else battery_kwh
+        min_kwh = batt.capacity_kwh * (batt.soc_min_pct / 100.0)
+        max_kwh = batt.capacity_kwh * (batt.soc_max_pct / 100.0)
+    else:
+        kwh = min_kwh = max_kwh = 0.0
+
+    out = {block: np.zeros(n) for block in range(_SOC + 1)}
+    problems: Dict[Tuple[int, Optional[float]], _WindowProblem] = {}
+    start = 0
+    while start < n:
+        stop = min(n, start + horizon)
+        h = stop - start
+        window_dt = dt[start:stop]
+        key = (h, float(dt_h)) if np.ndim(dt_h) == 0 else None
+        problem = problems.get(key) if key else None
+        if problem is None:
+            problem = _WindowProblem(h, window_dt, config)
+            if key:
+                problems[key] = problem
+        x = _solve_window(problem, profiles, start, stop, window_dt, config, options, kwh, min_kwh, max_kwh)
+        keep = h if stop == n else commit
+        for block in out:
+            out[block][start : start + keep] = problem.block(x, block)[:keep]
+        kwh = float(out[_SOC][start + keep - 1])
+        start += keep
+        if progress is not None:
+            progress(start, n)
+
+    for block in out:
+        np.maximum(out[block], 0.0, out=out[block])  # solver round-off
+    if batt and batt.capacity_kwh > 0:
+        soc_pct = np.clip(100.0 * (out[_SOC] / batt.capacity_kwh), 0.0, 100.0)
+    else:
+        soc_pct = np.zeros(n)
+    return Dispatch(
+        batt_charge_kw=out[_CHARGE],
+        batt_discharge_kw=out[_DISCHARGE],
+        batt_soc_pct=soc_pct,
+        generator_kw=out[_GENERATOR],
+        grid_import_kw=out[_IMPORT],
+        grid_export_kw=out[_EXPORT],
+        unmet_kw=out[_UNMET],
+        curtailed_kw=out[_CURTAILED],
+        battery_kwh_end=float(out[_SOC][-1]) if n and batt else battery_kwh,
+    )
+
+
+# Solve one window starting from `kwh` stored energy; returns the solution vector.
+def _solve_window(
+    problem: _WindowProblem,
+    profiles: Profiles,
+    start: int,
+    stop: int,
+    dt: np.ndarray,
+    config: SimulationConfig,
+    options: OptimalDispatchConfig,
+    kwh: float,
+    min_kwh: float,
+    max_kwh: float,
+) -> np.ndarray:
+    h = problem.h
+    batt, gen, grid = config.battery, config.generator, config.grid
+    gen_on = bool(gen and gen.enabled and gen.max_power_kw > 0)
+    demand = profiles.demand[start:stop]
+
+    cost = np.zeros(problem.n_vars)
+    lower = np.zeros(problem.n_vars)
+    upper = np.full(problem.n_vars, np.inf)
+
+    def set_block(values: np.ndarray, index: int, value) -> None:
+        problem.block(values, index)[:] = value
+
+    set_block(cost, _CHARGE, _CYCLE_COST * dt)
+    set_block(cost, _DISCHARGE, _CYCLE_COST * dt)
+    set_block(cost, _UNMET, options.unmet_penalty_per_kwh * dt)
+    set_block(cost, _CURTAILED, _CURTAIL_COST * dt)
+    set_block(upper, _CHARGE, batt.charge_power_kw if batt else 0.0)
+    set_block(upper, _DISCHARGE, batt.discharge_power_kw if batt else 0.0)
+    set_block(upper, _UNMET, np.maximum(demand, 0.0))
+    set_block(lower, _SOC, min(min_kwh, kwh))
+    set_block(upper, _SOC, max(max_kwh, kwh))
+
+    if gen_on:
+        penalty = _PRIORITY_COST if grid and grid.priority == "before_gen" else 0.0
+        set_block(cost, _GENERATOR, (gen.variable_cost_per_kwh + penalty) * dt)
+        if problem.commit:
+            set_block(upper, _GEN_ON, 1.0)
+        else:
+            set_block(upper, _GENERATOR, gen.max_power_kw)
+    else:
+        set_block(upper, _GENERATOR, 0.0)
+    if grid and grid.allow_import:
+        penalty = _PRIORITY_COST if grid.priority != "before_gen" else 0.0
+        set_block(cost, _IMPORT, (grid.import_tariff_per_kwh + penalty) * dt)
+        if grid.import_limit_kw is not None:
+            set_block(upper, _IMPORT, grid.import_limit_kw)
+    else:
+        set_block(upper, _IMPORT, 0.0)
+    if grid and grid.allow_export:
+        set_block(cost, _EXPORT, -grid.export_tariff_per_kwh * dt)
+        if grid.export_limit_kw is not None:
+            set_block(upper, _EXPORT, grid.export_limit_kw)
+    else:
+        set_block(upper, _EXPORT, 0.0)
+
+    rows = problem.matrix.shape[0]
+    row_lower = np.zeros(rows)
+    row_upper = np.zeros(rows)
+    row_lower[:h] = row_upper[:h] = demand - profiles.renew[start:stop]
+    row_lower[h] = row_upper[h] = kwh
+    if problem.commit:
+        row_lower[2 * h : 3 * h] = -np.inf
+        row_upper[3 * h :] = np.inf
+
+    solver_options = {"disp": False}
+    if options.time_limit_seconds is not None:
+        solver_options["time_limit"] = options.time_limit_seconds
+
+    def solve(integrality: Optional[np.ndarray]):
+        return milp(
+            cost,
+            integrality=integrality,
+            bounds=Bounds(lower, upper),
+            constraints=LinearConstraint(problem.matrix, row_lower, row_upper),
+            options=solver_options,
+        )
+
+    if problem.commit:
+        # The LP relaxation ignores the minimum loading. When its generator output already
+        # respects it, it is also optimal for the MILP and branch and bound is skipped.
+        result = solve(None)
+        if result.x is not None:
+            g = problem.block(result.x, _GENERATOR)
+            min_kw = gen.min_loading_pct * gen.max_power_kw
+            if np.all((g <= _LOADING_TOLERANCE_KW) | (g >= min_kw - _LOADING_TOLERANCE_KW)):
+                return result.x
+    result = solve(problem.integrality)
+    if result.x is None:
+        raise ValueError(f"Optimal dispatch failed for the window starting at step {start}: {result.message}")
+    return result.x
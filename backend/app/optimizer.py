@@ -0,0 +1,179 @@
+import math
+from typing import Dict, List, Optional, Tuple
+
+from .engine import Profiles, StepHours, build_profiles, dispatch, summarize
+from .models import (
+    BatteryConfig,
+    BatterySizingRequest,
+    BatterySizingResult,
+    SimulationSummary,
+    SizingCandidate,
+)
+from .simulator import request_time_axis
+from .store import resolve_profile_refs
+
+
+# Search the capacity x power grid for the cheapest battery that meets the reliability limit.
+#
+# The search relies on the structure of the greedy dispatch instead of brute force:
+# - for a fixed power rating, unmet energy and LOLP do not increase with capacity,
+#   so the smallest feasible capacity of a row is found by bisection;
+# - along capacity the objective is treated as unimodal, so each power row is
+#   minimised by comparing neighbouring points instead of scanning the row;
+# - operating cost does not increase with capacity either, so the largest battery of a
+#   row bounds the row's operating cost from below; rows whose capex plus that bound
+#   cannot beat the best objective are skipped;
+# - power rows are visited coarse-to-fine: every stride-th row first, then the other
+#   rows nearest the best coarse row first, so that the bound prunes early. Every row
+#   is searched or pruned; nothing is assumed about how results change with power.
+# LOLP is not monotonic in power (a stronger battery empties sooner), so rows are
+# never pruned on feasibility alone.
+class _SizingSearch:
+    def __init__(self, req: BatterySizingRequest, profiles: Profiles, dt_h: StepHours):
+        self.req = req
+        self.profiles = profiles
+        self.dt_h = dt_h
+        self.capacities = sorted(set(req.capacities_kwh))
+        self.powers = sorted(set(req.powers_kw))
+        self.cache: Dict[Tuple[int, int], Tuple[SizingCandidate, SimulationSummary]] = {}
+        self.base = req.config.battery
+        self.truncated = False  # max_evaluations stopped the search early
+
+    def battery(self, capacity: float, power: float) -> BatteryConfig:
+        sizing = {"capacity_kwh": capacity, "charge_power_kw": power, "discharge_power_kw": power}
+        if self.base is not None:
+            return self.base.model_copy(update=sizing)
+        return BatteryConfig(**sizing)
+
+    def capex(self, ci: int, pi: int) -> float:
+        return self.capacities[ci] * self.req.capacity_cost_per_kwh + self.powers[pi] * self.req.power_cost_per_kw
+
+    def feasible(self, summary: SimulationSummary) -> bool:
+        if self.req.max_lolp_pct is not None and summary.lolp_pct > self.req.max_lolp_pct:
+            return False
+        if self.req.max_unmet_kwh is not None and summary.total_unmet_kwh > self.req.max_unmet_kwh:
+            return False
+        return True
+
+    def budget_left(self) -> bool:
+        if len(self.cache) < self.req.max_evaluations:
+            return True
+        self.truncated = True
+        return False
+
+    def evaluate(self, ci: int, pi: int) -> SizingCandidate:
+        key = (ci, pi)
+        if key not in self.cache:
+            config = self.req.config.model_copy(update={"battery": self.battery(self.capacities[ci], self.powers[pi])})
+            disp = dispatch(self.profiles, self.dt_h, config)
+            summary = summarize(self.profiles, disp, self.dt_h, config)
+            candidate = SizingCandidate(
+                capacity_kwh=self.capacities[ci],
+                power_kw=self.powers[pi],
+                total_cost=summary.total_cost,
+                objective=summary.total_cost + self.capex(ci, pi),
+                lolp_pct=summary.lolp_pct,
+                total_unmet_kwh=summary.total_unmet_kwh,
+                feasible=self.feasible(summary),
+            )
+            self.cache[key] = (candidate, summary)
+        return self.cache[key][0]
+
+    # Smallest feasible capacity index in [0, hi] for a power row, or None.
+    def min_feasible_capacity(self, pi: int, hi: int) -> Optional[int]:
+        if not self.evaluate(hi, pi).feasible:
+            return None
+        lo = 0
+        while lo < hi and self.budget_left():
+            mid = (lo + hi) // 2
+            if self.evaluate(mid, pi).feasible:
+                hi = mid
+            else:
+                lo = mid + 1
+        return hi
+
+    # Minimum of the objective over capacity indices [lo, hi] assuming unimodality.
+    def row_minimum(self, pi: int, lo: int, hi: int) -> int:
+        while lo < hi and self.budget_left():
+            mid = (lo + hi) // 2
+            if self.evaluate(mid, pi).objective <= self.evaluate(mid + 1, pi).objective:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    # Search one power row. Returns the row's best feasible candidate, if any.
+    def search_row(self, pi: int, best: Optional[SizingCandidate], frontier: List[SizingCandidate]) -> Optional[SizingCandidate]:
+        top_c = len(self.capacities) - 1
+        top = self.evaluate(top_c, pi)
+        if best is not None and self.capex(0, pi) + top.total_cost >= best.objective:
+            return None
+        k = self.min_feasible_capacity(pi, top_c)
+        if k is None:
+            return None
+        frontier.append(self.evaluate(k, pi))
+        if best is not None and self.capex(k, pi) + top.total_cost >= best.objective:
+            return None
+        return self.evaluate(self.row_minimum(pi, k, top_c), pi)
+
+    def run(self) -> BatterySizingResult:
+        top_p = len(self.powers) - 1
+        stride = max(1, int(round(math.sqrt(len(self.powers)))))
+        coarse = sorted(set(range(0, top_p + 1, stride)) | {top_p})
+        frontier: List[SizingCandidate] = []
+        best: Optional[SizingCandidate] = None
+        best_pi: Optional[int] = None
+        searched = set()
+
+        def visit(rows: List[int]) -> None:
+            nonlocal best, best_pi
+            for pi in rows:
+                if pi in searched or not self.budget_left():
+                    continue
+                searched.add(pi)
+                candidate = self.search_row(pi, best, frontier)
+                if candidate is not None and (best is None or candidate.objective < best.objective):
+                    best, best_pi = candidate, pi
+
+        visit(coarse)
+        center = best_pi if best_pi is not None else 0
+        visit(sorted(range(top_p + 1), key=lambda pi: abs(pi - center)))
+
+        frontier.sort(key=lambda c: c.power_kw)
+        explored = sorted((c for c, _ in self.cache.values()), key=lambda c: (c.power_kw, c.capacity_kwh))
+        result = BatterySizingResult(
+            frontier=frontier,
+            explored=explored,
+            evaluations=len(self.cache),
+            grid_size=len(self.capacities) * len(self.powers),
+            exhaustive=not self.truncated,
+        )
+        if best is not None:
+            ci = self.capacities.index(best.capacity_kwh)
+            pi = self.powers.index(best.power_kw)
+            result.best = best
+            result.best_battery = self.battery(best.capacity_kwh, best.power_kw)
+            result.best_summary = self.cache[(ci, pi)][1]
+        return result
+
+
+# Find the minimum-cost battery sizing subject to an LOLP or unmet-energy limit.
+def optimize_battery(req: BatterySizingRequest) -> BatterySizingResult:
+    req = resolve_profile_refs(req)
+    n = len(req.time)
+    if len(req.demand_kw) != n:
+        raise ValueError("Length of demand_kw must match length of time")
+    if min(req.capacities_kwh) <= 0 or min(req.powers_kw) <= 0:
+        raise ValueError("Candidate capacities and powers must be greater than 0")
+    if req.config.dispatch_mode != "greedy":
+        raise ValueError("Battery sizing searches over the greedy dispatch; set config.dispatch_mode to 'greedy'")
+    req, axis = request_time_axis(req, req.config)
+
+    gen = req.generation
+    profiles = build_profiles(
+        req.demand_kw,
+        pv=gen.pv if gen else None,
+        wind=gen.wind if gen else None,
+        other=gen.other if gen else None,
+    )
+    return _SizingSearch(req, profiles, axis.dt_h).run()
@@ -0,0 +1,168 @@
+import io
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from .cache import CachedResponse, get_result_cache, request_key
+from .engine import StepHours
+from .models import RepricedSummary, SimulationConfig, SimulationRequest, TariffSet
+from .simulator import simulate_arrays
+from .store import _load_power
+
+DISPATCH_MEDIA_TYPE = "application/x-microgrid-dispatch"
+
+# Prices and emission factors that only feed the cost accumulators, never the dispatch.
+PRICING_FIELDS = ("import_tariff_per_kwh", "export_tariff_per_kwh", "variable_cost_per_kwh", "co2_kg_per_kwh")
+
+# Per-timestep rate series are stacked into matrices of at most this many values.
+_MAX_RATE_CELLS = 4_000_000
+
+Rate = Union[float, np.ndarray]
+
+
+# The part of a simulation that pricing depends on: power series (kW) plus the timestep
+# (or per-step durations) and the rates the dispatch was simulated with.
+@dataclass
+class PricedDispatch:
+    grid_import_kw: np.ndarray
+    grid_export_kw: np.ndarray
+    generator_kw: np.ndarray
+    dt_h: StepHours
+    rates: Dict[str, float]
+
+
+# Rates of a simulation config, as used by engine.summary_from_totals.
+def config_rates(config: SimulationConfig) -> Dict[str, float]:
+    grid, gen = config.grid, config.generator
+    return {
+        "import_tariff_per_kwh": grid.import_tariff_per_kwh if grid else 0.0,
+        "export_tariff_per_kwh": grid.export_tariff_per_kwh if grid else 0.0,
+        "variable_cost_per_kwh": gen.variable_cost_per_kwh if gen else 0.0,
+        "co2_kg_per_kwh": gen.co2_kg_per_kwh if gen else 0.0,
+    }
+
+
+# Cache key of a simulation's dispatch: the request hash with every pricing field
+# neutralised, so requests differing only in tariffs share one dispatch. The optimal
+# dispatch depends on the tariffs, so its key keeps them.
+def dispatch_key(req: SimulationRequest) -> str:
+    config = req.config
+    update = {}
+    if config.dispatch_mode == "optimal":
+        return request_key(req.model_copy(update={"output": None}), "dispatch")
+    if config.grid:
+        update["grid"] = config.grid.model_copy(update={"import_tariff_per_kwh": 0.0, "export_tariff_per_kwh": 0.0})
+    if config.generator:
+        update["generator"] = config.generator.model_copy(
+            update={"variable_cost_per_kwh": 0.0, "co2_kg_per_kwh": 0.0, "fuel_l_per_kwh": 0.0}
+        )
+    neutral = req.model_copy(update={"config": config.model_copy(update=update), "output": None})
+    return request_key(neutral, "dispatch")
+
+
+# Run the simulation once and keep only what pricing needs.
+def simulate_dispatch(req: SimulationRequest) -> PricedDispatch:
+    _, _, disp, _, axis = simulate_arrays(req)
+    return PricedDispatch(
+        grid_import_kw=disp.grid_import_kw,
+        grid_export_kw=disp.grid_export_kw,
+        generator_kw=disp.generator_kw,
+        dt_h=axis.dt_h,
+        rates=config_rates(req.config),
+    )
+
+
+def encode_dispatch(d: PricedDispatch) -> CachedResponse:
+    buf = io.BytesIO()
+    np.savez(
+        buf,
+        grid_import_kw=d.grid_import_kw,
+        grid_export_kw=d.grid_export_kw,
+        generator_kw=d.generator_kw,
+        dt_h=np.asarray(d.dt_h, dtype=np.float64),
+        rates=np.array([d.rates[f] for f in PRICING_FIELDS], dtype=np.float64),
+    )
+    return CachedResponse(DISPATCH_MEDIA_TYPE, buf.getvalue())
+
+
+def decode_dispatch(body: bytes) -> PricedDispatch:
+    with np.load(io.BytesIO(body), allow_pickle=False) as data:
+        return PricedDispatch(
+            grid_import_kw=data["grid_import_kw"],
+            grid_export_kw=data["grid_export_kw"],
+            generator_kw=data["generator_kw"],
+            dt_h=data["dt_h"] if data["dt_h"].ndim else float(data["dt_h"]),
+            rates=dict(zip(PRICING_FIELDS, data["rates"].tolist())),
+        )
+
+
+# Dispatch stored under a dispatch_id (a dispatch_key), or None when unknown or expired.
+def cached_dispatch(dispatch_id: str) -> Optional[PricedDispatch]:
+    cache = get_result_cache()
+    entry = cache.get(dispatch_id) if cache else None
+    if entry is None or entry.media_type != DISPATCH_MEDIA_TYPE:
+        return None
+    return decode_dispatch(entry.body)
+
+
+def store_dispatch(dispatch_id: str, d: PricedDispatch) -> None:
+    cache = get_result_cache()
+    if cache:
+        cache.set(dispatch_id, encode_dispatch(d))
+
+
+# A scalar rate, or a per-timestep series of length n (inline or a stored profile ID).
+def _rate(value: Optional[Union[float, List[float], str]], default: float, n: int, name: str) -> Rate:
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    arr = np.asarray(_load_power(value), dtype=np.float64)
+    if arr.shape[0] != n:
+        raise ValueError(f"{name} series has {arr.shape[0]} values, the dispatch has {n} timesteps")
+    return arr
+
+
+# Energy-weighted totals of one power series under many rates: scalar rates multiply the
+# total energy, rate series are stacked and applied as one matrix-vector product.
+def _price(rates: List[Rate], kw: np.ndarray, dt_h: StepHours) -> np.ndarray:
+    if np.ndim(dt_h):
+        kw, dt_h = kw * dt_h, 1.0  # energy of each step (kWh)
+    out = np.empty(len(rates), dtype=np.float64)
+    total_kwh = float(kw.sum()) * dt_h
+    series = []
+    for i, rate in enumerate(rates):
+        if isinstance(rate, np.ndarray):
+            series.append(i)
+        else:
+            out[i] = total_kwh * rate
+    rows = max(1, _MAX_RATE_CELLS // max(kw.shape[0], 1))
+    for lo in range(0, len(series), rows):
+        idx = series[lo : lo + rows]
+        out[idx] = (np.stack([rates[i] for i in idx]) @ kw) * dt_h
+    return out
+
+
+# Recompute costs and emissions of a dispatch for every tariff set without simulating again.
+# defaults fill the rates a tariff set leaves out.
+def reprice(d: PricedDispatch, tariffs: List[TariffSet], defaults: Optional[Dict[str, float]] = None) -> List[RepricedSummary]:
+    defaults = defaults or d.rates
+    n = d.grid_import_kw.shape[0]
+    rates = {f: [_rate(getattr(t, f), defaults[f], n, f) for t in tariffs] for f in PRICING_FIELDS}
+    cost_import = _price(rates["import_tariff_per_kwh"], d.grid_import_kw, d.dt_h)
+    revenue_export = _price(rates["export_tariff_per_kwh"], d.grid_export_kw, d.dt_h)
+    cost_generator = _price(rates["variable_cost_per_kwh"], d.generator_kw, d.dt_h)
+    co2 = _price(rates["co2_kg_per_kwh"], d.generator_kw, d.dt_h)
+    total = cost_import - revenue_export + cost_generator
+    return [
+        RepricedSummary(
+            name=t.name,
+            cost_import=float(cost_import[i]),
+            revenue_export=float(revenue_export[i]),
+            cost_generator=float(cost_generator[i]),
+            total_cost=float(total[i]),
+            total_co2_kg=float(co2[i]),
+        )
+        for i, t in enumerate(tariffs)
+    ]
@@ -0,0 +1,293 @@
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .engine import LOLP_THRESHOLD_KW, Profiles, Totals, build_profiles, dispatch, summary_from_totals
+from .models import (
+    ReducedSimulationRequest,
+    ReducedSimulationResult,
+    ReductionConfig,
+    ReductionError,
+    RepresentativeDay,
+    SimulationConfig,
+    SimulationSummary,
+)
+from .simulator import request_time_axis
+from .store import resolve_profile_refs
+
+# How the battery state is carried through the representative days (ReductionConfig.battery_state).
+BATTERY_STATES = ("cyclic", "chained")
+
+# Lloyd iterations of the day clustering.
+_KMEANS_ITERATIONS = 100
+
+# Days are clustered on hourly means of each series, scaled by the series' maximum.
+_FEATURE_BUCKETS = 24
+_FEATURE_SERIES = ("demand", "pv", "wind", "other")
+
+# Totals fields summed from the dispatch, by dispatch series.
+_DISPATCH_TOTALS = {
+    "batt_charge": "batt_charge_kw",
+    "batt_discharge": "batt_discharge_kw",
+    "generator": "generator_kw",
+    "grid_import": "grid_import_kw",
+    "grid_export": "grid_export_kw",
+    "unmet": "unmet_kw",
+    "curtailed": "curtailed_kw",
+}
+
+# Metrics smaller than this count as zero when computing relative errors.
+_ZERO = 1e-9
+
+
+# Representative days of a horizon, ready to be simulated under any configuration.
+# Simulated days run back to back in one dispatch; `measured` marks the ones that count
+# (the second pass of each day in cyclic mode). Validation windows likewise run back to
+# back, each after a warm-up day.
+@dataclass
+class ReducedHorizon:
+    steps_per_day: int
+    dt_h: float
+    profiles: Profiles
+    measured: np.ndarray
+    weights: np.ndarray  # days represented by each representative day
+    starts: List[str]  # first timestamp of each representative day
+    day_clusters: np.ndarray  # representative of every day, a trailing partial day included
+    validation: Optional[Profiles]
+    validation_measured: Optional[np.ndarray]
+    validation_weights: Optional[np.ndarray]  # validation days represented by each representative day
+
+    @property
+    def simulated_steps(self) -> int:
+        steps = self.profiles.demand.shape[0]
+        return steps + (self.validation.demand.shape[0] if self.validation is not None else 0)
+
+
+# Profiles of the given days, back to back.
+def _take_days(profiles: Profiles, days: np.ndarray, steps_per_day: int) -> Profiles:
+    idx = (np.asarray(days, dtype=np.int64)[:, None] * steps_per_day + np.arange(steps_per_day)).ravel()
+    return Profiles(**{f.name: getattr(profiles, f.name)[idx] for f in fields(Profiles)})
+
+
+# Clustering features of the first `days` whole days: per-series hourly mean shapes.
+def _day_features(profiles: Profiles, days: int, steps_per_day: int) -> np.ndarray:
+    buckets = _FEATURE_BUCKETS if steps_per_day % _FEATURE_BUCKETS == 0 else steps_per_day
+    blocks = []
+    for name in _FEATURE_SERIES:
+        values = getattr(profiles, name)[: days * steps_per_day].reshape(days, buckets, -1).mean(axis=2)
+        scale = float(np.abs(values).max())
+        if scale > 0:
+            blocks.append(values / scale)
+    return np.hstack(blocks) if blocks else np.zeros((days, 1))
+
+
+def _sq_distances(x: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    d = (x * x).sum(axis=1)[:, None] - 2.0 * (x @ centers.T) + (centers * centers).sum(axis=1)[None, :]
+    return np.maximum(d, 0.0)
+
+
+# k-means (k-means++ seeding, Lloyd iterations) over the rows of x. Returns the cluster
+# of every row and the medoid row of every cluster (the real day closest to its centroid).
+def _cluster_days(x: np.ndarray, k: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    m = x.shape[0]
+    centers = np.empty((k, x.shape[1]))
+    centers[0] = x[rng.integers(m)]
+    closest = ((x - centers[0]) ** 2).sum(axis=1)
+    for c in range(1, k):
+        total = closest.sum()
+        centers[c] = x[rng.choice(m, p=closest / total) if total > 0 else rng.integers(m)]
+        closest = np.minimum(closest, ((x - centers[c]) ** 2).sum(axis=1))
+
+    labels = np.full(m, -1)
+    for _ in range(_KMEANS_ITERATIONS):
+        dist = _sq_distances(x, centers)
+        new = dist.argmin(axis=1)
+        fit = dist[np.arange(m), new]
+        for c in np.flatnonzero(np.bincount(new, minlength=k) == 0):
+            # Reseed an empty cluster with the worst-fitted day.
+            worst = int(fit.argmax())
+            new[worst], fit[worst] = c, -1.0
+        if np.array_equal(new, labels):
+            break
+        labels = new
+        members = labels[None, :] == np.arange(k)[:, None]
+        centers = (members @ x) / members.sum(axis=1)[:, None]
+
+    dist = _sq_distances(x, centers)
+    medoids = np.array([np.flatnonzero(labels == c)[dist[labels == c, c].argmin()] for c in range(k)])
+    return labels, medoids
+
+
+# Cluster the days of a horizon into representative days. Days are consecutive blocks of
+# 24 h from the first sample; a trailing partial day is attributed, as a fraction of a
+# day, to the representative closest to it over its available hours.
+def reduce_horizon(time: List[str], profiles: Profiles, step_minutes: int, reduction: ReductionConfig) -> ReducedHorizon:
+    if reduction.battery_state not in BATTERY_STATES:
+        raise ValueError(f"Unknown battery_state '{reduction.battery_state}', expected one of {list(BATTERY_STATES)}")
+    if (24 * 60) % step_minutes:
+        raise ValueError(f"Representative days need a step that divides 24 h, got {step_minutes} minutes")
+    spd = 24 * 60 // step_minutes
+    days, rest = divmod(profiles.demand.shape[0], spd)
+    if days == 0:
+        raise ValueError("Representative-day reduction needs at least one full day of data")
+
+    candidates = np.arange(days)
+    extreme = None
+    if reduction.include_extreme_day and days > 1:
+        net_load = -profiles.net[: days * spd].reshape(days, spd)
+        extreme = int(net_load.max(axis=1).argmax())
+        candidates = candidates[candidates != extreme]
+    k = max(1, min(reduction.representative_days - (extreme is not None), candidates.size))
+    labels, medoids = _cluster_days(_day_features(profiles, days, spd)[candidates], k, reduction.seed)
+    rep_days = candidates[medoids]
+    day_clusters = np.empty(days, dtype=np.int64)
+    day_clusters[candidates] = labels
+    if extreme is not None:
+        rep_days = np.append(rep_days, extreme)
+        day_clusters[extreme] = k
+
+    # Number the representative days in calendar order (the order 'chained' runs them in).
+    order = np.argsort(rep_days)
+    relabel = np.empty_like(order)
+    relabel[order] = np.arange(order.size)
+    rep_days, day_clusters = rep_days[order], relabel[day_clusters]
+    weights = np.bincount(day_clusters, minlength=rep_days.size).astype(np.float64)
+    if rest:
+        tail = slice(days * spd, days * spd + rest)
+        heads = (rep_days[:, None] * spd + np.arange(rest)).ravel()
+        diff = (profiles.demand[heads] - np.tile(profiles.demand[tail], rep_days.size)) ** 2
+        diff += (profiles.renew[heads] - np.tile(profiles.renew[tail], rep_days.size)) ** 2
+        nearest = int(diff.reshape(rep_days.size, rest).sum(axis=1).argmin())
+        weights[nearest] += rest / spd
+        day_clusters = np.append(day_clusters, nearest)
+
+    if reduction.battery_state == "cyclic":
+        simulated, measured = np.repeat(rep_days, 2), np.tile([False, True], rep_days.size)
+    else:
+        simulated, measured = rep_days, np.ones(rep_days.size, dtype=bool)
+
+    validation = validation_measured = validation_weights = None
+    every, window_days = reduction.validation_every_days, reduction.validation_days
+    if every and days > window_days:
+        window = np.arange(-1, window_days)
+        val_days = (np.arange(1, days - window_days + 1, every)[:, None] + window).ravel()
+        validation = _take_days(profiles, val_days, spd)
+        validation_measured = np.tile(window >= 0, val_days.size // window.size)
+        validation_weights = np.bincount(
+            day_clusters[val_days[validation_measured]], minlength=rep_days.size
+        ).astype(np.float64)
+
+    return ReducedHorizon(
+        steps_per_day=spd,
+        dt_h=step_minutes / 60.0,
+        profiles=_take_days(profiles, simulated, spd),
+        measured=measured,
+        weights=weights,
+        starts=[str(time[d * spd]) for d in rep_days],
+        day_clusters=day_clusters,
+        validation=validation,
+        validation_measured=validation_measured,
+        validation_weights=validation_weights,
+    )
+
+
+# Per-day sums of every Totals field over profiles simulated back to back.
+def _day_sums(profiles: Profiles, disp, steps_per_day: int) -> Dict[str, np.ndarray]:
+    def per_day(values: np.ndarray) -> np.ndarray:
+        return values.reshape(-1, steps_per_day).sum(axis=1)
+
+    sums = {name: per_day(getattr(profiles, name)) for name in ("demand", "pv", "wind", "renew")}
+    for name, series in _DISPATCH_TOTALS.items():
+        sums[name] = per_day(getattr(disp, series))
+    sums["lolp_steps"] = per_day((disp.unmet_kw > LOLP_THRESHOLD_KW).astype(np.float64))
+    sums["steps"] = np.full(sums["demand"].shape[0], float(steps_per_day))
+    return sums
+
+
+def _weighted_totals(sums: Dict[str, np.ndarray], weights: np.ndarray) -> Totals:
+    return Totals(**{name: float(values @ weights) for name, values in sums.items()})
+
+
+# Relative error of every summary metric of an estimate against the actual values.
+def _reduction_error(actual: SimulationSummary, estimated: SimulationSummary, days: int) -> ReductionError:
+    relative = {}
+    for name in SimulationSummary.model_fields:
+        a, e = getattr(actual, name), getattr(estimated, name)
+        if abs(a) > _ZERO:
+            relative[name] = abs(e - a) / abs(a)
+        else:
+            relative[name] = 0.0 if abs(e) <= _ZERO else None
+    known = [v for v in relative.values() if v is not None]
+    return ReductionError(
+        days=days,
+        actual=actual,
+        estimated=estimated,
+        relative_error=relative,
+        max_relative_error=max(known) if known else None,
+    )
+
+
+# Simulate a config on the representative days and scale the summary to the full horizon
+# with the cluster weights. With validation windows, the same config is also simulated at
+# full resolution on those days and compared with their representative-day estimate.
+def simulate_reduced(horizon: ReducedHorizon, config: SimulationConfig) -> Tuple[SimulationSummary, Optional[ReductionError]]:
+    spd, dt_h = horizon.steps_per_day, horizon.dt_h
+    sums = _day_sums(horizon.profiles, dispatch(horizon.profiles, dt_h, config), spd)
+    rep = {name: values[horizon.measured] for name, values in sums.items()}
+    summary = summary_from_totals(_weighted_totals(rep, horizon.weights), dt_h, config)
+    if horizon.validation is None:
+        return summary, None
+
+    val = _day_sums(horizon.validation, dispatch(horizon.validation, dt_h, config), spd)
+    days = int(np.count_nonzero(horizon.validation_measured))
+    actual = _weighted_totals({name: v[horizon.validation_measured] for name, v in val.items()}, np.ones(days))
+    estimated = _weighted_totals(rep, horizon.validation_weights)
+    return summary, _reduction_error(summary_from_totals(actual, dt_h, config), summary_from_totals(estimated, dt_h, config), days)
+
+
+# Simulate a chunk of configs on one reduced horizon. Runs inside a worker process.
+def _run_reduced_chunk(
+    horizon: ReducedHorizon, configs: List[SimulationConfig]
+) -> List[Tuple[SimulationSummary, Optional[ReductionError]]]:
+    return [simulate_reduced(horizon, config) for config in configs]
+
+
+# Validate a config for reduced simulation: the greedy dispatch on the horizon's step.
+def check_reducible(config: SimulationConfig, step_minutes: int) -> None:
+    if config.dispatch_mode != "greedy":
+        raise ValueError("Representative-day reduction uses the greedy dispatch; set config.dispatch_mode to 'greedy'")
+    if config.step_minutes and config.step_minutes != step_minutes:
+        raise ValueError("Representative-day reduction needs every config on the step of the time axis")
+
+
+# Reduce a request's horizon to representative days and simulate its config on them.
+# Always runs on the vectorized engine.
+def run_reduced(req: ReducedSimulationRequest) -> ReducedSimulationResult:
+    req = resolve_profile_refs(req)
+    n = len(req.time)
+    if len(req.demand_kw) != n:
+        raise ValueError("Length of demand_kw must match length of time")
+    req, axis = request_time_axis(req, req.config)
+    if not axis.regular:
+        raise ValueError("Representative-day reduction needs a regular time axis; set config.time_mode to 'uniform' or 'regularize'")
+    check_reducible(req.config, axis.step_minutes)
+
+    gen = req.generation
+    profiles = build_profiles(
+        req.demand_kw,
+        pv=gen.pv if gen else None,
+        wind=gen.wind if gen else None,
+        other=gen.other if gen else None,
+    )
+    horizon = reduce_horizon(req.time, profiles, axis.step_minutes, req.reduction)
+    summary, error = simulate_reduced(horizon, req.config)
+    return ReducedSimulationResult(
+        summary=summary,
+        representative_days=[RepresentativeDay(start=s, weight=float(w)) for s, w in zip(horizon.starts, horizon.weights)],
+        day_clusters=horizon.day_clusters.tolist(),
+        error=error,
+        simulated_steps=horizon.simulated_steps,
+        full_steps=profiles.demand.shape[0],
+    )
@@ -0,0 +1,46 @@
+from typing import List
+
+from .cache import CachedResponse
+from .downsample import reduce_series, reduced_fields, wants_reduction
+from .encoding import ARROW_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE, JSON_MEDIA_TYPE, encode_arrow, encode_columnar, encode_json
+from .engine import Dispatch, Profiles
+from .metrics import stage
+from .models import SimulationRequest, SimulationSummary
+from .simulator import simulate_arrays
+from .timeaxis import TimeAxis
+
+
+# Serialize simulation arrays in the negotiated format ('json', 'columnar' or 'arrow'),
+# aggregating or downsampling the series when the output options ask for it.
+# JSON responses of an irregular time axis also list its gaps.
+def encode_simulation(
+    req: SimulationRequest,
+    fmt: str,
+    time: List[str],
+    profiles: Profiles,
+    disp: Dispatch,
+    summary: SimulationSummary,
+    axis: TimeAxis,
+) -> CachedResponse:
+    if req.output and req.output.time_format == "start_step" and not axis.regular:
+        raise ValueError("time_format 'start_step' needs a regular time axis")
+    extra = {}
+    if wants_reduction(req.output):
+        with stage("reduce"):
+            reduced = reduce_series(time, profiles, disp, axis.dt_h, req.output)
+        time, profiles, disp, extra = reduced.time, reduced.profiles, reduced.disp, reduced_fields(reduced)
+    if not axis.regular:
+        extra.update(gap_count=axis.gap_count, gaps=axis.gaps)
+    with stage("serialize"):
+        if fmt == "json":
+            return CachedResponse(JSON_MEDIA_TYPE, encode_json(time, profiles, disp, summary, extra))
+        if fmt == "arrow":
+            return CachedResponse(ARROW_MEDIA_TYPE, encode_arrow(time, axis.step_minutes, profiles, disp, summary, req.output))
+        return CachedResponse(COLUMNAR_MEDIA_TYPE, encode_columnar(time, axis.step_minutes, profiles, disp, summary, req.output))
+
+
+# Run a simulation and serialize it in the negotiated format.
+def render_simulation(req: SimulationRequest, fmt: str) -> CachedResponse:
+    with stage("simulate"):
+        time, profiles, disp, summary, axis = simulate_arrays(req)
+    return encode_simulation(req, fmt, time, profiles, disp, summary, axis)
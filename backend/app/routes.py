@@ -1,43 +1,425 @@
-from fastapi import APIRouter, UploadFile, HTTPException
-from typing import List
-from app.utils import process_csv_file, process_multiple_csv_files
-from app.models import PowerProfileData, MultipleProfilesData, SimulationRequest, SimulationResult
-from app.simulator import simulate_microgrid
+from fastapi import APIRouter, Depends, UploadFile, HTTPException, Request, Response, Query
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import nullcontext
+from typing import Iterator, List, Optional
+import time
+from app.utils import process_csv_file, process_multiple_csv_files, format_timestamps, upload_format
+from app.models import (
+    PowerProfileData,
+    MultipleProfilesData,
+    SimulationRequest,
+    SimulationResult,
+    SimulationStreamRequest,
+    BatchSimulationRequest,
+    BatchSimulationResult,
+    BatterySizingRequest,
+    BatterySizingResult,
+    JobStatus,
+    NetworkSimulationRequest,
+    NetworkSimulationResult,
+    MonteCarloRequest,
+    MonteCarloResult,
+    RepriceRequest,
+    RepriceResult,
+    ProfileAnalyticsRequest,
+    ProfileAnalyticsResult,
+    ReducedSimulationRequest,
+    ReducedSimulationResult,
+)
+from app.simulator import (
+    simulate_chunks,
+    prepare_stream,
+    checkpoint_from_state,
+)
+from app.engine import summary_from_totals
+from app.encoding import (
+    negotiate_format,
+    negotiate_stream_format,
+    decode_columnar_request,
+    parse_json,
+    encode_stream_chunk,
+    encode_stream_summary,
+    ARROW_MEDIA_TYPE,
+    COLUMNAR_MEDIA_TYPE,
+    COLUMNAR_STREAM_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+)
+from app.render import render_simulation
+from app.cache import CachedResponse, get_result_cache, request_key
+from app.batch import run_batch
+from app.store import get_profile_store, store_profiles
+from app.analytics import index_profiles, profile_analytics
+from app.metrics import add_stages, current_request_metrics, instrumented, observe_series_length, run_with_stages, stage
+from app.workers import SIM_INLINE_MAX_POINTS, PoolBusy, run_in_pool
+from app.jobs import JobQueueFull, get_job_manager
+from app.optimizer import optimize_battery
+from app.network import simulate_network
+from app.montecarlo import run_montecarlo
+from app.reduction import run_reduced
+from app.pricing import cached_dispatch, config_rates, dispatch_key, reprice, simulate_dispatch, store_dispatch
 
 router = APIRouter()
 
 @router.post("/upload", response_model=PowerProfileData)
+@instrumented
 async def upload_csv(file: UploadFile):
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="File must be a CSV")
+    try:
+        upload_format(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
-        data = await process_csv_file(file)
-        return PowerProfileData(**data)
+        with stage("parse"):
+            data = await process_csv_file(file)
+        observe_series_length(len(data["time"]))
+        with stage("store"):
+            profile_ids = await run_in_threadpool(store_profiles, data)
+        with stage("index"):
+            await run_in_threadpool(index_profiles, data["time"], {"power": data["power"]}, profile_ids)
+        with stage("tolist"):
+            return PowerProfileData(
+                time=format_timestamps(data["time"]),
+                power=data["power"].tolist(),
+                profile_ids=profile_ids,
+            )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# Files are parsed concurrently and aligned onto a common time index; `step_minutes`
+# resamples that index and `method` picks mean, interpolate or ffill. A zip archive
+# contributes one profile per member file.
 @router.post("/upload-multiple", response_model=MultipleProfilesData)
-async def upload_multiple_csv(files: List[UploadFile]):
+@instrumented
+async def upload_multiple_csv(
+    files: List[UploadFile],
+    step_minutes: Optional[int] = Query(None, gt=0),
+    method: str = Query("mean"),
+):
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
     
-    # Validate all files are CSVs
+    # Validate all files are in a supported upload format
     for file in files:
-        if not file.filename.endswith('.csv'):
-            raise HTTPException(status_code=400, detail=f"File {file.filename} must be a CSV")
+        try:
+            upload_format(file.filename)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
     try:
-        data = await process_multiple_csv_files(files)
-        return MultipleProfilesData(**data)
+        with stage("parse"):
+            data = await process_multiple_csv_files(files, step_minutes=step_minutes, method=method)
+        observe_series_length(len(data["time"]))
+        with stage("store"):
+            profile_ids = await run_in_threadpool(store_profiles, {"time": data["time"], **data["profiles"]})
+        with stage("index"):
+            await run_in_threadpool(index_profiles, data["time"], data["profiles"], profile_ids)
+        with stage("tolist"):
+            return MultipleProfilesData(
+                time=format_timestamps(data["time"]),
+                profiles={name: power.tolist() for name, power in data["profiles"].items()},
+                alignment=data["alignment"],
+                profile_ids=profile_ids,
+            )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# Endpoint for profile analytics: energy, peaks, percentiles, duration curves and daily or
+# monthly statistics of stored profiles over any time range, answered from the indexes
+# built at upload time instead of rescanning the series.
+@router.post("/profiles/analytics", response_model=ProfileAnalyticsResult)
+@instrumented
+async def analyze_profiles(req: ProfileAnalyticsRequest):
+    try:
+        with stage("analytics"):
+            return await run_in_threadpool(profile_analytics, req)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Number of timesteps in a request, also when its time axis is a stored profile ID.
+def _request_length(req) -> int:
+    return get_profile_store().get(req.time).shape[0] if isinstance(req.time, str) else len(req.time)
+
+# Render a simulation, in the process pool when it is too long to run on the event loop.
+async def _render_offloaded(req: SimulationRequest, fmt: str) -> CachedResponse:
+    if _request_length(req) <= SIM_INLINE_MAX_POINTS:
+        return render_simulation(req, fmt)
+    rendered, stages = await run_in_pool(run_with_stages, render_simulation, time.time(), req, fmt)
+    add_stages(stages)
+    return rendered
+
+# Read a simulation request from a JSON or columnar body (Content-Type: application/x-microgrid-columnar).
+# Columnar bodies skip per-element validation; JSON bodies are parsed with orjson when available.
+async def _simulation_request(request: Request) -> SimulationRequest:
+    body = await request.body()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == COLUMNAR_MEDIA_TYPE:
+        try:
+            return await run_in_threadpool(decode_columnar_request, body)
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        data = parse_json(body)
+    except ValueError as e:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("body", 0), "msg": "JSON decode error", "input": {}, "ctx": {"error": str(e)}}])
+    try:
+        return SimulationRequest.model_validate(data)
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors()])
+
+# Request body schema of /simulate, which reads its body itself to support both encodings.
+# Nested models are referenced from the components that the other routes already register.
+_SIMULATE_REQUEST_SCHEMA = SimulationRequest.model_json_schema(ref_template="#/components/schemas/{model}")
+_SIMULATE_REQUEST_SCHEMA.pop("$defs", None)
+_SIMULATE_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            JSON_MEDIA_TYPE: {"schema": _SIMULATE_REQUEST_SCHEMA},
+            COLUMNAR_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
 # Endpoint for simulation
-@router.post("/simulate", response_model=SimulationResult)
-async def simulate(req: SimulationRequest):
+# The request body is JSON or the packed columnar format (see _simulation_request).
+# The Accept header selects JSON (default), packed columnar binary or Arrow IPC.
+# Serialized responses are memoized by a canonical hash of the request (X-Cache: HIT/MISS).
+@router.post(
+    "/simulate",
+    response_model=SimulationResult,
+    responses={200: {"content": {COLUMNAR_MEDIA_TYPE: {}, ARROW_MEDIA_TYPE: {}}}},
+    openapi_extra=_SIMULATE_REQUEST_BODY,
+)
+@instrumented
+async def simulate(request: Request, req: SimulationRequest = Depends(_simulation_request)):
+    fmt = negotiate_format(request.headers.get("accept"))
     try:
-        result = simulate_microgrid(req)
-        return result
+        observe_series_length(_request_length(req))
+        cache = get_result_cache()
+        with stage("cache"):
+            key = request_key(req, fmt) if cache else None
+            rendered = cache.get(key) if cache else None
+        if rendered is not None:
+            return Response(content=rendered.body, media_type=rendered.media_type, headers={"X-Cache": "HIT"})
+        rendered = await _render_offloaded(req, fmt)
+        if cache:
+            cache.set(key, rendered)
+        return Response(content=rendered.body, media_type=rendered.media_type, headers={"X-Cache": "MISS"})
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Validate a streaming request and return a generator of encoded records.
+# Validation happens here, before the response starts, so errors still become a 400.
+def _start_stream(req: SimulationStreamRequest, fmt: str) -> Iterator[bytes]:
+    key = request_key(req.model_copy(update={"output": None}), "stream")
+    with stage("prepare"):
+        req, state, step_min = prepare_stream(req, key)
+    observe_series_length(len(req.time))
+    dt_h = step_min / 60.0
+    # The generator runs outside the request context, so it records into the captured metrics.
+    metrics = current_request_metrics()
+    timed = metrics.stage if metrics is not None else lambda name: nullcontext()
+
+    def records() -> Iterator[bytes]:
+        chunks = simulate_chunks(req, state, req.chunk_size, dt_h)
+        while True:
+            with timed("simulate"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            start, time, profiles, disp = chunk
+            with timed("serialize"):
+                checkpoint = checkpoint_from_state(state, key).model_dump()
+                record = encode_stream_chunk(fmt, start, time, step_min, profiles, disp, checkpoint, req.output)
+            yield record
+        yield encode_stream_summary(fmt, summary_from_totals(state.totals, dt_h, req.config))
+
+    return records()
+
+# Endpoint for streaming simulation of long horizons.
+# Series are sent chunk by chunk as NDJSON (default) or length-prefixed columnar frames
+# (Accept: application/x-microgrid-columnar-stream), followed by the summary. Each chunk
+# carries a checkpoint; send it back as resume_from to continue an interrupted run.
+@router.post(
+    "/simulate/stream",
+    responses={200: {"content": {NDJSON_MEDIA_TYPE: {}, COLUMNAR_STREAM_MEDIA_TYPE: {}}}},
+)
+@instrumented
+async def simulate_stream(req: SimulationStreamRequest, request: Request):
+    fmt = negotiate_stream_format(request.headers.get("accept"))
+    try:
+        records = _start_stream(req, fmt)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type = NDJSON_MEDIA_TYPE if fmt == "ndjson" else COLUMNAR_STREAM_MEDIA_TYPE
+    return StreamingResponse(records, media_type=media_type)
+
+# Hit/miss counters and size of the simulation result cache.
+@router.get("/simulate/cache")
+async def simulate_cache_stats():
+    cache = get_result_cache()
+    return cache.stats() if cache else {"backend": "off"}
+
+# Endpoint for batch / parameter-sweep simulation over shared profiles.
+# Variants always run on the vectorized engine.
+@router.post("/simulate/batch", response_model=BatchSimulationResult)
+@instrumented
+async def simulate_batch(req: BatchSimulationRequest):
+    try:
+        observe_series_length(_request_length(req))
+        with stage("batch"):
+            return await run_batch(req)
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Endpoint for tariff and emission sweeps over one dispatch. The dispatch does not depend
+# on prices, so it is simulated once (and cached under dispatch_id) and every tariff set
+# is evaluated with vectorized products over the cached series.
+@router.post("/simulate/reprice", response_model=RepriceResult)
+@instrumented
+async def simulate_reprice(req: RepriceRequest):
+    try:
+        sim = req.simulation
+        if sim is None and req.dispatch_id is None:
+            raise ValueError("Send either a simulation or a dispatch_id")
+        dispatch_id = dispatch_key(sim) if sim is not None else req.dispatch_id
+        with stage("cache"):
+            disp = cached_dispatch(dispatch_id)
+        if disp is None:
+            if sim is None:
+                raise ValueError(f"Unknown or expired dispatch_id '{dispatch_id}', send the simulation instead")
+            n = _request_length(sim)
+            observe_series_length(n)
+            with stage("simulate"):
+                if n <= SIM_INLINE_MAX_POINTS:
+                    disp = simulate_dispatch(sim)
+                else:
+                    disp = await run_in_pool(simulate_dispatch, sim)
+            store_dispatch(dispatch_id, disp)
+        with stage("price"):
+            results = reprice(disp, req.tariffs, config_rates(sim.config) if sim is not None else None)
+        cached = get_result_cache() is not None
+        return RepriceResult(dispatch_id=dispatch_id if cached else None, steps=disp.grid_import_kw.shape[0], results=results)
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Endpoint for Monte Carlo reliability studies: percentile bands of the summary metrics
+# over K perturbed scenarios. Scenarios always run on the vectorized engine.
+@router.post("/simulate/montecarlo", response_model=MonteCarloResult)
+@instrumented
+async def simulate_montecarlo(req: MonteCarloRequest):
+    try:
+        observe_series_length(_request_length(req))
+        with stage("montecarlo"):
+            return await run_montecarlo(req)
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Endpoint for multi-bus network simulation: batteries, generators, grid connections,
+# loads and sources on buses joined by switches. Long runs use the process pool.
+@router.post("/simulate/network", response_model=NetworkSimulationResult)
+@instrumented
+async def simulate_network_endpoint(req: NetworkSimulationRequest):
+    try:
+        n = _request_length(req)
+        observe_series_length(n)
+        with stage("simulate"):
+            if n <= SIM_INLINE_MAX_POINTS:
+                return simulate_network(req)
+            return await run_in_pool(simulate_network, req)
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Endpoint for screening simulations on representative days: the horizon's days are
+# clustered and only one weighted day per cluster is simulated. Long runs use the process pool.
+@router.post("/simulate/reduced", response_model=ReducedSimulationResult)
+@instrumented
+async def simulate_reduced_endpoint(req: ReducedSimulationRequest):
+    try:
+        n = _request_length(req)
+        observe_series_length(n)
+        with stage("simulate"):
+            if n <= SIM_INLINE_MAX_POINTS:
+                return run_reduced(req)
+            return await run_in_pool(run_reduced, req)
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Endpoint for battery sizing: minimum-cost capacity x power subject to a reliability limit.
+# Searches that may simulate more than SIM_INLINE_MAX_POINTS timesteps in total use the process pool.
+@router.post("/optimize/battery", response_model=BatterySizingResult)
+@instrumented
+async def optimize_battery_sizing(req: BatterySizingRequest):
+    try:
+        n = _request_length(req)
+        observe_series_length(n)
+        with stage("optimize"):
+            if n * req.max_evaluations <= SIM_INLINE_MAX_POINTS:
+                return optimize_battery(req)
+            return await run_in_pool(optimize_battery, req)
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Background simulation jobs: submit, poll progress, fetch the result or cancel.
+# The result format is chosen by the Accept header at submission, like /simulate.
+@router.post(
+    "/jobs/simulate",
+    response_model=JobStatus,
+    status_code=202,
+    openapi_extra=_SIMULATE_REQUEST_BODY,
+)
+@instrumented
+async def submit_simulation_job(request: Request, req: SimulationRequest = Depends(_simulation_request)):
+    fmt = negotiate_format(request.headers.get("accept"))
+    try:
+        observe_series_length(_request_length(req))
+        key = request_key(req, fmt) if get_result_cache() else None
+        return get_job_manager().submit(req, fmt, key).snapshot()
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _get_job(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_simulation_job(job_id: str):
+    return _get_job(job_id).snapshot()
+
+@router.get(
+    "/jobs/{job_id}/result",
+    response_model=SimulationResult,
+    responses={200: {"content": {COLUMNAR_MEDIA_TYPE: {}, ARROW_MEDIA_TYPE: {}}}},
+)
+async def get_simulation_job_result(job_id: str):
+    job = _get_job(job_id)
+    if job.result is None:
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' is {job.snapshot().status}, it has no result")
+    return Response(content=job.result.body, media_type=job.result.media_type)
+
+@router.delete("/jobs/{job_id}", response_model=JobStatus)
+async def cancel_simulation_job(job_id: str):
+    _get_job(job_id)
+    return get_job_manager().cancel(job_id).snapshot()
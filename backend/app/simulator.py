@@ -1,25 +1,44 @@
 from __future__ import annotations
 
-from typing import List, Optional, Dict, Tuple
-from datetime import datetime
+from dataclasses import asdict
+from typing import Callable, Iterator, List, Optional, Dict, Tuple
+
+import numpy as np
 
 from .models import (
+    SimulationCheckpoint,
+    SimulationConfig,
     SimulationRequest,
     SimulationResult,
+    SimulationStreamRequest,
     SimulationSummary,
+    TimeGap,
+)
+from .store import ProfileRequest, resolve_profile_refs
+from .engine import (
+    DISPATCH_SERIES,
+    Dispatch,
+    Profiles,
+    SimulationState,
+    StepHours,
+    Totals,
+    _as_profile,
+    advance,
+    build_profiles,
+    build_result,
+    profiles_from_request,
+    summarize,
 )
+from .optimal import check_dispatch_mode, optimal_dispatch, run_dispatch
+from .timeaxis import TimeAxis, build_time_axis, regular_grid, regularize_series
+from .utils import format_timestamps
+
+# Available simulation engines. 'loop' is the original per-timestep reference.
+ENGINES = ("numpy", "loop")
 
-# Infer timestep in minutes from time array.
+# Infer the nominal timestep in minutes from the time array (the median spacing).
 def _infer_step_minutes(time: List[str]) -> int:
-    if len(time) < 2:
-        return 60
-    try:
-        t0 = datetime.fromisoformat(time[0].replace("Z", ""))
-        t1 = datetime.fromisoformat(time[1].replace("Z", ""))
-        dt = int(round((t1 - t0).total_seconds() / 60.0))
-        return max(dt, 1)
-    except Exception:
-        return 60
+    return build_time_axis(time, mode="uniform").step_minutes
 
 # Generate an array of zeros of length n.
 def _zeros(n: int) -> List[float]:
@@ -35,20 +54,187 @@ def _sum_other_gen(other: Optional[Dict[str, List[float]]], n: int) -> List[floa
             acc[i] += float(arr[i])
     return acc
 
-# Simulate microgrid operation based on input profiles and configuration. 
-# Should return detailed time series and summary statistics
-# TODO: Modularize further for readability and maintainability.
-def simulate_microgrid(req: SimulationRequest) -> SimulationResult:
+# Interpolate every series of a request onto the nominal step of its irregular time axis.
+def _regularize_request(req: ProfileRequest, axis: TimeAxis) -> Tuple[ProfileRequest, TimeAxis]:
+    grid = regular_grid(axis)
+    n = len(req.time)
+
+    def resample(values):
+        if values is None or len(values) == 0:
+            return values
+        return regularize_series(axis, grid, _as_profile(values, n))
+
+    update = {"time": format_timestamps(grid.view("datetime64[ns]")), "demand_kw": resample(req.demand_kw)}
+    gen = req.generation
+    if gen:
+        other = {name: resample(v) for name, v in gen.other.items()} if gen.other else gen.other
+        update["generation"] = gen.model_copy(update={"pv": resample(gen.pv), "wind": resample(gen.wind), "other": other})
+    step = axis.step_minutes
+    return req.model_copy(update=update), TimeAxis(step_minutes=step, dt_h=step / 60.0, epoch_ns=grid)
+
+# Build the time axis of a request's profiles for a config's step_minutes and time_mode.
+# With time_mode 'regularize' an irregular request is interpolated onto its nominal step
+# first. Returns (request, time axis).
+def request_time_axis(req: ProfileRequest, config: SimulationConfig) -> Tuple[ProfileRequest, TimeAxis]:
+    axis = build_time_axis(req.time, config.step_minutes, config.time_mode)
+    if config.time_mode == "regularize" and not axis.regular:
+        return _regularize_request(req, axis)
+    return req, axis
+
+# Validate a request and build its time axis (see request_time_axis).
+def _prepare_request(req: SimulationRequest) -> Tuple[SimulationRequest, TimeAxis]:
     n = len(req.time)
     if len(req.demand_kw) != n:
         raise ValueError("Length of demand_kw must match length of time")
+    if req.config.engine not in ENGINES:
+        raise ValueError(f"Unknown simulation engine '{req.config.engine}', expected one of {list(ENGINES)}")
+    check_dispatch_mode(req.config)
+    if req.config.dispatch_mode != "greedy" and req.config.engine != "numpy":
+        raise ValueError(f"dispatch_mode '{req.config.dispatch_mode}' requires the 'numpy' engine")
+    return request_time_axis(req, req.config)
+
+# Run the selected engine and return raw arrays: (time, profiles, dispatch, summary, time axis).
+# Used by the binary response encoders and the series reductions, which never need the
+# per-element Python lists. `time` is the request's time axis with profile IDs resolved
+# (or the regular grid when time_mode is 'regularize').
+def simulate_arrays(req: SimulationRequest) -> Tuple[List[str], Profiles, Dispatch, SimulationSummary, TimeAxis]:
+    req, axis = _prepare_request(resolve_profile_refs(req))
+    profiles = profiles_from_request(req)
+    if req.config.engine == "loop":
+        result = _simulate_loop(req, axis.dt_h)
+        disp = Dispatch(**{f: np.asarray(getattr(result, f), dtype=np.float64) for f in DISPATCH_SERIES})
+        return req.time, profiles, disp, result.summary, axis
+    disp = run_dispatch(profiles, axis.dt_h, req.config)
+    return req.time, profiles, disp, summarize(profiles, disp, axis.dt_h, req.config), axis
+
+# Running sums stored in a checkpoint (the step count is the checkpoint's next_index).
+_TOTAL_SERIES = tuple(name for name in Totals.__dataclass_fields__ if name not in ("steps", "lolp_steps"))
+
+# Restore the engine state from a checkpoint, or start a new run when there is none.
+def state_from_checkpoint(checkpoint: Optional[SimulationCheckpoint], key: str, req: SimulationRequest) -> SimulationState:
+    if checkpoint is None:
+        return SimulationState()
+    if checkpoint.request_key != key:
+        raise ValueError("Checkpoint does not belong to this request")
+    if checkpoint.next_index > len(req.time):
+        raise ValueError("Checkpoint next_index is beyond the end of the time series")
+    if set(checkpoint.totals) != set(_TOTAL_SERIES):
+        raise ValueError(f"Checkpoint totals must have exactly the keys {list(_TOTAL_SERIES)}")
+    if req.config.battery and checkpoint.next_index > 0 and checkpoint.battery_kwh is None:
+        raise ValueError("Checkpoint is missing battery_kwh")
+    totals = Totals(steps=checkpoint.next_index, lolp_steps=checkpoint.lolp_steps, **checkpoint.totals)
+    return SimulationState(next_index=checkpoint.next_index, battery_kwh=checkpoint.battery_kwh, totals=totals)
+
+# Snapshot the engine state so a run can be resumed later.
+def checkpoint_from_state(state: SimulationState, key: str) -> SimulationCheckpoint:
+    totals = asdict(state.totals)
+    return SimulationCheckpoint(
+        request_key=key,
+        next_index=state.next_index,
+        battery_kwh=state.battery_kwh,
+        lolp_steps=totals.pop("lolp_steps"),
+        totals={name: totals[name] for name in _TOTAL_SERIES},
+    )
 
-    step_min = req.config.step_minutes or _infer_step_minutes(req.time)
-    dt_h = step_min / 60.0
+# Resolve profile references, validate a streaming request and restore its state.
+# Returns (resolved request, state, step_minutes). Checkpoints count steps, so the
+# time axis must be regular (or regularized).
+def prepare_stream(req: SimulationStreamRequest, key: str) -> Tuple[SimulationStreamRequest, SimulationState, int]:
+    req, axis = _prepare_request(resolve_profile_refs(req))
+    if req.config.engine != "numpy":
+        raise ValueError("Streaming simulation requires the 'numpy' engine")
+    if req.config.dispatch_mode != "greedy":
+        raise ValueError("Streaming simulation requires dispatch_mode 'greedy'")
+    if not axis.regular:
+        raise ValueError("Streaming simulation needs a regular time axis; set config.time_mode to 'uniform' or 'regularize'")
+    return req, state_from_checkpoint(req.resume_from, key, req), axis.step_minutes
+
+# Inputs for timesteps [start, stop) as engine profiles. Inline lists and memory-mapped
+# profiles are sliced, so only one chunk of each series is converted at a time.
+def _profiles_slice(req: SimulationRequest, start: int, stop: int) -> Profiles:
+    gen = req.generation
+
+    def part(values):
+        return None if values is None else values[start:stop]
+
+    return build_profiles(
+        req.demand_kw[start:stop],
+        pv=part(gen.pv) if gen else None,
+        wind=part(gen.wind) if gen else None,
+        other={name: part(v) for name, v in gen.other.items()} if gen and gen.other else None,
+    )
+
+# Simulate a resolved request chunk by chunk on the vectorized engine, continuing from `state`.
+# Yields (start, time, profiles, dispatch) for each chunk. The state is advanced in place,
+# so after the last chunk summary_from_totals(state.totals, ...) gives the run's summary.
+def simulate_chunks(
+    req: SimulationRequest, state: SimulationState, chunk_size: int, dt_h: StepHours
+) -> Iterator[Tuple[int, List[str], Profiles, Dispatch]]:
+    n = len(req.time)
+    while state.next_index < n:
+        start = state.next_index
+        stop = min(n, start + chunk_size)
+        profiles = _profiles_slice(req, start, stop)
+        disp = advance(state, profiles, dt_h[start:stop] if np.ndim(dt_h) else dt_h, req.config)
+        yield start, req.time[start:stop], profiles, disp
+
+# Like simulate_arrays, but runs the vectorized engine in chunks of chunk_size steps and
+# calls progress(done, total) after each one; progress may raise to abort the run. The
+# chunks are joined before summarizing, so the result is identical to simulate_arrays.
+def simulate_arrays_chunked(
+    req: SimulationRequest, chunk_size: int, progress: Callable[[int, int], None]
+) -> Tuple[List[str], Profiles, Dispatch, SimulationSummary, TimeAxis]:
+    req = resolve_profile_refs(req)
+    if req.config.engine != "numpy" or len(req.time) == 0:
+        result = simulate_arrays(req)
+        progress(len(req.time), len(req.time))
+        return result
+    req, axis = _prepare_request(req)
+    if req.config.dispatch_mode == "optimal":
+        # Progress is reported per committed optimization window instead of per chunk.
+        profiles = profiles_from_request(req)
+        disp = optimal_dispatch(profiles, axis.dt_h, req.config, progress=progress)
+        return req.time, profiles, disp, summarize(profiles, disp, axis.dt_h, req.config), axis
+    n = len(req.time)
+    state = SimulationState()
+    parts = []
+    for _, _, profiles, disp in simulate_chunks(req, state, chunk_size, axis.dt_h):
+        parts.append((profiles, disp))
+        progress(state.next_index, n)
+    profiles = Profiles(**{f: np.concatenate([getattr(p, f) for p, _ in parts]) for f in Profiles.__dataclass_fields__})
+    disp = Dispatch(
+        **{f: np.concatenate([getattr(d, f) for _, d in parts]) for f in DISPATCH_SERIES},
+        battery_kwh_end=state.battery_kwh,
+    )
+    return req.time, profiles, disp, summarize(profiles, disp, axis.dt_h, req.config), axis
+
+# Simulate microgrid operation based on input profiles and configuration. 
+# Should return detailed time series and summary statistics
+def simulate_microgrid(req: SimulationRequest) -> SimulationResult:
+    req, axis = _prepare_request(resolve_profile_refs(req))
+
+    if req.config.engine == "loop":
+        result = _simulate_loop(req, axis.dt_h)
+    else:
+        profiles = profiles_from_request(req)
+        disp = run_dispatch(profiles, axis.dt_h, req.config)
+        result = build_result(req.time, profiles, disp, summarize(profiles, disp, axis.dt_h, req.config))
+    if not axis.regular:
+        result.gap_count = axis.gap_count
+        result.gaps = [TimeGap(**gap) for gap in axis.gaps]
+    return result
+
+# Reference per-timestep implementation of the simulation.
+# step_dt_h is the timestep in hours, or the duration of every step for an irregular axis.
+# TODO: Modularize further for readability and maintainability.
+def _simulate_loop(req: SimulationRequest, step_dt_h: StepHours) -> SimulationResult:
+    n = len(req.time)
+    step_dts = step_dt_h.tolist() if np.ndim(step_dt_h) else [step_dt_h] * n
 
     # Generation profiles aligned
-    pv = req.generation.pv if (req.generation and req.generation.pv) else _zeros(n)
-    wind = req.generation.wind if (req.generation and req.generation.wind) else _zeros(n)
+    # (length checks rather than truthiness so stored and decoded numpy arrays work too)
+    pv = req.generation.pv if (req.generation and req.generation.pv is not None and len(req.generation.pv)) else _zeros(n)
+    wind = req.generation.wind if (req.generation and req.generation.wind is not None and len(req.generation.wind)) else _zeros(n)
     other = _sum_other_gen(req.generation.other if req.generation else None, n)
     renew = [0.0] * n
     for i in range(n):
@@ -99,6 +285,7 @@ def simulate_microgrid(req: SimulationRequest) -> SimulationResult:
 
     # This needs modularization, looks awful
     for i in range(n):
+        dt_h = step_dts[i]
         demand = float(req.demand_kw[i])
         p_pv = float(pv[i] if i < len(pv) else 0.0)
         p_wind = float(wind[i] if i < len(wind) else 0.0)
@@ -253,8 +440,12 @@ def simulate_microgrid(req: SimulationRequest) -> SimulationResult:
         else:
             batt_soc_pct.append(0.0)
 
-    total_demand_kwh = sum(float(d) for d in req.demand_kw) * dt_h
-    lolp_pct = 100.0 * (sum(1 for p in unmet_kw if p > 1e-6) / n) if n > 0 else 0.0
+    if np.ndim(step_dt_h):
+        total_demand_kwh = sum(float(d) * dt for d, dt in zip(req.demand_kw, step_dts))
+        lolp_pct = 100.0 * (sum(dt for p, dt in zip(unmet_kw, step_dts) if p > 1e-6) / sum(step_dts)) if n > 0 else 0.0
+    else:
+        total_demand_kwh = sum(float(d) for d in req.demand_kw) * step_dt_h
+        lolp_pct = 100.0 * (sum(1 for p in unmet_kw if p > 1e-6) / n) if n > 0 else 0.0
     total_cost = cost_import - revenue_export + cost_generator
 
     # Build summary with all metrics
@@ -0,0 +1,246 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, TypeVar
+
+import numpy as np
+
+from .models import (
+    BatchSimulationRequest,
+    BatterySizingRequest,
+    MonteCarloRequest,
+    ReducedSimulationRequest,
+    SimulationRequest,
+)
+from .utils import format_timestamps
+
+# Where uploaded profiles are persisted and how much disk they may use.
+PROFILE_STORE_DIR = os.getenv("PROFILE_STORE_DIR", os.path.join(tempfile.gettempdir(), "microgrid-profiles"))
+PROFILE_STORE_MAX_BYTES = int(os.getenv("PROFILE_STORE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Number of memory maps kept open per process.
+_OPEN_MAPS = 64
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Requests whose time/demand/generation fields may hold profile IDs.
+ProfileRequest = TypeVar(
+    "ProfileRequest",
+    SimulationRequest,
+    BatchSimulationRequest,
+    BatterySizingRequest,
+    MonteCarloRequest,
+    ReducedSimulationRequest,
+)
+
+
+# Content-addressed store of 1-D arrays saved as .npy files and read back memory-mapped.
+# Profiles are keyed by a hash of their dtype and bytes, so identical uploads share one
+# file. Bundles of named arrays derived from profiles (such as analytics indexes) are kept
+# as .idx directories of .npy files under a caller-chosen key. Files and bundles are
+# evicted least-recently-used first (by mtime) once the directory grows beyond max_bytes.
+class ProfileStore:
+    def __init__(self, directory: str = PROFILE_STORE_DIR, max_bytes: int = PROFILE_STORE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._maps: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bundles: "OrderedDict[str, Dict[str, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.npy")
+
+    def _bundle_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.idx")
+
+    # Persist an array and return its profile ID.
+    def put(self, arr: np.ndarray) -> str:
+        arr = np.ascontiguousarray(arr)
+        if arr.ndim != 1:
+            raise ValueError("Only 1-D arrays can be stored as profiles")
+        digest = hashlib.sha256(arr.dtype.str.encode("ascii"))
+        digest.update(arr.view(np.uint8))
+        profile_id = digest.hexdigest()[:32]
+
+        path = self._path(profile_id)
+        if os.path.exists(path):
+            os.utime(path)
+            return profile_id
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, arr, allow_pickle=False)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._evict(keep=profile_id)
+        return profile_id
+
+    # Return a read-only memory map of a stored profile.
+    def get(self, profile_id: str) -> np.ndarray:
+        if not _ID_RE.match(profile_id):
+            raise ValueError(f"Invalid profile id '{profile_id}'")
+        with self._lock:
+            arr = self._maps.get(profile_id)
+            if arr is not None:
+                self._maps.move_to_end(profile_id)
+        path = self._path(profile_id)
+        if arr is None:
+            try:
+                arr = np.load(path, mmap_mode="r", allow_pickle=False)
+            except FileNotFoundError:
+                raise ValueError(f"Unknown profile id '{profile_id}'")
+            with self._lock:
+                self._maps[profile_id] = arr
+                while len(self._maps) > _OPEN_MAPS:
+                    self._maps.popitem(last=False)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted by another worker; the open map stays valid
+        return arr
+
+    # Persist named 1-D arrays as a bundle under a 32-hex-digit key. A bundle that already
+    # exists is kept as it is: bundles are derived data, identical for the same key.
+    def put_bundle(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        if not _ID_RE.match(key):
+            raise ValueError(f"Invalid bundle key '{key}'")
+        path = self._bundle_path(key)
+        if os.path.isdir(path):
+            os.utime(path)
+            return
+        tmp = tempfile.mkdtemp(dir=self.directory, suffix=".tmp")
+        try:
+            for name, arr in arrays.items():
+                np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arr), allow_pickle=False)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise  # otherwise another worker stored the same bundle first
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict(keep=key)
+
+    # Read-only memory maps of a stored bundle, or None when it is unknown or evicted.
+    def get_bundle(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        if not _ID_RE.match(key):
+            raise ValueError(f"Invalid bundle key '{key}'")
+        with self._lock:
+            arrays = self._bundles.get(key)
+            if arrays is not None:
+                self._bundles.move_to_end(key)
+        path = self._bundle_path(key)
+        if arrays is None:
+            try:
+                names = [name for name in os.listdir(path) if name.endswith(".npy")]
+                arrays = {
+                    name[:-4]: np.load(os.path.join(path, name), mmap_mode="r", allow_pickle=False) for name in names
+                }
+            except FileNotFoundError:
+                return None
+            with self._lock:
+                self._bundles[key] = arrays
+                while len(self._bundles) > _OPEN_MAPS:
+                    self._bundles.popitem(last=False)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted by another worker; the open maps stay valid
+        return arrays
+
+    # Drop least recently used files and bundles until the store fits in max_bytes.
+    def _evict(self, keep: Optional[str] = None) -> None:
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".npy"):
+                    st = entry.stat()
+                    size = st.st_size
+                elif entry.name.endswith(".idx") and entry.is_dir():
+                    st = entry.stat()
+                    with os.scandir(entry.path) as files:
+                        size = sum(f.stat().st_size for f in files)
+                else:
+                    continue
+                total += size
+                entries.append((st.st_mtime, entry.name[:-4], entry.path, size))
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, profile_id, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if profile_id == keep:
+                continue
+            if path.endswith(".idx"):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            with self._lock:
+                self._maps.pop(profile_id, None)
+                self._bundles.pop(profile_id, None)
+
+
+_store: Optional[ProfileStore] = None
+
+
+# Return the process-wide profile store, created on first use.
+def get_profile_store() -> ProfileStore:
+    global _store
+    if _store is None:
+        _store = ProfileStore()
+    return _store
+
+
+# Persist several arrays and return their profile IDs under the same keys.
+def store_profiles(arrays: Dict[str, np.ndarray]) -> Dict[str, str]:
+    store = get_profile_store()
+    return {name: store.put(arr) for name, arr in arrays.items()}
+
+
+# Load a referenced power profile as a float64 array (no copy for float64 profiles).
+def _load_power(value):
+    if not isinstance(value, str):
+        return value
+    arr = get_profile_store().get(value)
+    if arr.dtype.kind != "f":
+        raise ValueError(f"Profile '{value}' is not a power series")
+    return np.asarray(arr, dtype=np.float64)
+
+
+# Replace profile IDs in a simulation, batch, sizing or Monte Carlo request with the stored arrays.
+# Power series are handed to the engine as memory maps; a referenced time axis is
+# formatted back to strings because the result echoes it.
+def resolve_profile_refs(req: ProfileRequest) -> ProfileRequest:
+    update = {}
+    if isinstance(req.time, str):
+        ts = get_profile_store().get(req.time)
+        if ts.dtype.kind != "M":
+            raise ValueError(f"Profile '{req.time}' is not a time axis")
+        update["time"] = format_timestamps(ts)
+    if isinstance(req.demand_kw, str):
+        update["demand_kw"] = _load_power(req.demand_kw)
+    gen = req.generation
+    if gen is not None and (
+        isinstance(gen.pv, str)
+        or isinstance(gen.wind, str)
+        or any(isinstance(v, str) for v in (gen.other or {}).values())
+    ):
+        gen_update = {"pv": _load_power(gen.pv), "wind": _load_power(gen.wind)}
+        if gen.other:
+            gen_update["other"] = {name: _load_power(v) for name, v in gen.other.items()}
+        update["generation"] = gen.model_copy(update=gen_update)
+    return req.model_copy(update=update) if update else req
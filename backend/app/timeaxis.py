@@ -0,0 +1,115 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .utils import MAX_UPLOAD_ROWS, _find_gaps, _parse_timestamps, _resample
+
+# How a simulation treats its time axis (SimulationConfig.time_mode):
+#   auto       - every step lasts until the next timestamp when the axis is irregular;
+#                axes that are not strictly increasing timestamps are treated as uniform
+#   uniform    - every step lasts the nominal step (the behaviour before per-step durations)
+#   regularize - irregular inputs are interpolated onto the nominal step first
+TIME_MODES = ("auto", "uniform", "regularize")
+
+_NS_PER_MINUTE = 60_000_000_000
+_NS_PER_HOUR = 60 * _NS_PER_MINUTE
+
+
+# A parsed time axis. dt_h is a float when every step has the nominal length, otherwise
+# the duration of each step in hours (the last step is given the nominal length).
+@dataclass
+class TimeAxis:
+    step_minutes: int
+    dt_h: Union[float, np.ndarray]
+    epoch_ns: Optional[np.ndarray] = None  # not parsed when the step was given explicitly
+    gap_count: int = 0
+    gaps: List[dict] = field(default_factory=list)  # largest gaps, as in the upload alignment report
+
+    @property
+    def regular(self) -> bool:
+        return np.ndim(self.dt_h) == 0
+
+
+# True when an ISO 8601 timestamp carries a UTC offset ('Z', '+01:00', '-05:00').
+def _has_offset(text: str) -> bool:
+    tail = text[10:]
+    return tail.endswith("Z") or "+" in tail or "-" in tail
+
+
+# Parse timestamp strings into int64 epoch nanoseconds in one vectorized pass.
+# Naive ISO 8601 strings go through NumPy's parser; anything else (UTC offsets,
+# other layouts) falls back to pandas and is converted to UTC.
+def parse_epoch_ns(time: Sequence[str]) -> np.ndarray:
+    if len(time) == 0:
+        return np.empty(0, dtype=np.int64)
+    if not _has_offset(str(time[0])):
+        try:
+            ns = np.array(time, dtype="datetime64[ns]").view(np.int64)
+            if not np.any(ns == np.iinfo(np.int64).min):  # NaT
+                return ns
+        except (ValueError, TypeError):
+            pass
+    return _parse_timestamps(pd.Series(time, dtype="object")).view(np.int64)
+
+
+# Most common spacing of an epoch axis in whole minutes (60 for fewer than two samples).
+def nominal_step_minutes(epoch_ns: np.ndarray) -> int:
+    if epoch_ns.shape[0] < 2:
+        return 60
+    return max(1, int(round(float(np.median(np.diff(epoch_ns))) / _NS_PER_MINUTE)))
+
+
+# Build the time axis of a simulation. An explicit step_minutes keeps the uniform axis
+# without parsing the timestamps; otherwise they are parsed once. When some timestamps
+# cannot be parsed the step is inferred from the first two (hourly if those fail too),
+# as step inference always has, except when they are to be regularized.
+def build_time_axis(time: Sequence[str], step_minutes: Optional[int] = None, mode: str = "auto") -> TimeAxis:
+    if mode not in TIME_MODES:
+        raise ValueError(f"Unknown time_mode '{mode}', expected one of {list(TIME_MODES)}")
+    if step_minutes is not None:
+        return TimeAxis(step_minutes=step_minutes, dt_h=step_minutes / 60.0)
+
+    try:
+        ns = parse_epoch_ns(time)
+    except (ValueError, TypeError):
+        if mode == "regularize":
+            raise
+        try:
+            step = nominal_step_minutes(parse_epoch_ns(time[:2]))
+        except (ValueError, TypeError):
+            step = 60
+        return TimeAxis(step_minutes=step, dt_h=step / 60.0)
+    diffs = np.diff(ns)
+    bad = np.flatnonzero(diffs <= 0)
+    if bad.size and mode == "regularize":
+        i = int(bad[0]) + 1
+        raise ValueError(f"Timestamps must be strictly increasing to regularize (time[{i}] = '{time[i]}')")
+    step = nominal_step_minutes(ns)
+    step_ns = step * _NS_PER_MINUTE
+    if mode == "uniform" or bad.size or np.all(diffs == step_ns):
+        return TimeAxis(step_minutes=step, dt_h=step / 60.0, epoch_ns=ns)
+
+    dt_h = np.empty(ns.shape[0], dtype=np.float64)
+    np.divide(diffs, _NS_PER_HOUR, out=dt_h[:-1])
+    dt_h[-1] = step / 60.0
+    gap_count, gaps = _find_gaps(ns, float(step_ns))
+    return TimeAxis(step_minutes=step, dt_h=dt_h, epoch_ns=ns, gap_count=gap_count, gaps=gaps)
+
+
+# Grid of a regularized axis: from the first timestamp to the last at the nominal step.
+def regular_grid(axis: TimeAxis, max_points: int = MAX_UPLOAD_ROWS) -> np.ndarray:
+    step_ns = axis.step_minutes * _NS_PER_MINUTE
+    first, last = int(axis.epoch_ns[0]), int(axis.epoch_ns[-1])
+    m = (last - first) // step_ns + 1
+    if m > max_points:
+        raise ValueError(f"Regularized time axis would have {m} points, limit is {max_points}")
+    return first + step_ns * np.arange(m, dtype=np.int64)
+
+
+# Linearly interpolate a series sampled on an irregular axis onto regular_grid(axis).
+def regularize_series(axis: TimeAxis, grid: np.ndarray, values: Sequence[float]) -> np.ndarray:
+    step_ns = axis.step_minutes * _NS_PER_MINUTE
+    out, _ = _resample(axis.epoch_ns, np.asarray(values, dtype=np.float64), int(grid[0]), step_ns, grid.shape[0], "interpolate")
+    return out
@@ -1,30 +1,457 @@
+import asyncio
+import gzip
+import io
+import os
+import zipfile
+import numpy as np
 import pandas as pd
 from fastapi import UploadFile
-from typing import List, Dict
-import io
+from starlette.concurrency import run_in_threadpool
+from typing import BinaryIO, List, Dict, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, only needed for Parquet/Arrow uploads
+    pa = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, only needed for zstd-compressed uploads
+    zstandard = None
+
+# Upload limits, configurable through the environment.
+MAX_UPLOAD_ROWS = int(os.getenv("MAX_UPLOAD_ROWS", "5000000"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+
+# Rows parsed per chunk; bounds the temporary per-row Python objects held at once.
+CSV_CHUNK_ROWS = 50_000
+
+# Ways to map a profile onto the common time index of a multiple-file upload.
+RESAMPLE_METHODS = ("mean", "interpolate", "ffill")
+
+# Largest number of gaps listed per profile in the alignment report.
+MAX_REPORTED_GAPS = 100
+
+# Upload formats by filename suffix. Compressed CSV is decompressed as a stream; Parquet
+# and Arrow files need typed 'timestamp' and 'power' columns; a zip archive holds one
+# file of any other format per profile.
+UPLOAD_FORMATS = {
+    ".csv": "csv",
+    ".csv.gz": "csv.gz",
+    ".csv.zst": "csv.zst",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".zip": "zip",
+}
+
+_NS_PER_MINUTE = 60_000_000_000
+
+
+# Parse a chunk of timestamp strings into datetime64[ns] (naive, UTC for offset-aware input).
+def _parse_timestamps(values: pd.Series) -> np.ndarray:
+    try:
+        ts = pd.to_datetime(values, format="ISO8601")
+    except (ValueError, TypeError):
+        ts = pd.to_datetime(values)
+    if ts.dt.tz is not None:
+        ts = ts.dt.tz_convert("UTC").dt.tz_localize(None)
+    if ts.isna().any():
+        raise ValueError("Missing or invalid timestamp values")
+    return ts.to_numpy(dtype="datetime64[ns]")
+
+
+# Stream a 'timestamp,power' CSV from a binary file object into compact arrays.
+# Returns (timestamps as datetime64[ns], power as float64). The file is parsed in
+# chunks straight from bytes, so peak memory stays close to the size of the output arrays.
+def read_power_csv(
+    fileobj: BinaryIO,
+    max_rows: int = MAX_UPLOAD_ROWS,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    _check_size(fileobj, max_bytes)
+    return _read_csv_stream(fileobj, max_rows)
+
+
+# Raise when a seekable upload is larger than max_bytes; leaves it at the start.
+def _check_size(fileobj: BinaryIO, max_bytes: int) -> None:
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    if size > max_bytes:
+        raise ValueError(f"File is {size} bytes, limit is {max_bytes}")
+
+
+# Parse 'timestamp,power' CSV from a binary stream in chunks of CSV_CHUNK_ROWS rows.
+def _read_csv_stream(stream: BinaryIO, max_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    reader = pd.read_csv(
+        stream,
+        usecols=["timestamp", "power"],
+        dtype={"timestamp": "object", "power": "float64"},
+        chunksize=CSV_CHUNK_ROWS,
+        encoding="utf-8",
+    )
+    time_chunks: List[np.ndarray] = []
+    power_chunks: List[np.ndarray] = []
+    rows = 0
+    with reader:
+        for chunk in reader:
+            rows += len(chunk)
+            if rows > max_rows:
+                raise ValueError(f"File has more than {max_rows} rows")
+            time_chunks.append(_parse_timestamps(chunk["timestamp"]))
+            power_chunks.append(chunk["power"].to_numpy(dtype=np.float64, copy=True))
+
+    if not time_chunks:
+        return np.empty(0, dtype="datetime64[ns]"), np.empty(0, dtype=np.float64)
+    if len(time_chunks) == 1:
+        return time_chunks[0], power_chunks[0]
+    return np.concatenate(time_chunks), np.concatenate(power_chunks)
+
+
+# Raw stream that stops with an error once more than `limit` bytes have been read, so a
+# small compressed upload cannot expand without bound.
+class _LimitedReader(io.RawIOBase):
+    def __init__(self, raw: BinaryIO, limit: int):
+        self.raw = raw
+        self.limit = limit
+        self.total = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.raw.read(len(buffer))
+        n = len(data)
+        self.total += n
+        if self.total > self.limit:
+            raise ValueError(f"Decompressed file is larger than {self.limit} bytes")
+        buffer[:n] = data
+        return n
+
+
+# Upload format of a filename (a key of UPLOAD_FORMATS' values).
+def upload_format(filename: Optional[str]) -> str:
+    name = (filename or "").lower()
+    for suffix, fmt in sorted(UPLOAD_FORMATS.items(), key=lambda item: -len(item[0])):
+        if name.endswith(suffix):
+            return fmt
+    raise ValueError(
+        f"File {filename} must be a CSV (optionally .gz or .zst compressed), Parquet, Arrow or zip archive"
+    )
+
+
+# Profile name of an uploaded file: its base name without the format suffix.
+def profile_name(filename: str) -> str:
+    name = os.path.basename(filename.replace("\\", "/"))
+    lower = name.lower()
+    for suffix in sorted(UPLOAD_FORMATS, key=len, reverse=True):
+        if lower.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+# Decompress a gzip or zstd CSV as a stream and parse it like read_power_csv.
+# max_bytes bounds the decompressed size.
+def read_compressed_csv(
+    fileobj: BinaryIO,
+    fmt: str,
+    max_rows: int = MAX_UPLOAD_ROWS,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    _check_size(fileobj, max_bytes)
+    if fmt == "csv.gz":
+        raw = gzip.GzipFile(fileobj=fileobj, mode="rb")
+    elif zstandard is None:
+        raise ValueError("zstd-compressed uploads require the 'zstandard' package")
+    else:
+        raw = zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+    with raw:
+        return _read_csv_stream(io.BufferedReader(_LimitedReader(raw, max_bytes), 1 << 20), max_rows)
+
+
+# Timestamps of an Arrow column as datetime64[ns]: timestamp and date columns are cast
+# (offset-aware ones to naive UTC), string columns are parsed like CSV timestamps.
+def _arrow_timestamps(column) -> np.ndarray:
+    if column.null_count:
+        raise ValueError("Missing or invalid timestamp values")
+    if pa.types.is_timestamp(column.type) or pa.types.is_date(column.type):
+        return column.cast(pa.timestamp("ns")).to_numpy().astype("datetime64[ns]")
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        return _parse_timestamps(pd.Series(column.to_numpy(), dtype="object"))
+    raise ValueError(f"Column 'timestamp' must hold timestamps, not {column.type}")
+
+
+# Read the timestamp and power columns of a Parquet or Arrow IPC (file or stream) upload.
+def read_power_columnar(
+    fileobj: BinaryIO,
+    fmt: str,
+    max_rows: int = MAX_UPLOAD_ROWS,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    if pa is None:
+        raise ValueError("Parquet and Arrow uploads require the 'pyarrow' package")
+    _check_size(fileobj, max_bytes)
+    source = pa.PythonFile(fileobj, mode="r")
+    if fmt == "parquet":
+        parquet = pq.ParquetFile(source)
+        rows = parquet.metadata.num_rows
+        if rows > max_rows:
+            raise ValueError(f"File has more than {max_rows} rows")
+        table = parquet.read(columns=["timestamp", "power"])
+    else:
+        try:
+            reader = pa.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            fileobj.seek(0)
+            reader = pa.ipc.open_stream(pa.PythonFile(fileobj, mode="r"))
+            batches = iter(reader)
+        kept, rows = [], 0
+        for batch in batches:
+            rows += batch.num_rows
+            if rows > max_rows:
+                raise ValueError(f"File has more than {max_rows} rows")
+            kept.append(batch)
+        table = pa.Table.from_batches(kept, schema=reader.schema)
+    missing = [name for name in ("timestamp", "power") if name not in table.column_names]
+    if missing:
+        raise ValueError(f"Missing column(s) {missing}")
+    power = table.column("power")
+    if not (pa.types.is_floating(power.type) or pa.types.is_integer(power.type)):
+        raise ValueError(f"Column 'power' must be numeric, not {power.type}")
+    return (
+        _arrow_timestamps(table.column("timestamp")),
+        power.cast(pa.float64()).to_numpy().astype(np.float64, copy=False),
+    )
+
+
+# Parse one uploaded profile file of any non-archive format.
+def read_power_file(
+    fileobj: BinaryIO,
+    filename: str,
+    max_rows: int = MAX_UPLOAD_ROWS,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    fmt = upload_format(filename)
+    if fmt == "csv":
+        return read_power_csv(fileobj, max_rows, max_bytes)
+    if fmt in ("csv.gz", "csv.zst"):
+        return read_compressed_csv(fileobj, fmt, max_rows, max_bytes)
+    if fmt in ("parquet", "arrow"):
+        return read_power_columnar(fileobj, fmt, max_rows, max_bytes)
+    raise ValueError(f"File {filename} cannot be nested in an archive")
+
+
+# Parse every profile file of a zip archive, keyed by profile name. Members are read
+# straight from the archive, never extracted to disk; directories and hidden files are
+# skipped and each member is bounded by max_bytes uncompressed.
+def read_power_zip(
+    fileobj: BinaryIO,
+    max_rows: int = MAX_UPLOAD_ROWS,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    _check_size(fileobj, max_bytes)
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Invalid zip archive: {e}")
+    out: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    with archive:
+        for info in archive.infolist():
+            base = os.path.basename(info.filename)
+            if info.is_dir() or not base or base.startswith(".") or info.filename.startswith("__MACOSX/"):
+                continue
+            if info.file_size > max_bytes:
+                raise ValueError(f"{info.filename} is {info.file_size} bytes uncompressed, limit is {max_bytes}")
+            name = profile_name(info.filename)
+            if name in out:
+                raise ValueError(f"Archive holds more than one profile named '{name}'")
+            with archive.open(info) as member:
+                try:
+                    if upload_format(base) == "csv":
+                        out[name] = _read_csv_stream(io.BufferedReader(_LimitedReader(member, max_bytes), 1 << 20), max_rows)
+                    else:
+                        # Other readers seek (columnar footers, size checks); decompress the member into memory once.
+                        data = member.read(max_bytes + 1)
+                        if len(data) > max_bytes:
+                            raise ValueError(f"File is larger than {max_bytes} bytes")
+                        out[name] = read_power_file(io.BytesIO(data), base, max_rows, max_bytes)
+                except Exception as e:
+                    raise ValueError(f"{info.filename}: {e}")
+    if not out:
+        raise ValueError("Zip archive holds no profile files")
+    return out
+
+
+# Parse an upload into named profiles: one for a plain file, one per member for a zip archive.
+def read_power_upload(
+    fileobj: BinaryIO,
+    filename: str,
+    max_rows: int = MAX_UPLOAD_ROWS,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    if upload_format(filename) == "zip":
+        return read_power_zip(fileobj, max_rows, max_bytes)
+    return {profile_name(filename): read_power_file(fileobj, filename, max_rows, max_bytes)}
+
+
+# Format datetime64 timestamps as 'YYYY-MM-DD HH:MM:SS' strings for JSON responses.
+def format_timestamps(ts: np.ndarray) -> List[str]:
+    text = np.datetime_as_string(ts.astype("datetime64[s]"), unit="s")
+    if text.size:
+        # Swap the ISO 'T' separator for a space in place (character 10 of each fixed-width string).
+        text.view("<U1").reshape(text.size, -1)[:, 10] = " "
+    return text.tolist()
+
+
+# Format a single epoch-nanosecond value like format_timestamps.
+def _format_ns(ns: int) -> str:
+    return format_timestamps(np.array([ns], dtype="datetime64[ns]"))[0]
+
+
+# Sort samples and average repeated timestamps. Returns (epoch_ns, values, duplicates).
+def _sorted_unique(ts: np.ndarray, power: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int]:
+    ns = ts.astype("datetime64[ns]").view(np.int64)
+    if np.any(ns[1:] < ns[:-1]):
+        order = np.argsort(ns, kind="stable")
+        ns, power = ns[order], power[order]
+    if not np.any(ns[1:] == ns[:-1]):
+        return ns, power, 0
+    uniq, first, counts = np.unique(ns, return_index=True, return_counts=True)
+    return uniq, np.add.reduceat(power, first) / counts, int(ns.size - uniq.size)
+
+
+# Gaps larger than 1.5x the native step: (count, largest gaps in time order).
+def _find_gaps(ns: np.ndarray, native_ns: float) -> Tuple[int, List[dict]]:
+    diffs = np.diff(ns)
+    idx = np.flatnonzero(diffs > 1.5 * native_ns)
+    if idx.size > MAX_REPORTED_GAPS:
+        idx = np.sort(idx[np.argsort(diffs[idx], kind="stable")[::-1][:MAX_REPORTED_GAPS]])
+    gaps = [
+        {
+            "start": _format_ns(int(ns[i])),
+            "end": _format_ns(int(ns[i + 1])),
+            "missing_steps": int(round(diffs[i] / native_ns)) - 1,
+        }
+        for i in idx
+    ]
+    return int(np.count_nonzero(diffs > 1.5 * native_ns)), gaps
+
+
+# Map one sorted profile onto the regular grid g0 + k * step_ns (k < m).
+# Grid buckets outside the profile's covered range are 0.0; empty buckets inside are filled.
+# Returns (values, number of grid buckets without any source sample).
+def _resample(ns: np.ndarray, values: np.ndarray, g0: int, step_ns: int, m: int, method: str) -> Tuple[np.ndarray, int]:
+    bucket = (ns - g0) // step_ns
+    counts = np.bincount(bucket, minlength=m)
+    missing = int(np.count_nonzero(counts == 0))
+    lo, hi = int(bucket[0]), int(bucket[-1])
+    out = np.zeros(m, dtype=np.float64)
+    grid = g0 + step_ns * np.arange(lo, hi + 1, dtype=np.int64)
+
+    if method == "mean":
+        has = counts > 0
+        sums = np.bincount(bucket, weights=values, minlength=m)
+        out[has] = sums[has] / counts[has]
+        empty = np.flatnonzero(~has[lo:hi + 1]) + lo
+        if empty.size:
+            known = np.flatnonzero(has)
+            out[empty] = np.interp(empty, known, out[known])
+    elif method == "interpolate":
+        out[lo:hi + 1] = np.interp(grid, ns, values)
+    else:  # ffill
+        idx = np.searchsorted(ns, grid, side="right") - 1
+        out[lo:hi + 1] = values[np.maximum(idx, 0)]
+    return out, missing
+
+
+# Align several (timestamps, power) profiles onto one regular time index.
+# The index runs from the earliest to the latest sample at step_minutes (default: the
+# finest native step among the profiles). Everything is done with array operations.
+def align_profiles(
+    parsed: Dict[str, Tuple[np.ndarray, np.ndarray]],
+    step_minutes: Optional[int] = None,
+    method: str = "mean",
+    max_points: int = MAX_UPLOAD_ROWS,
+) -> dict:
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f"Unknown resample method '{method}', expected one of {list(RESAMPLE_METHODS)}")
+
+    series = {}
+    for name, (ts, power) in parsed.items():
+        if ts.size == 0:
+            raise ValueError(f"Profile '{name}' has no data rows")
+        ns, values, duplicates = _sorted_unique(ts, power)
+        native_ns = float(np.median(np.diff(ns))) if ns.size > 1 else float((step_minutes or 60) * _NS_PER_MINUTE)
+        series[name] = (ns, values, duplicates, native_ns)
+
+    if step_minutes is None:
+        finest = min(native_ns for _, _, _, native_ns in series.values())
+        step_minutes = max(1, int(round(finest / _NS_PER_MINUTE)))
+    step_ns = step_minutes * _NS_PER_MINUTE
+
+    first = min(int(ns[0]) for ns, _, _, _ in series.values())
+    last = max(int(ns[-1]) for ns, _, _, _ in series.values())
+    g0 = first - first % step_ns
+    m = (last - g0) // step_ns + 1
+    if m > max_points:
+        raise ValueError(f"Aligned time index would have {m} points, limit is {max_points}")
+
+    profiles: Dict[str, np.ndarray] = {}
+    report: Dict[str, dict] = {}
+    for name, (ns, values, duplicates, native_ns) in series.items():
+        profiles[name], missing = _resample(ns, values, g0, step_ns, m, method)
+        gap_count, gaps = _find_gaps(ns, native_ns)
+        report[name] = {
+            "start": _format_ns(int(ns[0])),
+            "end": _format_ns(int(ns[-1])),
+            "samples": int(ns.size),
+            "native_step_minutes": native_ns / _NS_PER_MINUTE,
+            "duplicates": duplicates,
+            "gap_count": gap_count,
+            "gaps": gaps,
+            "missing_points": missing,
+        }
+
+    overlap_start = max(int(ns[0]) for ns, _, _, _ in series.values())
+    overlap_end = min(int(ns[-1]) for ns, _, _, _ in series.values())
+    has_overlap = overlap_start <= overlap_end
+    return {
+        "time": (g0 + step_ns * np.arange(m, dtype=np.int64)).view("datetime64[ns]"),
+        "profiles": profiles,
+        "alignment": {
+            "step_minutes": step_minutes,
+            "method": method,
+            "overlap_start": _format_ns(overlap_start) if has_overlap else None,
+            "overlap_end": _format_ns(overlap_end) if has_overlap else None,
+            "profiles": report,
+        },
+    }
+
 
 async def process_csv_file(file: UploadFile) -> dict:
     """
     Process the uploaded CSV file and return time and power data.
-    
+
     Expected CSV format:
     timestamp,power
     2023-10-09 00:00:00,100.5
     2023-10-09 00:15:00,95.2
     ...
+
+    The file may also be gzip/zstd-compressed CSV, Parquet, Arrow or a zip archive
+    holding a single profile (see UPLOAD_FORMATS).
+
+    Returns compact arrays: time as datetime64[ns] and power as float64.
     """
     try:
-        # Read the file content
-        content = await file.read()
-        
-        # Convert to pandas DataFrame
-        df = pd.read_csv(io.StringIO(content.decode('utf-8')))
-        
-        # Assuming the CSV has 'timestamp' and 'power' columns
-        # Adjust column names based on your actual CSV structure
-        time_data = df['timestamp'].tolist()
-        power_data = df['power'].tolist()
-        
+        parsed = await run_in_threadpool(read_power_upload, file.file, file.filename)
+        if len(parsed) != 1:
+            raise ValueError(f"Archive holds {len(parsed)} profiles, upload it to /upload-multiple")
+        time_data, power_data = next(iter(parsed.values()))
         return {
             "time": time_data,
             "power": power_data
@@ -32,45 +459,48 @@ async def process_csv_file(file: UploadFile) -> dict:
     except Exception as e:
         raise Exception(f"Error processing CSV file: {str(e)}")
 
-async def process_multiple_csv_files(files: List[UploadFile]) -> dict:
+async def process_multiple_csv_files(
+    files: List[UploadFile],
+    step_minutes: Optional[int] = None,
+    method: str = "mean",
+) -> dict:
     """
     Process multiple uploaded CSV files and return combined data.
-    
+
     Expected CSV format for each file:
     timestamp,power
     2023-10-09 00:00:00,100.5
     2023-10-09 00:15:00,95.2
     ...
-    
+
+    Each file may also be gzip/zstd-compressed CSV, Parquet, Arrow or a zip archive
+    whose members each become a profile (see UPLOAD_FORMATS).
+
+    Files are parsed concurrently in the thread pool, then aligned onto a common
+    regular time index (see align_profiles) using the given resample method.
+
     Returns a dictionary with:
-    - time: list of timestamps (from the first file, assuming all files use the same timeline)
-    - profiles: dict mapping filename to power data list
+    - time: datetime64[ns] common time index
+    - profiles: dict mapping filename to float64 power array on that index
+    - alignment: per-profile coverage, gaps and duplicates
     """
     try:
-        profiles: Dict[str, List[float]] = {}
-        time_data: List[str] = []
-        
-        for idx, file in enumerate(files):
-            # Read the file content
-            content = await file.read()
-            
-            # Convert to pandas DataFrame
-            df = pd.read_csv(io.StringIO(content.decode('utf-8')))
-            
-            # Get filename without extension for profile identification
-            filename = file.filename.replace('.csv', '') if file.filename else f"profile_{idx}"
-            
-            # Assuming the CSV has 'timestamp' and 'power' columns
-            if idx == 0:
-                # Use the first file's timestamps as the reference
-                time_data = df['timestamp'].tolist()
-            
-            # Store power data with filename as key
-            profiles[filename] = df['power'].tolist()
-        
-        return {
-            "time": time_data,
-            "profiles": profiles
-        }
+        if method not in RESAMPLE_METHODS:
+            raise ValueError(f"Unknown resample method '{method}', expected one of {list(RESAMPLE_METHODS)}")
+
+        parsed = await asyncio.gather(
+            *(run_in_threadpool(read_power_upload, file.file, file.filename or "") for file in files)
+        )
+
+        named: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for idx, profiles in enumerate(parsed):
+            for name, data in profiles.items():
+                # Profiles are identified by filename without extension
+                name = name or f"profile_{idx}"
+                if name in named:
+                    raise ValueError(f"More than one profile named '{name}'")
+                named[name] = data
+
+        return await run_in_threadpool(align_profiles, named, step_minutes, method)
     except Exception as e:
-        raise Exception(f"Error processing CSV files: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error processing CSV files: {str(e)}")
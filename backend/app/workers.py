@@ -0,0 +1,93 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+# Work (timesteps simulated) above this runs in the process pool instead of on the event loop.
+SIM_INLINE_MAX_POINTS = int(os.getenv("SIM_INLINE_MAX_POINTS", "10000"))
+
+# Shared process pool for CPU-bound simulation work, created on first use.
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+# Number of worker processes, configurable through SIM_WORKERS.
+def max_workers() -> int:
+    try:
+        return max(1, int(os.getenv("SIM_WORKERS", "")))
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+# Most tasks (queued plus running) the pool accepts before callers are turned away.
+def max_pending() -> int:
+    try:
+        return max(1, int(os.getenv("SIM_MAX_PENDING", "")))
+    except ValueError:
+        return 4 * max_workers()
+
+
+# Raised when the process pool already has max_pending() tasks.
+class PoolBusy(Exception):
+    pass
+
+
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+# Free a pool slot. Runs when the task's future completes, not when its caller stops
+# waiting, so a cancelled caller keeps the slot until the worker is actually done.
+def _release_slot(_: Future) -> None:
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+# Return the shared process pool, creating it if needed.
+def get_process_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max_workers())
+    return _pool
+
+
+# Shut down the shared process pool (called on application shutdown).
+def shutdown_process_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# Number of tasks currently queued or running in the pool.
+def pending_tasks() -> int:
+    return _pending
+
+
+# Run fn(*args) in the process pool without blocking the event loop.
+# Raises PoolBusy instead of queueing when max_pending() tasks are already in the pool.
+# A task counts against max_pending() until it finishes in the pool, even if the caller
+# is cancelled while it runs (only tasks that have not started are cancelled with it).
+# A pool whose worker died is replaced so later calls get a fresh one.
+async def run_in_pool(fn: Callable[..., Any], *args: Any) -> Any:
+    global _pending, _pool
+    with _pending_lock:
+        if _pending >= max_pending():
+            raise PoolBusy(f"Simulation pool is busy ({_pending} tasks pending), retry later")
+        _pending += 1
+    pool = get_process_pool()
+    try:
+        try:
+            future = pool.submit(fn, *args)
+        except BaseException:
+            _release_slot(None)
+            raise
+        future.add_done_callback(_release_slot)
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        if _pool is pool:
+            _pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise RuntimeError("A simulation worker process died")
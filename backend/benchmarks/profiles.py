@@ -0,0 +1,87 @@
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+# Nameplate sizes of the synthetic site, in kW.
+DEMAND_PEAK_KW = 80.0
+PV_CAPACITY_KW = 100.0
+WIND_CAPACITY_KW = 60.0
+
+
+# Moving average of white noise: cheap, vectorized, smoothly varying noise in roughly [-1, 1].
+def _smooth_noise(rng: np.random.Generator, n: int, window: int) -> np.ndarray:
+    window = max(1, min(window, n))
+    noise = rng.standard_normal(n + window - 1)
+    smooth = np.convolve(noise, np.ones(window) / window, mode="valid")
+    scale = float(np.abs(smooth).max()) or 1.0
+    return smooth / scale
+
+
+# Generate a synthetic site: time axis plus demand, PV and wind power (kW).
+# Demand has daily morning/evening peaks, a weekend dip, seasonal heating load and noise;
+# PV follows the sun with seasonal day length and passing clouds; wind follows a cubic
+# power curve of a slowly varying wind speed. The same seed always gives the same profiles.
+def generate_profiles(
+    days: float = 365,
+    step_minutes: int = 15,
+    seed: int = 0,
+    start: str = "2023-01-01T00:00:00",
+) -> Dict[str, np.ndarray]:
+    n = int(round(days * 24 * 60 / step_minutes))
+    rng = np.random.default_rng(seed)
+    time = np.datetime64(start, "ns") + np.arange(n, dtype=np.int64) * np.timedelta64(step_minutes, "m")
+
+    hours = np.arange(n, dtype=np.float64) * (step_minutes / 60.0)
+    hour_of_day = hours % 24.0
+    day_of_year = (hours / 24.0) % 365.0
+    season = np.cos(2 * np.pi * (day_of_year - 172) / 365.0)  # +1 at midsummer, -1 at midwinter
+    weekday = ((hours // 24.0) + 6) % 7  # 2023-01-01 is a Sunday
+    steps_per_hour = max(1, 60 // step_minutes)
+
+    morning = np.exp(-0.5 * ((hour_of_day - 8.0) / 1.5) ** 2)
+    evening = np.exp(-0.5 * ((hour_of_day - 19.0) / 2.0) ** 2)
+    demand = 0.35 + 0.3 * morning + 0.45 * evening
+    demand *= np.where(weekday >= 5, 0.85, 1.0)
+    demand *= 1.0 - 0.15 * season
+    demand *= 1.0 + 0.1 * _smooth_noise(rng, n, steps_per_hour)
+    demand = DEMAND_PEAK_KW * np.clip(demand, 0.05, None) / 1.3
+
+    day_length = 12.0 + 4.0 * season
+    solar = np.clip(np.sin(np.pi * (hour_of_day - (12.0 - day_length / 2)) / day_length), 0.0, None)
+    solar[np.abs(hour_of_day - 12.0) > day_length / 2] = 0.0
+    clouds = np.clip(0.75 + 0.4 * _smooth_noise(rng, n, 3 * steps_per_hour), 0.1, 1.0)
+    pv = PV_CAPACITY_KW * solar * (0.8 + 0.2 * season) * clouds
+
+    speed = np.clip(7.0 - 1.5 * season + 5.0 * _smooth_noise(rng, n, 12 * steps_per_hour), 0.0, None)
+    power_curve = np.clip((speed - 3.0) / (12.0 - 3.0), 0.0, 1.0) ** 3
+    wind = WIND_CAPACITY_KW * np.where(speed > 25.0, 0.0, power_curve)
+
+    return {"time": time, "demand": demand, "pv": pv, "wind": wind}
+
+
+# Format a datetime64 time axis as the 'YYYY-MM-DD HH:MM:SS' strings the API uses.
+def time_strings(time: np.ndarray) -> list:
+    text = np.datetime_as_string(time.astype("datetime64[s]"), unit="s")
+    return np.char.replace(text, "T", " ").tolist()
+
+
+# Write one profile as a 'timestamp,power' CSV like the upload endpoints expect.
+def write_power_csv(path: str, time: np.ndarray, power: np.ndarray) -> int:
+    stamps = np.char.replace(np.datetime_as_string(time.astype("datetime64[s]"), unit="s"), "T", " ")
+    lines = np.char.add(np.char.add(stamps, ","), np.char.mod("%.3f", power))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("timestamp,power\n")
+        f.write("\n".join(lines.tolist()))
+        f.write("\n")
+    return os.path.getsize(path)
+
+
+# JSON body of a /simulate request for generated profiles.
+def simulation_body(profiles: Dict[str, np.ndarray], config: Optional[dict] = None) -> dict:
+    return {
+        "time": time_strings(profiles["time"]),
+        "demand_kw": profiles["demand"].tolist(),
+        "generation": {"pv": profiles["pv"].tolist(), "wind": profiles["wind"].tolist()},
+        "config": config or {},
+    }
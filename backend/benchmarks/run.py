@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Benchmark the backend hot paths on synthetic profiles.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --days 365 --step-minutes 1 --output bench.json
+    python -m benchmarks.run --compare bench.json
+
+Groups:
+- simulate: simulate_microgrid over several battery/generator/grid configurations
+- csv:      process_csv_file and process_multiple_csv_files on generated CSV files, plus
+            gzip-compressed CSV and (with pyarrow) Parquet uploads
+- api:      POST /api/v1/simulate through the ASGI app in-process (request validation,
+            simulation and response serialization), in JSON and columnar form
+
+Results are written as JSON: run metadata plus one record per case with the raw
+timings and their min/median/mean/max. --compare prints the median ratio against a
+previous results file and exits with status 1 when a case is slower than --tolerance.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Benchmarks measure the work itself, not the result cache.
+os.environ.setdefault("RESULT_CACHE_BACKEND", "off")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from starlette.datastructures import UploadFile  # noqa: E402
+
+from app.models import SimulationRequest  # noqa: E402
+from app.simulator import simulate_microgrid  # noqa: E402
+from app.utils import pa, process_csv_file, process_multiple_csv_files  # noqa: E402
+from benchmarks.profiles import generate_profiles, simulation_body, write_power_csv  # noqa: E402
+
+GROUPS = ("simulate", "csv", "api")
+
+_BATTERY = {"capacity_kwh": 200.0, "charge_power_kw": 50.0, "discharge_power_kw": 50.0}
+_GENERATOR = {"max_power_kw": 40.0, "min_loading_pct": 0.3, "variable_cost_per_kwh": 0.3, "co2_kg_per_kwh": 0.7}
+
+# Simulation configurations covering the main dispatch branches.
+CONFIGS: Dict[str, dict] = {
+    "grid_only": {},
+    "battery": {"battery": _BATTERY},
+    "battery_generator_after_gen": {
+        "battery": _BATTERY,
+        "generator": _GENERATOR,
+        "grid": {"priority": "after_gen", "import_limit_kw": 30.0, "export_limit_kw": 20.0},
+    },
+    "battery_generator_before_gen": {
+        "battery": _BATTERY,
+        "generator": _GENERATOR,
+        "grid": {"priority": "before_gen", "import_limit_kw": 30.0, "export_limit_kw": 20.0},
+    },
+    "islanded": {"battery": _BATTERY, "generator": _GENERATOR, "grid": None},
+}
+
+
+# Time fn `repeat` times after `warmup` untimed calls; returns the timings in seconds.
+def _time(fn: Callable[[], object], repeat: int, warmup: int) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+# One result record with summary statistics of the timings.
+def _record(group: str, name: str, points: int, timings: List[float], **extra) -> dict:
+    median = statistics.median(timings)
+    return {
+        "group": group,
+        "name": f"{group}/{name}",
+        "points": points,
+        "repeat": len(timings),
+        "times_s": timings,
+        "min_s": min(timings),
+        "median_s": median,
+        "mean_s": statistics.fmean(timings),
+        "max_s": max(timings),
+        "points_per_s": points / median if median > 0 else None,
+        **extra,
+    }
+
+
+def bench_simulate(profiles: Dict[str, np.ndarray], engines: List[str], repeat: int, warmup: int) -> List[dict]:
+    results = []
+    body = simulation_body(profiles)
+    n = len(body["time"])
+    for config_name, config in CONFIGS.items():
+        for engine in engines:
+            req = SimulationRequest.model_validate({**body, "config": {**config, "engine": engine}})
+            timings = _time(lambda: simulate_microgrid(req), repeat, warmup)
+            results.append(_record("simulate", f"{config_name}/{engine}", n, timings, engine=engine, config=config_name))
+    return results
+
+
+def bench_csv(profiles: Dict[str, np.ndarray], repeat: int, warmup: int) -> List[dict]:
+    results = []
+    n = profiles["time"].shape[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        sizes = {}
+        for name in ("demand", "pv", "wind"):
+            paths[name] = os.path.join(tmp, f"{name}.csv")
+            sizes[name] = write_power_csv(paths[name], profiles["time"], profiles[name])
+
+        paths["demand.csv.gz"] = os.path.join(tmp, "demand.csv.gz")
+        with open(paths["demand"], "rb") as src, gzip.open(paths["demand.csv.gz"], "wb") as dst:
+            dst.write(src.read())
+        sizes["demand.csv.gz"] = os.path.getsize(paths["demand.csv.gz"])
+        if pa is not None:
+            import pyarrow.parquet as pq
+
+            paths["demand.parquet"] = os.path.join(tmp, "demand.parquet")
+            table = pa.table({"timestamp": profiles["time"].astype("datetime64[ns]"), "power": profiles["demand"]})
+            pq.write_table(table, paths["demand.parquet"])
+            sizes["demand.parquet"] = os.path.getsize(paths["demand.parquet"])
+
+        def upload(key: str, filename: str):
+            def run():
+                with open(paths[key], "rb") as f:
+                    return asyncio.run(process_csv_file(UploadFile(file=f, filename=filename)))
+
+            return run
+
+        single = upload("demand", "demand.csv")
+
+        def multiple():
+            names = ("demand", "pv", "wind")
+            handles = [open(paths[name], "rb") for name in names]
+            try:
+                files = [UploadFile(file=f, filename=f"{name}.csv") for name, f in zip(names, handles)]
+                return asyncio.run(process_multiple_csv_files(files))
+            finally:
+                for f in handles:
+                    f.close()
+
+        results.append(_record("csv", "process_csv_file", n, _time(single, repeat, warmup), bytes=sizes["demand"]))
+        for filename in ("demand.csv.gz", "demand.parquet"):
+            if filename in paths:
+                fmt = filename.split(".", 1)[1]
+                timings = _time(upload(filename, filename), repeat, warmup)
+                results.append(_record("csv", f"process_csv_file/{fmt}", n, timings, bytes=sizes[filename]))
+        results.append(
+            _record("csv", "process_multiple_csv_files", 3 * n, _time(multiple, repeat, warmup), bytes=sum(sizes.values()))
+        )
+    return results
+
+
+# POST a body to the ASGI app in-process. Returns (status, response body).
+async def _asgi_post(app, path: str, body: bytes, headers: List[Tuple[bytes, bytes]]) -> Tuple[int, bytes]:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("ascii"))] + headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 80),
+    }
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # the client never disconnects
+
+    status = 0
+    chunks = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def bench_api(profiles: Dict[str, np.ndarray], repeat: int, warmup: int) -> List[dict]:
+    from main import app
+
+    results = []
+    body = simulation_body(profiles, CONFIGS["battery_generator_after_gen"])
+    n = len(body["time"])
+    payload = json.dumps(body).encode("utf-8")
+    for name, accept in (("json", b"application/json"), ("columnar", b"application/x-microgrid-columnar")):
+        response = {}
+
+        def post():
+            status, content = asyncio.run(_asgi_post(app, "/api/v1/simulate", payload, [(b"accept", accept)]))
+            if status != 200:
+                raise RuntimeError(f"/simulate returned {status}: {content[:200]!r}")
+            response["bytes"] = len(content)
+
+        timings = _time(post, repeat, warmup)
+        results.append(
+            _record("api", f"simulate/{name}", n, timings, request_bytes=len(payload), response_bytes=response["bytes"])
+        )
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _metadata(args: argparse.Namespace, points: int) -> dict:
+    import fastapi
+    import pydantic
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": {
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "fastapi": fastapi.__version__,
+            "pydantic": pydantic.__version__,
+        },
+        "params": {
+            "days": args.days,
+            "step_minutes": args.step_minutes,
+            "points": points,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "groups": args.groups,
+            "engines": args.engines,
+        },
+    }
+
+
+# Compare median timings with a previous run. Returns the names of regressed cases.
+def compare(results: List[dict], baseline: dict, tolerance: float) -> List[str]:
+    previous = {r["name"]: r for r in baseline.get("results", [])}
+    regressed = []
+    print(f"{'case':<55} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for r in results:
+        base = previous.get(r["name"])
+        if base is None or base.get("points") != r["points"]:
+            continue
+        ratio = r["median_s"] / base["median_s"] if base["median_s"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1.0 + tolerance:
+            regressed.append(r["name"])
+            flag = "  REGRESSION"
+        print(f"{r['name']:<55} {base['median_s']:>10.4f} {r['median_s']:>10.4f} {ratio:>7.2f}{flag}")
+    return regressed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the microgrid backend on synthetic profiles")
+    parser.add_argument("--days", type=float, default=365, help="Length of the generated profiles in days")
+    parser.add_argument("--step-minutes", type=int, default=15, help="Resolution of the generated profiles")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per case")
+    parser.add_argument("--groups", default=",".join(GROUPS), help=f"Comma-separated subset of {','.join(GROUPS)}")
+    parser.add_argument("--engines", default="numpy", help="Comma-separated simulation engines: numpy,loop")
+    parser.add_argument("--output", help="Write the results JSON to this file (default: stdout)")
+    parser.add_argument("--compare", help="Previous results JSON to compare median timings against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a case is flagged (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    args.groups = [g for g in args.groups.split(",") if g]
+    args.engines = [e for e in args.engines.split(",") if e]
+    unknown = set(args.groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"Unknown groups: {sorted(unknown)}")
+
+    profiles = generate_profiles(days=args.days, step_minutes=args.step_minutes, seed=args.seed)
+    points = int(profiles["time"].shape[0])
+    results: List[dict] = []
+    if "simulate" in args.groups:
+        results += bench_simulate(profiles, args.engines, args.repeat, args.warmup)
+    if "csv" in args.groups:
+        results += bench_csv(profiles, args.repeat, args.warmup)
+    if "api" in args.groups:
+        results += bench_api(profiles, args.repeat, args.warmup)
+
+    for r in results:
+        print(f"{r['name']:<55} median {r['median_s']:.4f}s  min {r['min_s']:.4f}s", file=sys.stderr)
+
+    report = {"meta": _metadata(args, points), "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    elif not args.compare:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,18 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
 from app.routes import router
+from app.workers import shutdown_process_pool
+from app.metrics import MetricsMiddleware, PROMETHEUS_MEDIA_TYPE, render_metrics
+from app.encoding import orjson
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Power Profile API")
+# orjson (optional) renders JSON responses faster than the standard library
+app = FastAPI(title="Power Profile API", default_response_class=ORJSONResponse if orjson is not None else JSONResponse)
 
 # Include routes
 app.include_router(router, prefix="/api/v1")
@@ -31,6 +36,17 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Per-route latency, stage timings and payload sizes, exposed on /metrics
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("shutdown")
+def shutdown():
+    shutdown_process_pool()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_MEDIA_TYPE)
+
 @app.get("/")
 async def root():
     return {"message": "Power Profile API is running"}
\ No newline at end of file
@@ -29,6 +29,9 @@ const PROFILE_TYPES = [
   { value: 'other', label: 'Otro' },
 ];
 
+// Upload formats accepted by the backend (see UPLOAD_FORMATS in backend/app/utils.py).
+const UPLOAD_EXTENSIONS = ['.csv', '.csv.gz', '.csv.zst', '.parquet', '.arrow', '.feather', '.zip'];
+
 export default function UploadProfilesPage() {
   const [files, setFiles] = useState<FileUpload[]>([]);
   const [isUploading, setIsUploading] = useState(false);
@@ -46,9 +49,11 @@ export default function UploadProfilesPage() {
     }));
 
     // Validate file types
-    const invalidFiles = newFiles.filter(f => !f.file.name.endsWith('.csv'));
+    const invalidFiles = newFiles.filter(
+      f => !UPLOAD_EXTENSIONS.some(ext => f.file.name.toLowerCase().endsWith(ext))
+    );
     if (invalidFiles.length > 0) {
-      setError(`Los siguientes archivos no son CSV válidos: ${invalidFiles.map(f => f.file.name).join(', ')}`);
+      setError(`Los siguientes archivos no tienen un formato válido (${UPLOAD_EXTENSIONS.join(', ')}): ${invalidFiles.map(f => f.file.name).join(', ')}`);
       return;
     }
 
@@ -167,13 +172,13 @@ export default function UploadProfilesPage() {
                     Haz clic para seleccionar archivos o arrástralos aquí
                   </p>
                   <p className="text-xs text-muted-foreground">
-                    CSV hasta 10MB cada uno (puedes seleccionar múltiples)
+                    CSV (también .gz/.zst), Parquet, Arrow o ZIP hasta 10MB cada uno (puedes seleccionar múltiples)
                   </p>
                 </div>
                 <Input
                   id="file-upload"
                   type="file"
-                  accept=".csv"
+                  accept={UPLOAD_EXTENSIONS.join(',')}
                   multiple
                   onChange={handleFileSelect}
                   className="hidden"